@@ -0,0 +1,17 @@
+"""
+Gunicorn settings for serving the site over ASGI with uvicorn workers:
+
+    gunicorn -c project/gunicorn_asgi.py project.asgi:application
+
+To use this on Heroku, change the Procfile's web process to the command
+above.
+"""
+import multiprocessing
+import os
+
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = int(
+    os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+
+# Gunicorn binds to $PORT by default, which is what Heroku expects.
+raw_env = ["ASYNC_VIEWS=True"]
@@ -59,6 +59,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "recipes.metrics.MetricsMiddleware",
     "debug_toolbar.middleware.DebugToolbarMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -73,7 +74,9 @@ ROOT_URLCONF = "project.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # The standard Django backend, with render times recorded for
+        # recipes.metrics.MetricsMiddleware.
+        "BACKEND": "recipes.metrics.TimedDjangoTemplates",
         "DIRS": [BASE_DIR / "templates"],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -94,6 +97,41 @@ WSGI_APPLICATION = "project.wsgi.application"
 
 DATABASES = {"default": env.db()}
 
+# Caches
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+#
+# Set CACHE_URL / RECIPE_FRAGMENT_CACHE_URL to e.g. "filecache:///var/tmp/cache"
+# or "rediscache://localhost:6379/1" to use a different backend.
+
+CACHES = {
+    "default":
+    env.cache("CACHE_URL", default="locmemcache://"),
+    "recipe_fragments":
+    env.cache("RECIPE_FRAGMENT_CACHE_URL",
+              default="locmemcache://recipe-fragments"),
+}
+
+RECIPE_FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+# Serve the busiest JSON endpoints from recipes.async_views. Only turn this
+# on when running under ASGI (see project/gunicorn_asgi.py); under WSGI each
+# async view would need its own event loop.
+ASYNC_VIEWS = env.bool("ASYNC_VIEWS", default=False)
+
+# The debug toolbar's middleware can only run synchronously, and a single
+# such middleware makes Django run every async view in a thread, so the ASGI
+# profile leaves the toolbar out (recipes/checks.py warns about any other
+# sync-only middleware).
+if ASYNC_VIEWS:
+    INSTALLED_APPS.remove("debug_toolbar")
+    MIDDLEWARE.remove("debug_toolbar.middleware.DebugToolbarMiddleware")
+
+# Request metrics (see recipes.metrics). Queries slower than the threshold
+# are logged with the view that ran them. Set METRICS_TOKEN to require
+# "Authorization: Bearer <token>" on /metrics.
+SLOW_QUERY_THRESHOLD_MS = env.float("SLOW_QUERY_THRESHOLD_MS", default=100)
+METRICS_TOKEN = env("METRICS_TOKEN", default="")
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -169,4 +207,11 @@ if env("USE_EMAIL"):
 
 # Configure Django App for Heroku.
 django_heroku.settings(locals())
+# django_heroku adds WhiteNoise's middleware, which can only run
+# synchronously; use the subclass that can also run async.
+MIDDLEWARE = [
+    "recipes.middleware.WhiteNoiseMiddleware"
+    if path == "whitenoise.middleware.WhiteNoiseMiddleware" else path
+    for path in MIDDLEWARE
+]
 del DATABASES["default"]["OPTIONS"]["sslmode"]
@@ -17,16 +17,30 @@ from django.contrib import admin
 from django.conf import settings
 from django.urls import include, path
 
-from recipes import views as recipes_views
+from recipes import metrics, views as recipes_views
+
+if settings.ASYNC_VIEWS:
+    from recipes import async_views as json_views
+else:
+    json_views = recipes_views
 
 urlpatterns = [
     path("", recipes_views.homepage, name="homepage"),
-    path("recipes/", recipes_views.recipe_list, name="recipe_list"),
+    path("recipes/", json_views.recipe_list, name="recipe_list"),
+    path("recipes/export/",
+         recipes_views.export_recipes,
+         name="export_recipes"),
+    path("recipes/search/",
+         recipes_views.search_recipes,
+         name="search_recipes"),
     path(
         "recipes/<int:recipe_pk>/",
         recipes_views.recipe_detail,
         name="recipe_detail",
     ),
+    path("recipes/<int:recipe_pk>/forks/",
+         recipes_views.recipe_forks,
+         name="recipe_forks"),
     path("recipes/<int:recipe_pk>/edit/",
          recipes_views.edit_recipe,
          name="edit_recipe"),
@@ -38,9 +52,10 @@ urlpatterns = [
     path("recipes/<int:recipe_pk>/copy/",
          recipes_views.copy_recipe,
          name="copy_recipe"),
+    path("recipes/copy/", recipes_views.copy_recipes, name="copy_recipes"),
     path(
         "recipes/<int:recipe_pk>/favorite/",
-        recipes_views.toggle_favorite_recipe,
+        json_views.toggle_favorite_recipe,
         name="toggle_favorite_recipe",
     ),
     path("recipes/new/", recipes_views.add_recipe, name="add_recipe"),
@@ -54,6 +69,11 @@ urlpatterns = [
         recipes_views.add_recipe_step,
         name="add_recipe_step",
     ),
+    path(
+        "recipes/<int:recipe_pk>/steps/reorder/",
+        recipes_views.reorder_recipe_steps,
+        name="reorder_recipe_steps",
+    ),
     path("recipes/random/",
          recipes_views.show_random_recipe,
          name="random_recipe"),
@@ -63,13 +83,40 @@ urlpatterns = [
         recipes_views.show_meal_plan,
         name="show_meal_plan",
     ),
-    path("mealplan/add-remove/", recipes_views.meal_plan_add_remove_recipe),
+    path(
+        "mealplan/week/<int:year>/<int:month>/<int:day>/",
+        recipes_views.show_meal_plan_week,
+        name="show_meal_plan_week",
+    ),
+    path(
+        "mealplan/month/<int:year>/<int:month>/",
+        recipes_views.show_meal_plan_month,
+        name="show_meal_plan_month",
+    ),
+    path(
+        "mealplan/recipes/",
+        recipes_views.meal_plan_recipe_picker,
+        name="meal_plan_recipe_picker",
+    ),
+    path("mealplan/add-remove/", json_views.meal_plan_add_remove_recipe),
+    path("mealplan/update/",
+         json_views.meal_plan_update,
+         name="meal_plan_update"),
+    path("shopping-list/",
+         recipes_views.show_shopping_list,
+         name="shopping_list"),
+    path("pantry/", recipes_views.pantry, name="pantry"),
+    path("tags/", recipes_views.tag_cloud, name="tag_cloud"),
     path("tags/<str:tag_name>/", recipes_views.view_tag, name="view_tag"),
+    path("tag-autocomplete/",
+         recipes_views.tag_autocomplete,
+         name="tag_autocomplete"),
+    path("metrics", metrics.metrics, name="metrics"),
     path("admin/", admin.site.urls),
     path("accounts/", include("registration.backends.default.urls")),
 ]
 
-if settings.DEBUG:
+if settings.DEBUG and "debug_toolbar" in settings.INSTALLED_APPS:
     import debug_toolbar
 
     urlpatterns = [
@@ -0,0 +1,97 @@
+"""
+Async versions of the small JSON endpoints that get bursts of requests.
+project/urls.py uses these instead of their counterparts in
+recipes.views when the ASYNC_VIEWS setting is on, which it should only
+be when the site is served over ASGI (see project/gunicorn_asgi.py).
+
+Django 3.1 has no async ORM, so each view does its database work in a
+single sync_to_async() call, and keeps request parsing and rendering on
+the event loop.
+"""
+import functools
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.http import HttpResponse, HttpResponseNotAllowed, JsonResponse
+from django.template.loader import render_to_string
+
+from . import views
+from .models import MealPlan
+
+
+def async_login_required(view):
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        # Loading the user may hit the session and user tables.
+        is_authenticated = await sync_to_async(
+            lambda: request.user.is_authenticated)()
+        if not is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+
+    return wrapper
+
+
+def async_require_POST(view):
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != "POST":
+            return HttpResponseNotAllowed(["POST"])
+        return await view(request, *args, **kwargs)
+
+    return wrapper
+
+
+def async_csrf_exempt(view):
+    # django.views.decorators.csrf.csrf_exempt wraps the view in a sync
+    # function, so set the flag CsrfViewMiddleware looks for directly.
+    view.csrf_exempt = True
+    return view
+
+
+async def recipe_list(request):
+    if not request.is_ajax():
+        return await sync_to_async(views.recipe_list)(request)
+
+    context = await sync_to_async(views.get_recipe_list_context)(request)
+    return HttpResponse(
+        render_to_string("recipes/_recipe_list.html", context))
+
+
+@async_csrf_exempt
+@async_login_required
+@async_require_POST
+async def toggle_favorite_recipe(request, recipe_pk):
+    favorite = await sync_to_async(views.toggle_favorite)(request.user,
+                                                          recipe_pk)
+    return JsonResponse({"favorite": favorite})
+
+
+@async_csrf_exempt
+@async_login_required
+@async_require_POST
+async def meal_plan_add_remove_recipe(request):
+    try:
+        change = views.parse_meal_plan_change(request.POST.get("date", ""),
+                                              request.POST.get("pk", ""),
+                                              request.POST.get("action"))
+    except ValueError:
+        return HttpResponse(status=400)
+
+    await sync_to_async(MealPlan.objects.apply_changes)(request.user,
+                                                        [change])
+    return HttpResponse(status=204)
+
+
+@async_csrf_exempt
+@async_login_required
+@async_require_POST
+async def meal_plan_update(request):
+    try:
+        changes = views.parse_meal_plan_changes(request.body)
+    except ValueError as error:
+        return JsonResponse({"error": str(error)}, status=400)
+
+    applied = await sync_to_async(MealPlan.objects.apply_changes)(
+        request.user, changes)
+    return JsonResponse({"applied": applied})
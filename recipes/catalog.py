@@ -0,0 +1,42 @@
+"""
+The ingredient catalog: canonical names for the free-text items of
+ingredients, so that "Tomatoes, diced" and "fresh tomato" are both the
+catalog item "tomato". Each Ingredient is linked to its CatalogItem when
+it is saved; run the backfill_ingredient_catalog command to link the
+ingredients that existed before the catalog did, or after changing the
+normalizer.
+"""
+import re
+from functools import lru_cache
+
+from .search import STOP_WORDS, normalize_term
+
+WORD_RE = re.compile(r"[a-z]+")
+PARENTHESES_RE = re.compile(r"\([^)]*\)")
+
+# Words that describe how an item is prepared or how much of it to use
+# rather than what it is.
+PREPARATION_WORDS = frozenset([
+    "about", "chopped", "coarsely", "crushed", "cubed", "diced", "divided",
+    "drained", "finely", "fresh", "freshly", "grated", "halved", "large",
+    "lightly", "medium", "melted", "minced", "optional", "peeled", "quartered",
+    "rinsed", "roughly", "shredded", "sliced", "small", "softened", "thinly",
+    "taste", "trimmed", "whole"
+])
+
+
+@lru_cache(maxsize=16384)
+def normalize_ingredient(item):
+    """
+    Return the catalog name for the free-text ingredient `item`, or "" if
+    nothing is left once preparation notes are dropped.
+
+    Anything in parentheses or after the first comma is a note ("onion,
+    finely chopped"), preparation words and stop words are dropped and
+    plurals are folded. Items repeat a lot across recipes, so results are
+    cached.
+    """
+    item = PARENTHESES_RE.sub(" ", item.lower()).split(",")[0]
+    return " ".join(
+        normalize_term(word) for word in WORD_RE.findall(item)
+        if word not in PREPARATION_WORDS and word not in STOP_WORDS)
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+from django.utils.module_loading import import_string
+
+
+@register()
+def check_async_middleware(app_configs, **kwargs):
+    """
+    With ASYNC_VIEWS on, warn about middleware that can only run
+    synchronously: Django then adapts the async views back to sync and runs
+    each of them in a thread, so they never run on the event loop.
+    """
+    if not settings.ASYNC_VIEWS:
+        return []
+
+    return [
+        Warning(
+            f"{path} can't run asynchronously, so the async views run in "
+            "threads.",
+            hint="Leave it out of MIDDLEWARE when ASYNC_VIEWS is on.",
+            obj=path,
+            id="recipes.W001",
+        ) for path in settings.MIDDLEWARE
+        if not getattr(import_string(path), "async_capable", False)
+    ]
@@ -0,0 +1,71 @@
+"""
+Streaming export of recipes, with their tags, ingredients and steps, as
+JSON Lines or a JSON array.
+
+Recipes are read with a server-side cursor where the database supports
+it and their children are prefetched one batch at a time, so memory use
+stays flat however large the catalog is.
+"""
+import json
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import prefetch_related_objects
+
+CHUNK_SIZE = 500
+
+
+def iter_recipe_dicts(recipes, after=None, chunk_size=CHUNK_SIZE):
+    """
+    Yield `Recipe.to_dict(include_children=True)` for each recipe in
+    `recipes` in pk order, starting after the pk `after` if given.
+    """
+    recipes = recipes.order_by("pk")
+    if after is not None:
+        recipes = recipes.filter(pk__gt=after)
+
+    batch = []
+    for recipe in recipes.iterator(chunk_size=chunk_size):
+        batch.append(recipe)
+        if len(batch) == chunk_size:
+            yield from _export_batch(batch)
+            batch = []
+    yield from _export_batch(batch)
+
+
+def _export_batch(batch):
+    prefetch_related_objects(batch, "tags", "ingredients", "steps")
+    for recipe in batch:
+        yield recipe.to_dict(include_children=True)
+
+
+def iter_jsonl(dicts):
+    for data in dicts:
+        yield json.dumps(data, cls=DjangoJSONEncoder) + "\n"
+
+
+def iter_json_array(dicts):
+    separator = "[\n"
+    for data in dicts:
+        yield separator + json.dumps(data, cls=DjangoJSONEncoder)
+        separator = ",\n"
+    yield "[]\n" if separator == "[\n" else "\n]\n"
+
+
+FORMATS = {
+    "jsonl": iter_jsonl,
+    "json": iter_json_array,
+}
+
+
+def iter_gzip(chunks):
+    """
+    Gzip a stream of text chunks, yielding compressed bytes as they
+    become available.
+    """
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk.encode())
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -1,5 +1,6 @@
 from django import forms
 from django.contrib.auth import password_validation
+from django.urls import reverse_lazy
 from registration.forms import RegistrationForm
 
 from .models import Ingredient, Recipe, RecipeStep
@@ -45,7 +46,12 @@ class RecipeForm(forms.ModelForm):
     tag_names = forms.CharField(
         label="Tags",
         help_text="Enter tags separated by spaces.",
-        widget=forms.TextInput(attrs={"class": TEXT_INPUT_CLASSES}),
+        widget=forms.TextInput(
+            attrs={
+                "class": TEXT_INPUT_CLASSES,
+                "autocomplete": "off",
+                "data-autocomplete-url": reverse_lazy("tag_autocomplete"),
+            }),
         required=False,
     )
 
@@ -0,0 +1,129 @@
+"""
+Versioned cache for the parts of a recipe page that are the same for
+every viewer.
+
+Fragments are keyed on the recipe's pk and `cache_version`, which is
+bumped whenever the recipe, its ingredients, steps or tags change (see
+recipes.signals), and on FRAGMENT_SCHEMA_VERSION, which is bumped
+whenever the markup inside a {% recipefragment %} block changes. Stale
+entries are never served; they simply stop being read and age out of
+the cache.
+
+The cache alias is `recipe_fragments` in settings.CACHES, so the
+backend can be local memory, files on disk or a Redis server depending
+on RECIPE_FRAGMENT_CACHE_URL. Hit and miss counters live in the same
+cache, so they are only shared between processes when the backend is.
+They are tallied in memory and written once per request, rather than
+costing a round trip to the cache on every fragment.
+"""
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import request_finished
+from django.db import connection
+from django.dispatch import receiver
+
+CACHE_ALIAS = "recipe_fragments"
+
+# Every fragment name used with {% recipefragment %}, so that they can all
+# be evicted when a recipe is deleted.
+FRAGMENT_NAMES = ("metadata", "tags", "ingredients", "steps")
+
+# Bump this whenever the markup of a fragment changes, so that pages
+# rendered by the old templates are not served from the cache.
+FRAGMENT_SCHEMA_VERSION = 2
+
+STATS = ("hits", "misses", "queries_saved")
+
+
+def get_fragment_cache():
+    return caches[CACHE_ALIAS]
+
+
+def make_fragment_key(recipe, name):
+    return (f"recipe:{recipe.pk}:v{recipe.cache_version}"
+            f":s{FRAGMENT_SCHEMA_VERSION}:{name}")
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def render_fragment(recipe, name, render):
+    """
+    Return the cached HTML for the `name` fragment of `recipe`, calling
+    `render()` to produce and store it on a miss.
+    """
+    cache = get_fragment_cache()
+    key = make_fragment_key(recipe, name)
+    cached = cache.get(key)
+    if cached is not None:
+        html, num_queries = cached
+        record_stat("hits")
+        record_stat("queries_saved", num_queries)
+        return html
+
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        html = render()
+    cache.set(key, (html, counter.count),
+              settings.RECIPE_FRAGMENT_CACHE_TIMEOUT)
+    record_stat("misses")
+    return html
+
+
+def delete_fragments(recipe):
+    get_fragment_cache().delete_many(
+        [make_fragment_key(recipe, name) for name in FRAGMENT_NAMES])
+
+
+_pending_stats = Counter()
+_pending_stats_lock = threading.Lock()
+
+
+def record_stat(stat, amount=1):
+    if amount:
+        with _pending_stats_lock:
+            _pending_stats[stat] += amount
+
+
+@receiver(request_finished)
+def flush_stats(**kwargs):
+    """
+    Add the stats recorded since the last flush to the counters in the
+    cache.
+    """
+    global _pending_stats
+    with _pending_stats_lock:
+        pending, _pending_stats = _pending_stats, Counter()
+    if not pending:
+        return
+
+    cache = get_fragment_cache()
+    for stat, amount in pending.items():
+        key = f"stats:{stat}"
+        try:
+            cache.incr(key, amount)
+        except ValueError:
+            if not cache.add(key, amount, timeout=None):
+                cache.incr(key, amount)
+
+
+def get_stats():
+    flush_stats()
+    cache = get_fragment_cache()
+    values = cache.get_many([f"stats:{stat}" for stat in STATS])
+    return {stat: values.get(f"stats:{stat}", 0) for stat in STATS}
+
+
+def reset_stats():
+    with _pending_stats_lock:
+        _pending_stats.clear()
+    get_fragment_cache().delete_many([f"stats:{stat}" for stat in STATS])
@@ -0,0 +1,317 @@
+"""
+Bulk import of recipes from JSON Lines or CSV.
+
+Rows are validated with the same forms the site uses (RecipeForm,
+IngredientForm and RecipeStepForm) and written in batches, one
+transaction per batch. A row that fails validation is reported and
+skipped without affecting the rest of its batch.
+
+JSON Lines rows use the same shape as recipes.export::
+
+    {"title": "Soup", "prep_time_in_minutes": 5, "cook_time_in_minutes": 20,
+     "public": true, "tags": ["lunch", "easy"],
+     "ingredients": [{"amount": "1", "item": "onion"}],
+     "steps": ["Chop the onion.", "Simmer."]}
+
+CSV files have a header row with the columns title,
+prep_time_in_minutes, cook_time_in_minutes, public, tags, ingredients
+and steps. Tags are separated by spaces; ingredients ("amount | item")
+and steps are one per line within their cell.
+"""
+import csv
+import io
+import json
+import time
+
+from django.db import DatabaseError, connection, transaction
+
+from .forms import IngredientForm, RecipeForm, RecipeStepForm
+from .models import (
+    Ingredient,
+    Recipe,
+    RecipeStep,
+    Tag,
+    get_catalog_item_ids,
+)
+
+BATCH_SIZE = 500
+
+FALSE_VALUES = {"", "0", "false", "f", "no", "n"}
+
+
+class RowError(Exception):
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def read_jsonl(stream):
+    """
+    Yield (line number, dict or RowError) for each non-blank line.
+    """
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError as error:
+            yield line_number, RowError(
+                {"__all__": [f"Invalid JSON: {error}"]})
+            continue
+        if not isinstance(data, dict):
+            yield line_number, RowError(
+                {"__all__": ["Each line must be a JSON object."]})
+            continue
+        yield line_number, data
+
+
+def read_csv(stream):
+    """
+    Yield (line number, dict) for each row, converted to the same shape
+    as a JSON Lines row.
+    """
+    reader = csv.DictReader(stream)
+    for row in reader:
+        ingredients = []
+        for line in (row.get("ingredients") or "").splitlines():
+            if line.strip():
+                amount, _, item = line.partition("|")
+                ingredients.append({
+                    "amount": amount.strip(),
+                    "item": item.strip()
+                })
+
+        yield reader.line_num, {
+            "title": row.get("title", ""),
+            "prep_time_in_minutes": row.get("prep_time_in_minutes") or None,
+            "cook_time_in_minutes": row.get("cook_time_in_minutes") or None,
+            "public": (row.get("public") or "true").strip().lower()
+            not in FALSE_VALUES,
+            "tags": row.get("tags") or "",
+            "ingredients": ingredients,
+            "steps": [
+                step.strip() for step in (row.get("steps") or "").splitlines()
+                if step.strip()
+            ],
+        }
+
+
+READERS = {
+    "jsonl": read_jsonl,
+    "csv": read_csv,
+}
+
+
+class ImportedRecipe:
+    """
+    A validated row, ready to be written.
+    """
+    def __init__(self, line_number, recipe, tag_names, ingredients, steps):
+        self.line_number = line_number
+        self.recipe = recipe
+        self.tag_names = tag_names
+        self.ingredients = ingredients
+        self.steps = steps
+
+
+class ImportResult:
+    def __init__(self):
+        self.processed = 0
+        self.imported = 0
+        self.errors = []
+        self.started = time.perf_counter()
+
+    @property
+    def failed(self):
+        return len(self.errors)
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rows_per_second(self):
+        return self.processed / self.elapsed if self.elapsed else 0
+
+    def add_error(self, line_number, errors):
+        self.errors.append((line_number, errors))
+
+
+class RecipeImporter:
+    """
+    Import recipe rows for `user`.
+
+    `progress`, if given, is called with the ImportResult after every
+    batch.
+    """
+    def __init__(self, user, batch_size=BATCH_SIZE, progress=None):
+        self.user = user
+        self.batch_size = batch_size
+        self.progress = progress
+
+    def run(self, rows):
+        """
+        Import every (line number, data) pair from `rows`, as produced by
+        one of the readers, and return an ImportResult.
+        """
+        result = ImportResult()
+        batch = []
+        for line_number, data in rows:
+            result.processed += 1
+            try:
+                if isinstance(data, RowError):
+                    raise data
+                batch.append(self.validate(line_number, data))
+            except RowError as error:
+                result.add_error(line_number, error.errors)
+
+            if len(batch) == self.batch_size:
+                self.write_batch(batch, result)
+                batch = []
+        if batch:
+            self.write_batch(batch, result)
+        return result
+
+    def validate(self, line_number, data):
+        tags = data.get("tags") or ""
+        if isinstance(tags, list) and all(
+                isinstance(tag, str) for tag in tags):
+            tags = " ".join(tags)
+        elif not isinstance(tags, str):
+            raise RowError(
+                {"tags": ["Tags must be a string or a list of strings."]})
+        for field in ("ingredients", "steps"):
+            if not isinstance(data.get(field) or [], list):
+                raise RowError({field: [f"The {field} must be a list."]})
+
+        recipe_form = RecipeForm(data={
+            "title": data.get("title"),
+            "prep_time_in_minutes": data.get("prep_time_in_minutes"),
+            "cook_time_in_minutes": data.get("cook_time_in_minutes"),
+            "public": data.get("public", True),
+            "tag_names": tags,
+        })
+        if not recipe_form.is_valid():
+            raise RowError(recipe_form.errors.get_json_data())
+        recipe = recipe_form.save(commit=False)
+        recipe.user = self.user
+
+        ingredients = []
+        for ingredient_data in data.get("ingredients") or []:
+            if not isinstance(ingredient_data, dict):
+                raise RowError({
+                    "ingredients":
+                    ["Each ingredient must have an amount and an item."]
+                })
+            form = IngredientForm(data=ingredient_data)
+            if not form.is_valid():
+                raise RowError({"ingredients": form.errors.get_json_data()})
+            ingredients.append(form.save(commit=False))
+
+        steps = []
+        for text in data.get("steps") or []:
+            if not isinstance(text, str):
+                raise RowError({"steps": ["Each step must be a string."]})
+            form = RecipeStepForm(data={"text": text})
+            if not form.is_valid():
+                raise RowError({"steps": form.errors.get_json_data()})
+            steps.append(form.save(commit=False))
+
+        return ImportedRecipe(line_number, recipe,
+                              recipe_form.cleaned_data["tag_names"].split(),
+                              ingredients, steps)
+
+    def write_batch(self, batch, result):
+        try:
+            with transaction.atomic():
+                self.write(batch)
+            result.imported += len(batch)
+        except DatabaseError:
+            # Something in the batch upset the database. Fall back to one
+            # transaction per row to find out which rows are at fault.
+            for imported in batch:
+                try:
+                    with transaction.atomic():
+                        self.write([imported])
+                    result.imported += 1
+                except DatabaseError as error:
+                    result.add_error(imported.line_number,
+                                     {"__all__": [str(error)]})
+
+        if self.progress:
+            self.progress(result)
+
+    def write(self, batch):
+        for imported in batch:
+            # Clear any pk left over from a failed batch before a retry.
+            imported.recipe.pk = None
+            imported.recipe._state.adding = True
+        Recipe.objects.bulk_insert([imported.recipe for imported in batch])
+
+        tag_ids = Tag.objects.resolve_names(
+            list(
+                dict.fromkeys(tag_name for imported in batch
+                              for tag_name in imported.tag_names)))
+
+        catalog_item_ids = get_catalog_item_ids({
+            ingredient.item
+            for imported in batch for ingredient in imported.ingredients
+        })
+
+        ingredient_rows = []
+        step_rows = []
+        recipe_tags = []
+        for imported in batch:
+            recipe_pk = imported.recipe.pk
+            ingredient_rows.extend(
+                (recipe_pk, ingredient.amount, ingredient.item,
+                 catalog_item_ids[ingredient.item])
+                for ingredient in imported.ingredients)
+            step_rows.extend((recipe_pk, order, step.text)
+                             for order, step in enumerate(imported.steps))
+            recipe_tags.extend(
+                Recipe.tags.through(recipe_id=recipe_pk, tag_id=tag_id)
+                for tag_id in {tag_ids[name]
+                               for name in imported.tag_names})
+
+        self.insert_rows(Ingredient,
+                         ["recipe_id", "amount", "item", "catalog_item_id"],
+                         ingredient_rows)
+        self.insert_rows(RecipeStep, ["recipe_id", "order", "text"],
+                         step_rows)
+        Recipe.tags.through.objects.bulk_create(recipe_tags,
+                                                batch_size=1000)
+        Tag.objects.filter(
+            pk__in=set(tag_ids.values())).refresh_recipe_counts()
+
+    def insert_rows(self, model, columns, rows):
+        """
+        Insert plain tuples into `model`'s table, using COPY on PostgreSQL
+        and bulk_create() everywhere else.
+        """
+        if not rows:
+            return
+
+        if connection.vendor == "postgresql":
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(rows)
+            buffer.seek(0)
+            column_list = ", ".join(
+                connection.ops.quote_name(column) for column in columns)
+            with connection.cursor() as cursor:
+                cursor.copy_expert(
+                    f"COPY {connection.ops.quote_name(model._meta.db_table)} "
+                    f"({column_list}) FROM STDIN WITH (FORMAT csv)", buffer)
+        else:
+            model.objects.bulk_create(
+                [model(**dict(zip(columns, row))) for row in rows],
+                batch_size=1000)
+
+
+def import_recipes(stream, user, format="jsonl", **kwargs):
+    """
+    Import recipes for `user` from a text stream in the given format and
+    return an ImportResult. Extra keyword arguments are passed on to
+    RecipeImporter.
+    """
+    return RecipeImporter(user, **kwargs).run(READERS[format](stream))
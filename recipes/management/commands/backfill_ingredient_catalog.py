@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import Ingredient, Recipe, get_catalog_item_ids
+
+
+class Command(BaseCommand):
+    help = ("Link ingredients to their entries in the ingredient catalog, "
+            "creating entries as needed. Only unlinked ingredients are "
+            "updated unless --all is given, e.g. after the normalizer "
+            "changes.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--all",
+                            action="store_true",
+                            help="Relink every ingredient.")
+
+    def handle(self, *args, **options):
+        ingredients = Ingredient.objects.order_by("pk")
+        if not options["all"]:
+            ingredients = ingredients.filter(catalog_item__isnull=True)
+
+        last_pk = 0
+        linked = 0
+        while True:
+            batch = list(
+                ingredients.filter(pk__gt=last_pk).only(
+                    "pk", "recipe_id", "item",
+                    "catalog_item_id")[:options["batch_size"]])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+
+            with transaction.atomic():
+                catalog_item_ids = get_catalog_item_ids(
+                    {ingredient.item
+                     for ingredient in batch})
+                changed = []
+                for ingredient in batch:
+                    catalog_item_id = catalog_item_ids[ingredient.item]
+                    if catalog_item_id != ingredient.catalog_item_id:
+                        ingredient.catalog_item_id = catalog_item_id
+                        changed.append(ingredient)
+                Ingredient.objects.bulk_update(changed, ["catalog_item_id"],
+                                               batch_size=1000)
+                # Catalog items are features of the recipes' MinHash
+                # signatures, which are recomputed on a version change.
+                Recipe.objects.filter(
+                    pk__in={ingredient.recipe_id
+                            for ingredient in changed}).bump_cache_version()
+            linked += len(changed)
+
+        self.stdout.write(f"Linked {linked} ingredient(s) to the catalog.")
@@ -0,0 +1,117 @@
+import statistics
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import (
+    BACKEND_SESSION_KEY,
+    HASH_SESSION_KEY,
+    SESSION_KEY,
+)
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from recipes.models import Recipe, User
+
+ENDPOINTS = ("favorite", "meal-plan", "recipe-list")
+
+
+class Command(BaseCommand):
+    help = (
+        "Fire concurrent requests at the JSON endpoints of a running server "
+        "and report throughput and latency percentiles. Run it once against "
+        "the sync deployment (gunicorn project.wsgi) and once against the "
+        "ASGI one (gunicorn -c project/gunicorn_asgi.py project.asgi:"
+        "application) to compare them.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+        parser.add_argument("--user",
+                            required=True,
+                            help="Username to send the requests as.")
+        parser.add_argument("--endpoint", choices=ENDPOINTS, default="favorite")
+        parser.add_argument("--requests", type=int, default=1000)
+        parser.add_argument("--concurrency", type=int, default=50)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["user"])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['user']!r}.")
+        recipe = Recipe.objects.for_user(user).first()
+        if recipe is None:
+            raise CommandError(f"{user} has no recipes to use.")
+
+        headers = {
+            "Cookie":
+            f"{settings.SESSION_COOKIE_NAME}={self.log_in(user)}",
+        }
+        url, data = self.get_request(options["endpoint"], recipe)
+        if options["endpoint"] == "recipe-list":
+            headers["X-Requested-With"] = "XMLHttpRequest"
+        request = urllib.request.Request(options["base_url"] + url,
+                                         data=data,
+                                         headers=headers)
+
+        def send(_):
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request) as response:
+                    response.read()
+                ok = True
+            except (urllib.error.URLError, OSError):
+                ok = False
+            return ok, time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(options["concurrency"]) as executor:
+            results = list(executor.map(send, range(options["requests"])))
+        elapsed = time.perf_counter() - start
+
+        latencies = sorted(latency for ok, latency in results if ok)
+        failed = len(results) - len(latencies)
+        if not latencies:
+            raise CommandError("Every request failed.")
+        percentiles = statistics.quantiles(latencies, n=100)
+
+        self.stdout.write(
+            f"{options['endpoint']}: {len(results)} requests, "
+            f"{options['concurrency']} at a time, in {elapsed:.2f}s "
+            f"({len(latencies) / elapsed:.1f} requests/s, {failed} failed)")
+        self.stdout.write(
+            "latency p50 {:.1f}ms, p95 {:.1f}ms, p99 {:.1f}ms, "
+            "max {:.1f}ms".format(percentiles[49] * 1000,
+                                  percentiles[94] * 1000,
+                                  percentiles[98] * 1000,
+                                  latencies[-1] * 1000))
+
+    def log_in(self, user):
+        """
+        Create a logged-in session for `user` and return its key.
+        """
+        session = SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.save()
+        return session.session_key
+
+    def get_request(self, endpoint, recipe):
+        """
+        Return the URL and POST body (None for a GET) for `endpoint`.
+        """
+        if endpoint == "favorite":
+            return reverse("toggle_favorite_recipe",
+                           kwargs={"recipe_pk": recipe.pk}), b""
+        if endpoint == "meal-plan":
+            # Adding the same recipe again is a no-op after the first time.
+            return "/mealplan/add-remove/", urllib.parse.urlencode({
+                "date": time.strftime("%Y-%m-%d"),
+                "pk": recipe.pk,
+                "action": "add",
+            }).encode()
+        return reverse("recipe_list"), None
@@ -0,0 +1,81 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from recipes.models import Recipe, User
+
+
+def copy_one_at_a_time(recipes, user):
+    """
+    The original copy_recipe implementation, kept as a baseline.
+    """
+    for original_recipe in recipes:
+        cloned_recipe = Recipe(
+            title=original_recipe.title + " (Copy)",
+            prep_time_in_minutes=original_recipe.prep_time_in_minutes,
+            cook_time_in_minutes=original_recipe.cook_time_in_minutes,
+            user=user,
+            original_recipe=original_recipe,
+        )
+        cloned_recipe.save()
+        for ingredient in original_recipe.ingredients.all():
+            cloned_recipe.ingredients.create(amount=ingredient.amount,
+                                             item=ingredient.item)
+        for recipe_step in original_recipe.steps.all():
+            cloned_recipe.steps.create(text=recipe_step.text)
+        cloned_recipe.tags.set(original_recipe.tags.all())
+
+
+class Command(BaseCommand):
+    help = ("Compare the throughput of copying recipes one row at a time "
+            "with Recipe.objects.fork_for(). All data is rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--recipes", type=int, default=100)
+        parser.add_argument("--ingredients", type=int, default=10)
+        parser.add_argument("--steps", type=int, default=8)
+        parser.add_argument("--tags", type=int, default=4)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            recipe_pks, user = self.create_sample_recipes(options)
+            recipes = Recipe.objects.filter(pk__in=recipe_pks)
+
+            self.measure("one at a time",
+                         lambda: copy_one_at_a_time(recipes, user),
+                         len(recipe_pks))
+            self.measure("fork_for", lambda: recipes.fork_for(user),
+                         len(recipe_pks))
+
+            transaction.set_rollback(True)
+
+    def create_sample_recipes(self, options):
+        user = User.objects.create(username="benchmark-fork-recipes")
+        tag_names = " ".join(f"benchmark-tag-{i}"
+                             for i in range(options["tags"]))
+        recipe_pks = []
+        for i in range(options["recipes"]):
+            recipe = Recipe.objects.create(user=user,
+                                           title=f"Benchmark recipe {i}",
+                                           prep_time_in_minutes=10,
+                                           cook_time_in_minutes=20)
+            for j in range(options["ingredients"]):
+                recipe.ingredients.create(amount="1 cup", item=f"item {j}")
+            for j in range(options["steps"]):
+                recipe.steps.create(text=f"Step {j}")
+            recipe.set_tag_names(tag_names)
+            recipe_pks.append(recipe.pk)
+        return recipe_pks, user
+
+    def measure(self, label, copy, num_recipes):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            copy()
+            elapsed = time.perf_counter() - start
+
+        self.stdout.write(
+            f"{label}: {num_recipes} recipes in {elapsed:.3f}s "
+            f"({num_recipes / elapsed:.1f} recipes/s, "
+            f"{len(queries)} queries)")
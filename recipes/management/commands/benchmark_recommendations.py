@@ -0,0 +1,95 @@
+import resource
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from recipes.recommendations import (
+    get_best_scores,
+    make_favorites_matrix,
+    score_co_favorites,
+)
+
+
+class Command(BaseCommand):
+    help = ("Measure the memory and time the recommender's in-memory "
+            "favorites matrix and scoring take on synthetic favorites, "
+            "without touching the database. Recipe popularity follows a "
+            "long tail, as real favorites do.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--favorites", type=int, default=10_000_000)
+        parser.add_argument("--users", type=int, default=100_000)
+        parser.add_argument("--recipes", type=int, default=1_000_000)
+        parser.add_argument(
+            "--sample",
+            type=int,
+            default=10_000,
+            help="How many recipes to score; the full run is extrapolated.")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options["seed"])
+
+        user_pks, recipe_pks = self.create_favorites(rng, options)
+        start = time.perf_counter()
+        matrix = make_favorites_matrix(user_pks, recipe_pks)
+        fans = matrix.T.tocsr()
+        elapsed = time.perf_counter() - start
+        matrix_bytes = sum(array.nbytes for array in [
+            matrix.data, matrix.indices, matrix.indptr, fans.data,
+            fans.indices, fans.indptr
+        ])
+        self.stdout.write(
+            f"matrix: {len(user_pks)} favorites by {options['users']} users "
+            f"in {elapsed:.1f}s, {matrix_bytes / 2**20:.0f} MiB, "
+            f"peak RSS {self.get_peak_rss() / 2**20:.0f} MiB")
+
+        # The stored counters count every user, the matrix only the
+        # lighter ones.
+        favorite_counts = np.bincount(recipe_pks)
+        favorited_pks = np.flatnonzero(favorite_counts)
+        sample = np.sort(
+            rng.choice(favorited_pks,
+                       min(options["sample"], len(favorited_pks)),
+                       replace=False)).tolist()
+        start = time.perf_counter()
+        recommended = 0
+        for _, pks, scores in score_co_favorites(matrix, fans, sample,
+                                                 favorite_counts):
+            recommended += len(get_best_scores(pks, scores))
+        elapsed = time.perf_counter() - start
+        per_recipe = elapsed / len(sample)
+        self.stdout.write(
+            f"scoring: {len(sample)} recipes in {elapsed:.1f}s "
+            f"({per_recipe * 1000:.2f}ms each, "
+            f"{recommended / len(sample):.1f} recommendations each); "
+            f"all {len(favorited_pks)} favorited recipes would take "
+            f"{per_recipe * len(favorited_pks):.0f}s, "
+            f"peak RSS {self.get_peak_rss() / 2**20:.0f} MiB")
+
+    def create_favorites(self, rng, options):
+        """
+        Return the user and recipe pks of synthetic favorites, as two
+        arrays.
+        """
+        # Zipf-like popularity: the recipe of rank r is favorited about
+        # 1 / r as often as the most popular one.
+        cum_weights = np.cumsum(1 / np.arange(1, options["recipes"] + 1))
+        per_user = options["favorites"] / options["users"]
+        counts = np.minimum(
+            rng.exponential(per_user, options["users"]).astype(np.int64) + 1,
+            options["recipes"])
+
+        user_pks = np.repeat(np.arange(options["users"]), counts)
+        recipe_pks = np.searchsorted(
+            cum_weights,
+            rng.random(len(user_pks)) * cum_weights[-1]) + 1
+        # A user favorites a recipe at most once.
+        keys = np.unique(user_pks * (options["recipes"] + 1) + recipe_pks)
+        return keys // (options["recipes"] + 1), keys % (options["recipes"] +
+                                                          1)
+
+    def get_peak_rss(self):
+        # Linux reports kilobytes.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
@@ -0,0 +1,190 @@
+import datetime
+import json
+import platform
+import re
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, get_resolver
+
+from recipes.models import Recipe, Tag, User
+
+PARAMETER_RE = re.compile(r"<(?:\w+:)?(\w+)>")
+
+# Routes that only accept POST, with the body to send them.
+POST_REQUESTS = {
+    "toggle_favorite_recipe": lambda sample: ({}, None),
+    "copy_recipes": lambda sample: ({
+        "pk": [sample["recipe_pk"]]
+    }, None),
+    "mealplan/add-remove/": lambda sample: ({
+        "date": sample["date"],
+        "pk": sample["recipe_pk"],
+        "action": "add",
+    }, None),
+    "reorder_recipe_steps": lambda sample: (json.dumps({
+        "steps": sample["step_pks"][::-1],
+        "version": sample["version"],
+    }), "application/json"),
+    "meal_plan_update": lambda sample: (json.dumps([{
+        "date": sample["date"],
+        "pk": sample["recipe_pk"],
+        "action": "add",
+    }]), "application/json"),
+}
+
+
+def get_routes():
+    """
+    Yield (label, route) for every plain path() in the root URLconf,
+    labelled by URL name where there is one. Included URLconfs such as
+    the admin are skipped.
+    """
+    for pattern in get_resolver().url_patterns:
+        if isinstance(pattern, URLPattern):
+            route = str(pattern.pattern)
+            yield pattern.name or route, route
+
+
+def get_sample(user):
+    # Prefer one of the user's own recipes so the owner-only pages work.
+    recipe = (user.recipes.order_by("pk").first()
+              or Recipe.objects.for_user(user).order_by("pk").first())
+    if recipe is None:
+        raise CommandError(f"{user} has no recipes to use.")
+    tag = Tag.objects.filter(recipes=recipe).first() or Tag.objects.first()
+    today = datetime.date.today()
+    return {
+        "recipe_pk": recipe.pk,
+        "step_pks": list(recipe.steps.values_list("pk", flat=True)),
+        "version": recipe.cache_version,
+        "tag_name": tag.tag if tag else "none",
+        # The last word of a title, like "Soup", matches several recipes.
+        "search_term": (recipe.title.split() or ["none"])[-1],
+        "year": today.year,
+        "month": today.month,
+        "day": today.day,
+        "date": today.isoformat(),
+    }
+
+
+def send_request(client, label, url, sample):
+    if label in POST_REQUESTS:
+        data, content_type = POST_REQUESTS[label](sample)
+        if content_type:
+            response = client.post(url, data, content_type=content_type)
+        else:
+            response = client.post(url, data)
+    else:
+        response = client.get(url)
+
+    if response.streaming:
+        # Streamed responses do their work as they are read.
+        b"".join(response.streaming_content)
+    return response
+
+
+def get_url(route, sample):
+    return "/" + PARAMETER_RE.sub(lambda match: str(sample[match.group(1)]),
+                                  route)
+
+
+class Command(BaseCommand):
+    help = (
+        "Request every route in the project's URLconf through the test "
+        "client as a given user and report latency percentiles, queries "
+        "per request and throughput. Everything the requests change is "
+        "rolled back afterwards. Use --output to save the results as JSON "
+        "for comparing runs.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user",
+                            required=True,
+                            help="Username to make the requests as.")
+        parser.add_argument("--iterations", type=int, default=50)
+        parser.add_argument("--warmup", type=int, default=2)
+        parser.add_argument("--route",
+                            action="append",
+                            default=[],
+                            help="Only benchmark this route (repeatable).")
+        parser.add_argument("--output",
+                            help="Write the results to this JSON file.")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["user"])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['user']!r}.")
+
+        if options["iterations"] < 2:
+            raise CommandError("--iterations must be at least 2.")
+
+        sample = get_sample(user)
+        # Requests from outside INTERNAL_IPS keep the debug toolbar out of
+        # the measurements.
+        client = Client(SERVER_NAME="localhost", REMOTE_ADDR="192.0.2.1")
+        client.force_login(user)
+
+        results = {}
+        with transaction.atomic():
+            for label, route in get_routes():
+                if options["route"] and label not in options["route"]:
+                    continue
+                results[label] = self.measure(client, label,
+                                              get_url(route, sample), sample,
+                                              options)
+                self.write_result(label, results[label])
+            transaction.set_rollback(True)
+
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(
+                    {
+                        "time": datetime.datetime.now().isoformat(),
+                        "python": platform.python_version(),
+                        "database": connection.vendor,
+                        "iterations": options["iterations"],
+                        "routes": results,
+                    },
+                    output,
+                    indent=2)
+            self.stdout.write(f"Wrote results to {options['output']}.")
+
+    def measure(self, client, label, url, sample, options):
+        for _ in range(options["warmup"]):
+            send_request(client, label, url, sample)
+
+        latencies = []
+        queries = []
+        statuses = set()
+        for _ in range(options["iterations"]):
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = send_request(client, label, url, sample)
+                latencies.append(time.perf_counter() - start)
+            queries.append(len(captured))
+            statuses.add(response.status_code)
+
+        percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+        return {
+            "url": url,
+            "status": sorted(statuses),
+            "p50_ms": percentiles[49] * 1000,
+            "p95_ms": percentiles[94] * 1000,
+            "p99_ms": percentiles[98] * 1000,
+            "mean_queries": statistics.mean(queries),
+            "max_queries": max(queries),
+            "requests_per_second": len(latencies) / sum(latencies),
+        }
+
+    def write_result(self, label, result):
+        self.stdout.write(
+            f"{label}: p50 {result['p50_ms']:.1f}ms, "
+            f"p95 {result['p95_ms']:.1f}ms, p99 {result['p99_ms']:.1f}ms, "
+            f"{result['mean_queries']:.1f} queries, "
+            f"{result['requests_per_second']:.1f} req/s "
+            f"(status {', '.join(map(str, result['status']))})")
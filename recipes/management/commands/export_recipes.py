@@ -0,0 +1,68 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.export import CHUNK_SIZE, FORMATS, iter_gzip, iter_recipe_dicts
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ("Export every recipe, with its tags, ingredients and steps, as "
+            "JSON Lines or a JSON array.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output",
+            "-o",
+            default="-",
+            help="File to write to, or - for standard output (the default).",
+        )
+        parser.add_argument("--format", choices=FORMATS, default="jsonl")
+        parser.add_argument("--gzip",
+                            action="store_true",
+                            help="Gzip the output.")
+        parser.add_argument(
+            "--after",
+            type=int,
+            help="Only export recipes with a pk greater than this, e.g. to "
+            "resume an interrupted export from the last id written.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if options["format"] == "json" and options["after"] is not None:
+            raise CommandError(
+                "--after can only be used with --format=jsonl, since a "
+                "resumed JSON array can't simply be appended to.")
+
+        recipes = iter_recipe_dicts(Recipe.objects.all(),
+                                    after=options["after"],
+                                    chunk_size=options["chunk_size"])
+        chunks = FORMATS[options["format"]](self.count(recipes))
+
+        if options["gzip"]:
+            chunks = iter_gzip(chunks)
+        else:
+            chunks = (chunk.encode() for chunk in chunks)
+
+        if options["output"] == "-":
+            self.write_chunks(sys.stdout.buffer, chunks)
+        else:
+            with open(options["output"], "wb") as output:
+                self.write_chunks(output, chunks)
+
+        self.stderr.write(f"Exported {self.exported} recipe(s).")
+
+    def write_chunks(self, output, chunks):
+        for chunk in chunks:
+            output.write(chunk)
+        output.flush()
+
+    def count(self, recipes):
+        self.exported = 0
+        for recipe in recipes:
+            self.exported += 1
+            if self.exported % 10000 == 0:
+                self.stderr.write(f"Exported {self.exported} recipes, "
+                                  f"last id {recipe['id']}...")
+            yield recipe
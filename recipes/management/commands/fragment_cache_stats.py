@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from recipes.fragments import get_stats, reset_stats
+
+
+class Command(BaseCommand):
+    help = "Show hit and miss counts for the recipe fragment cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reset",
+                            action="store_true",
+                            help="Reset the counters after showing them.")
+
+    def handle(self, *args, **options):
+        stats = get_stats()
+        lookups = stats["hits"] + stats["misses"]
+        hit_rate = stats["hits"] / lookups if lookups else 0
+
+        self.stdout.write(f"Hits: {stats['hits']}")
+        self.stdout.write(f"Misses (renders): {stats['misses']}")
+        self.stdout.write(f"Hit rate: {hit_rate:.1%}")
+        self.stdout.write(f"Queries saved: {stats['queries_saved']}")
+
+        if options["reset"]:
+            reset_stats()
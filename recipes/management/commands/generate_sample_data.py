@@ -0,0 +1,275 @@
+import datetime
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from faker import Faker
+
+from recipes.models import (
+    Ingredient,
+    MealPlan,
+    Recipe,
+    RecipeStep,
+    Tag,
+    User,
+    get_catalog_item_ids,
+)
+from recipes.search import index_recipes
+from recipes.shopping import rebuild_shopping_lists
+
+DISHES = [
+    "Soup", "Stew", "Salad", "Pie", "Curry", "Casserole", "Tacos", "Pasta",
+    "Bread", "Cake", "Risotto", "Chili", "Stir-Fry", "Sandwich", "Omelette",
+    "Pancakes", "Burgers", "Noodles", "Tart", "Muffins"
+]
+
+ITEMS = [
+    "onion", "garlic", "carrots", "celery", "potatoes", "tomatoes", "olive oil",
+    "butter", "flour", "sugar", "salt", "black pepper", "eggs", "milk",
+    "chicken breast", "ground beef", "rice", "pasta", "black beans",
+    "chickpeas", "spinach", "basil", "parsley", "cumin", "paprika",
+    "chicken stock", "lemon", "lime", "cheddar cheese", "parmesan",
+    "heavy cream", "honey", "soy sauce", "ginger", "bell pepper", "mushrooms",
+    "zucchini", "corn", "oats", "baking powder"
+]
+
+AMOUNTS = [
+    "1", "2", "3", "1/2", "1 cup", "2 cups", "1/2 cup", "1 1/2 cups",
+    "1 tbsp", "2 tbsp", "1 tsp", "1/2 tsp", "1 lb", "200 g", "1 can",
+    "2 cloves", "a pinch", "to taste"
+]
+
+
+class Command(BaseCommand):
+    help = ("Fill the database with realistic-looking users, recipes, tags, "
+            "favorites and meal plans for benchmarking. Rows are inserted in "
+            "bulk, so millions of recipes are practical.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100)
+        parser.add_argument("--recipes", type=int, default=1000)
+        parser.add_argument("--ingredients",
+                            type=int,
+                            default=8,
+                            help="Average ingredients per recipe.")
+        parser.add_argument("--steps",
+                            type=int,
+                            default=6,
+                            help="Average steps per recipe.")
+        parser.add_argument("--tags", type=int, default=200)
+        parser.add_argument("--tags-per-recipe", type=int, default=3)
+        parser.add_argument("--favorites",
+                            type=int,
+                            default=20,
+                            help="Favorites per user.")
+        parser.add_argument("--meal-plans",
+                            type=int,
+                            default=30,
+                            help="Meal plans per user.")
+        parser.add_argument("--recipes-per-plan", type=int, default=3)
+        parser.add_argument("--public-ratio", type=float, default=0.8)
+        parser.add_argument("--password",
+                            default="password",
+                            help="Password for every generated user.")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=None)
+        parser.add_argument(
+            "--skip-index",
+            action="store_true",
+            help="Don't build the search index for the new recipes.")
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options["seed"])
+        self.fake = Faker()
+        if options["seed"] is not None:
+            self.fake.seed_instance(options["seed"])
+        self.batch_size = options["batch_size"]
+
+        # Pools of text to draw from; calling Faker for every one of
+        # millions of rows would dominate the run time.
+        self.titles = [
+            f"{self.fake.word().title()} {self.random.choice(DISHES)}"
+            for _ in range(5000)
+        ]
+        self.sentences = [self.fake.sentence() for _ in range(5000)]
+
+        user_pks = self.step("users", self.create_users, options)
+        tag_pks = self.step("tags", self.create_tags, options)
+        recipe_pks, public_pks = self.step("recipes", self.create_recipes,
+                                           options, user_pks, tag_pks)
+        self.step("favorites", self.create_favorites, options, user_pks,
+                  public_pks)
+        meal_plan_pks = self.step("meal plans", self.create_meal_plans,
+                                  options, user_pks, public_pks)
+        self.reset_sequences()
+
+        self.step("counters", self.in_batches, recipe_pks,
+                  self.refresh_counters)
+        self.step("tag counts", self.in_batches, tag_pks,
+                  self.refresh_tag_counts)
+        self.step("shopping lists", self.in_batches, meal_plan_pks,
+                  rebuild_shopping_lists)
+        if not options["skip_index"]:
+            self.step("search index", self.in_batches, recipe_pks,
+                      index_recipes)
+
+    def step(self, label, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        self.stdout.write(
+            f"{label}: done in {time.perf_counter() - start:.1f}s")
+        return result
+
+    def in_batches(self, pks, function):
+        for start in range(0, len(pks), self.batch_size):
+            with transaction.atomic():
+                function(pks[start:start + self.batch_size])
+
+    def refresh_counters(self, recipe_pks):
+        Recipe.objects.filter(pk__in=recipe_pks).refresh_counters()
+
+    def refresh_tag_counts(self, tag_pks):
+        Tag.objects.filter(pk__in=tag_pks).refresh_recipe_counts()
+
+    def get_next_pk(self, model):
+        return (model.objects.aggregate(max_pk=Max("pk"))["max_pk"] or 0) + 1
+
+    def reset_sequences(self):
+        # Rows were inserted with explicit pks, so bring the database's
+        # sequences up to date (a no-op on SQLite).
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), [User, Recipe, MealPlan])
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+    def create_users(self, options):
+        password = make_password(options["password"])
+        first_pk = self.get_next_pk(User)
+        pks = list(range(first_pk, first_pk + options["users"]))
+        for start in range(0, len(pks), self.batch_size):
+            User.objects.bulk_create([
+                User(pk=pk,
+                     username=f"{self.fake.user_name()}{pk}",
+                     email=f"user{pk}@example.com",
+                     first_name=self.fake.first_name(),
+                     last_name=self.fake.last_name(),
+                     password=password)
+                for pk in pks[start:start + self.batch_size]
+            ])
+        return pks
+
+    def create_tags(self, options):
+        names = set()
+        while len(names) < options["tags"]:
+            name = self.fake.word().lower()
+            if name in names:
+                # Faker only knows so many words.
+                name = f"{name}-{len(names)}"
+            names.add(name)
+        return list(Tag.objects.resolve_names(sorted(names)).values())
+
+    def create_recipes(self, options, user_pks, tag_pks):
+        first_pk = self.get_next_pk(Recipe)
+        pks = list(range(first_pk, first_pk + options["recipes"]))
+        public_pks = []
+        tags_per_recipe = min(options["tags_per_recipe"], len(tag_pks))
+        # Recipes, ingredients and steps come in at about this many rows
+        # per recipe, so scale the batches to keep them a similar size.
+        rows_per_recipe = 1 + options["ingredients"] + options["steps"]
+        batch_size = max(1, self.batch_size // rows_per_recipe)
+        catalog_item_ids = get_catalog_item_ids(ITEMS)
+
+        for start in range(0, len(pks), batch_size):
+            recipes = []
+            ingredients = []
+            steps = []
+            recipe_tags = []
+            for pk in pks[start:start + batch_size]:
+                public = self.random.random() < options["public_ratio"]
+                if public:
+                    public_pks.append(pk)
+                recipe = Recipe(pk=pk,
+                                user_id=self.random.choice(user_pks),
+                                title=self.random.choice(self.titles),
+                                prep_time_in_minutes=self.random.randint(5, 60),
+                                cook_time_in_minutes=self.random.randint(0, 240),
+                                public=public)
+                # Normally set by save(), which bulk_create() skips.
+                recipe.total_time = recipe.total_time_in_minutes()
+                recipes.append(recipe)
+                for _ in range(
+                        self.random.randint(1, options["ingredients"] * 2)):
+                    item = self.random.choice(ITEMS)
+                    ingredients.append(
+                        Ingredient(recipe_id=pk,
+                                   amount=self.random.choice(AMOUNTS),
+                                   item=item,
+                                   catalog_item_id=catalog_item_ids[item]))
+                for order in range(
+                        self.random.randint(1, options["steps"] * 2)):
+                    steps.append(
+                        RecipeStep(recipe_id=pk,
+                                   order=order,
+                                   text=self.random.choice(self.sentences)))
+                recipe_tags.extend(
+                    Recipe.tags.through(recipe_id=pk, tag_id=tag_pk)
+                    for tag_pk in self.random.sample(tag_pks, tags_per_recipe))
+
+            with transaction.atomic():
+                Recipe.objects.bulk_create(recipes)
+                Ingredient.objects.bulk_create(ingredients, batch_size=1000)
+                RecipeStep.objects.bulk_create(steps, batch_size=1000)
+                Recipe.tags.through.objects.bulk_create(recipe_tags,
+                                                        batch_size=1000)
+        return pks, public_pks
+
+    def create_favorites(self, options, user_pks, public_pks):
+        favorites_per_user = min(options["favorites"], len(public_pks))
+        favorites = []
+        for user_pk in user_pks:
+            favorites.extend(
+                Recipe.favorited_by.through(user_id=user_pk, recipe_id=pk)
+                for pk in self.random.sample(public_pks, favorites_per_user))
+            if len(favorites) >= self.batch_size:
+                Recipe.favorited_by.through.objects.bulk_create(favorites)
+                favorites = []
+        Recipe.favorited_by.through.objects.bulk_create(favorites)
+
+    def create_meal_plans(self, options, user_pks, public_pks):
+        today = datetime.date.today()
+        dates = [today - datetime.timedelta(days=days) for days in range(365)]
+        plans_per_user = min(options["meal_plans"], len(dates))
+        recipes_per_plan = min(options["recipes_per_plan"], len(public_pks))
+
+        next_pk = self.get_next_pk(MealPlan)
+        pks = []
+        meal_plans = []
+        planned_recipes = []
+        for user_pk in user_pks:
+            for date in self.random.sample(dates, plans_per_user):
+                meal_plans.append(
+                    MealPlan(pk=next_pk, user_id=user_pk, date=date))
+                planned_recipes.extend(
+                    MealPlan.recipes.through(mealplan_id=next_pk,
+                                             recipe_id=pk)
+                    for pk in self.random.sample(public_pks,
+                                                 recipes_per_plan))
+                pks.append(next_pk)
+                next_pk += 1
+            if len(planned_recipes) >= self.batch_size:
+                self.insert_meal_plans(meal_plans, planned_recipes)
+                meal_plans = []
+                planned_recipes = []
+        self.insert_meal_plans(meal_plans, planned_recipes)
+        return pks
+
+    def insert_meal_plans(self, meal_plans, planned_recipes):
+        with transaction.atomic():
+            MealPlan.objects.bulk_create(meal_plans, batch_size=1000)
+            MealPlan.recipes.through.objects.bulk_create(planned_recipes,
+                                                         batch_size=1000)
@@ -0,0 +1,60 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.importer import BATCH_SIZE, READERS, import_recipes
+from recipes.models import User
+
+
+class Command(BaseCommand):
+    help = "Import recipes from a JSON Lines or CSV file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path",
+                            help="File to read from, or - for standard input.")
+        parser.add_argument("--user",
+                            required=True,
+                            help="Username that will own the recipes.")
+        parser.add_argument(
+            "--format",
+            choices=READERS,
+            help="Input format. Defaults to the file's extension.",
+        )
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["user"])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['user']!r}.")
+
+        path = options["path"]
+        format = options["format"] or path.rpartition(".")[2].lower()
+        if format not in READERS:
+            raise CommandError(
+                "Can't tell the input format; pass --format=jsonl or csv.")
+
+        if path == "-":
+            result = self.run(sys.stdin, user, format, options)
+        else:
+            with open(path, newline="", encoding="utf-8") as stream:
+                result = self.run(stream, user, format, options)
+
+        for line_number, errors in result.errors:
+            self.stderr.write(f"Line {line_number}: {errors}")
+        self.stdout.write(
+            f"Imported {result.imported} of {result.processed} row(s) in "
+            f"{result.elapsed:.1f}s ({result.rows_per_second:.0f} rows/s); "
+            f"{result.failed} failed.")
+
+    def run(self, stream, user, format, options):
+        return import_recipes(stream,
+                              user,
+                              format=format,
+                              batch_size=options["batch_size"],
+                              progress=self.report_progress)
+
+    def report_progress(self, result):
+        self.stderr.write(
+            f"{result.processed} rows, {result.imported} imported, "
+            f"{result.failed} failed ({result.rows_per_second:.0f} rows/s)")
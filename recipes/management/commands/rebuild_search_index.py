@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+from recipes.search import index_recipes
+
+
+class Command(BaseCommand):
+    help = "Rebuild the recipe search index from scratch."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.order_by("pk").values_list("pk", flat=True)
+        last_pk = 0
+        indexed = 0
+        while True:
+            recipe_pks = list(
+                recipes.filter(pk__gt=last_pk)[:options["batch_size"]])
+            if not recipe_pks:
+                break
+            index_recipes(recipe_pks)
+            last_pk = recipe_pks[-1]
+            indexed += len(recipe_pks)
+
+        self.stdout.write(f"Indexed {indexed} recipe(s).")
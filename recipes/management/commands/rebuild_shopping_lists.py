@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import MealPlan
+from recipes.shopping import rebuild_shopping_lists
+
+
+class Command(BaseCommand):
+    help = "Rebuild every meal plan's stored shopping list from scratch."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        meal_plans = MealPlan.objects.order_by("pk").values_list("pk",
+                                                                 flat=True)
+        last_pk = 0
+        rebuilt = 0
+        while True:
+            meal_plan_ids = list(
+                meal_plans.filter(pk__gt=last_pk)[:options["batch_size"]])
+            if not meal_plan_ids:
+                break
+            rebuild_shopping_lists(meal_plan_ids)
+            last_pk = meal_plan_ids[-1]
+            rebuilt += len(meal_plan_ids)
+
+        self.stdout.write(f"Rebuilt {rebuilt} meal plan shopping list(s).")
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe, fork_count_expression
+
+COUNTERS = ("times_favorited", "times_cooked", "first_cooked")
+
+
+class Command(BaseCommand):
+    help = ("Recompute the stored favorite, meal plan and fork counters on "
+            "every recipe and fix any that have drifted.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report drifted recipes without updating them.",
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.with_actual_counters().annotate(
+            actual_fork_count=fork_count_expression()).order_by("pk")
+        fields = ["pk"]
+        for counter in COUNTERS + ("fork_count", ):
+            fields.extend([counter, f"actual_{counter}"])
+
+        last_pk = 0
+        drifted = 0
+        while True:
+            rows = list(
+                recipes.filter(pk__gt=last_pk).values(
+                    *fields)[:options["batch_size"]])
+            if not rows:
+                break
+            last_pk = rows[-1]["pk"]
+
+            drifted_pks = [
+                row["pk"] for row in rows if any(
+                    row[counter] != row[f"actual_{counter}"]
+                    for counter in COUNTERS)
+            ]
+            drifted_fork_pks = [
+                row["pk"] for row in rows
+                if row["fork_count"] != row["actual_fork_count"]
+            ]
+            if not options["dry_run"]:
+                # Favorites may have been written without telling the
+                # recommender either, so have it recompute these too.
+                if drifted_pks:
+                    Recipe.objects.filter(
+                        pk__in=drifted_pks).favorites_changed()
+                if drifted_fork_pks:
+                    Recipe.objects.filter(
+                        pk__in=drifted_fork_pks).refresh_fork_counts()
+            drifted += len(set(drifted_pks) | set(drifted_fork_pks))
+
+        verb = "Found" if options["dry_run"] else "Fixed"
+        self.stdout.write(
+            f"{verb} {drifted} recipe(s) with drifted counters.")
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from recipes.recommendations import update_recommendations
+
+
+class Command(BaseCommand):
+    help = ("Update the \"people who favorited this also favorited\" "
+            "recommendations of public recipes. Only recipes whose favorites "
+            "changed since the last run are recomputed unless --full is "
+            "given.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--full",
+                            action="store_true",
+                            help="Recompute every recipe from scratch.")
+
+    def handle(self, *args, **options):
+        changed, updated = update_recommendations(
+            full=options["full"], batch_size=options["batch_size"])
+        self.stdout.write(
+            f"{changed} recipe(s) had new favorites; updated the "
+            f"recommendations of {updated} recipe(s).")
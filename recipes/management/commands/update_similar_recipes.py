@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from recipes.similarity import update_similar_recipes
+
+
+class Command(BaseCommand):
+    help = ("Update the precomputed similar recipes of public recipes. Only "
+            "recipes that changed since the last run are recomputed unless "
+            "--full is given.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--full",
+                            action="store_true",
+                            help="Recompute every recipe from scratch.")
+
+    def handle(self, *args, **options):
+        signed, updated = update_similar_recipes(
+            full=options["full"], batch_size=options["batch_size"])
+        self.stdout.write(
+            f"Updated {signed} signature(s) and the similar recipes of "
+            f"{updated} recipe(s).")
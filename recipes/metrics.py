@@ -0,0 +1,277 @@
+"""
+Lightweight per-view request metrics.
+
+MetricsMiddleware times every request and the database queries and
+template rendering done while handling it, and adds the results to
+in-process histograms labelled with the request's URL name. The
+metrics view exposes the histograms in the Prometheus text format.
+
+Histograms live in the memory of each worker process, so scrape every
+worker (or run one per instance) to see the whole picture. Queries slower
+than SLOW_QUERY_THRESHOLD_MS are logged to the "recipes.slow_queries"
+logger along with the view that ran them.
+"""
+import asyncio
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+from django.template.backends.django import DjangoTemplates
+
+logger = logging.getLogger("recipes.slow_queries")
+
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1,
+                2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+UNRESOLVED_VIEW = "<unresolved>"
+
+# The stats of the request being handled in the current thread or task.
+current_request = ContextVar("current_request", default=None)
+
+
+class Histogram:
+    """
+    A Prometheus-style histogram: counts of observations per bucket, plus
+    their total and count.
+    """
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.bucket_counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        total = 0
+        for count in self.bucket_counts:
+            total += count
+            yield total
+
+
+class MetricFamily:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.histograms = {}
+
+    def observe(self, view_name, value):
+        histogram = self.histograms.get(view_name)
+        if histogram is None:
+            histogram = self.histograms.setdefault(view_name,
+                                                   Histogram(self.buckets))
+        histogram.observe(value)
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} histogram",
+        ]
+        for view_name, histogram in sorted(self.histograms.items()):
+            label = escape_label(view_name)
+            bounds = [str(bound) for bound in self.buckets] + ["+Inf"]
+            for bound, count in zip(bounds, histogram.cumulative_counts()):
+                lines.append(
+                    f'{self.name}_bucket{{view="{label}",le="{bound}"}} '
+                    f'{count}')
+            lines.append(f'{self.name}_sum{{view="{label}"}} {histogram.sum}')
+            lines.append(
+                f'{self.name}_count{{view="{label}"}} {histogram.count}')
+        return lines
+
+
+REQUEST_DURATION = MetricFamily("recipes_request_duration_seconds",
+                                "Time taken to handle each request.",
+                                TIME_BUCKETS)
+DB_QUERIES = MetricFamily("recipes_request_db_queries",
+                          "Database queries run by each request.",
+                          COUNT_BUCKETS)
+DB_DURATION = MetricFamily("recipes_request_db_duration_seconds",
+                           "Time spent in database queries by each request.",
+                           TIME_BUCKETS)
+TEMPLATE_DURATION = MetricFamily(
+    "recipes_request_template_duration_seconds",
+    "Time spent rendering templates by each request.", TIME_BUCKETS)
+
+METRIC_FAMILIES = (REQUEST_DURATION, DB_QUERIES, DB_DURATION,
+                   TEMPLATE_DURATION)
+
+lock = threading.Lock()
+
+
+def escape_label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def get_view_name(request):
+    resolver_match = getattr(request, "resolver_match", None)
+    if resolver_match is None:
+        return UNRESOLVED_VIEW
+    return resolver_match.view_name
+
+
+class RequestStats:
+    def __init__(self, request):
+        self.request = request
+        self.db_queries = 0
+        self.db_time = 0
+        self.template_time = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        """
+        Time a query; see time_query().
+        """
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.db_queries += 1
+            self.db_time += elapsed
+            if elapsed * 1000 >= settings.SLOW_QUERY_THRESHOLD_MS:
+                logger.warning("Slow query (%.1fms) in %s: %s",
+                               elapsed * 1000, get_view_name(self.request),
+                               sql)
+
+
+def time_query(execute, sql, params, many, context):
+    """
+    Time a query for the request being handled, if any. Installed on every
+    database connection, since under ASGI a request's queries run in
+    sync_to_async() threads rather than the one the middleware runs in.
+    """
+    stats = current_request.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_query_timer(connection, **kwargs):
+    """
+    Add time_query() to the execute wrappers of each new database
+    connection.
+    """
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Tell Django to await this instance; see
+            # django.utils.deprecation.MiddlewareMixin.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        stats = RequestStats(request)
+        token = current_request.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            elapsed = time.perf_counter() - start
+            current_request.reset(token)
+        self.record(request, stats, elapsed)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats(request)
+        token = current_request.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            elapsed = time.perf_counter() - start
+            current_request.reset(token)
+        self.record(request, stats, elapsed)
+        return response
+
+    def record(self, request, stats, elapsed):
+        view_name = get_view_name(request)
+        with lock:
+            REQUEST_DURATION.observe(view_name, elapsed)
+            DB_QUERIES.observe(view_name, stats.db_queries)
+            DB_DURATION.observe(view_name, stats.db_time)
+            TEMPLATE_DURATION.observe(view_name, stats.template_time)
+
+
+class TimedTemplate:
+    """
+    Wrap a template backend's Template to add its render time to the
+    current request's stats.
+    """
+    def __init__(self, template):
+        self._template = template
+
+    def __getattr__(self, name):
+        return getattr(self._template, name)
+
+    def render(self, context=None, request=None):
+        stats = current_request.get()
+        if stats is None:
+            return self._template.render(context, request)
+
+        start = time.perf_counter()
+        try:
+            return self._template.render(context, request)
+        finally:
+            stats.template_time += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    The Django template backend, with render times recorded for
+    MetricsMiddleware.
+    """
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+def reset_metrics():
+    with lock:
+        for family in METRIC_FAMILIES:
+            family.histograms.clear()
+
+
+def render_metrics():
+    with lock:
+        lines = []
+        for family in METRIC_FAMILIES:
+            lines.extend(family.render())
+    return "\n".join(lines) + "\n"
+
+
+def metrics(request):
+    """
+    Serve the collected metrics in the Prometheus text format. If the
+    METRICS_TOKEN setting is set, requests must send it as a bearer token.
+    """
+    if settings.METRICS_TOKEN and (request.headers.get("Authorization") !=
+                                   f"Bearer {settings.METRICS_TOKEN}"):
+        return HttpResponseForbidden()
+
+    return HttpResponse(render_metrics(),
+                        content_type="text/plain; version=0.0.4")
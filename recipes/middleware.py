@@ -0,0 +1,34 @@
+import asyncio
+
+from whitenoise import middleware
+
+
+class WhiteNoiseMiddleware(middleware.WhiteNoiseMiddleware):
+    """
+    WhiteNoise's middleware, which can also run in an async middleware
+    stack so that async views stay on the event loop under ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Tell Django to await this instance; see
+            # django.utils.deprecation.MiddlewareMixin.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        # Static files are served straight from WhiteNoise's in-memory
+        # table (the filesystem is only searched with autorefresh on, in
+        # development); anything else gets the awaitable from get_response.
+        response = super().__call__(request)
+        if asyncio.iscoroutine(response):
+            response = await response
+        return response
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.14 on 2026-10-17 22:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_remove_recipe_photo'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['title', 'id'], name='recipes_rec_title_3771db_idx'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 3.1.14 on 2026-10-17 22:49
+
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Recipe = apps.get_model("recipes", "Recipe")
+    MealPlan = apps.get_model("recipes", "MealPlan")
+
+    def per_recipe(through, aggregate):
+        return Subquery(
+            through.objects.filter(recipe=OuterRef("pk")).order_by().values(
+                "recipe").annotate(value=aggregate).values("value")[:1])
+
+    Recipe.objects.update(
+        times_favorited=Coalesce(
+            per_recipe(Recipe.favorited_by.through, Count("pk")), 0),
+        times_cooked=Coalesce(per_recipe(MealPlan.recipes.through, Count("pk")),
+                              0),
+        first_cooked=per_recipe(MealPlan.recipes.through,
+                                Min("mealplan__date")),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_recipe_title_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='first_cooked',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='times_cooked',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='times_favorited',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
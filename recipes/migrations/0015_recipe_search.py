@@ -0,0 +1,44 @@
+# Generated by Django 3.1.14 on 2026-10-17 22:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def add_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(
+        "ALTER TABLE recipes_recipe ADD COLUMN search_vector tsvector")
+    schema_editor.execute(
+        "CREATE INDEX recipes_recipe_search_vector_idx ON recipes_recipe "
+        "USING GIN (search_vector)")
+
+
+def remove_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(
+        "ALTER TABLE recipes_recipe DROP COLUMN search_vector")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchPosting',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=100)),
+                ('weight', models.PositiveIntegerField()),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_postings', to='recipes.recipe')),
+            ],
+            options={
+                'unique_together': {('term', 'recipe')},
+            },
+        ),
+        migrations.RunPython(add_search_vector, remove_search_vector),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 3.1.14 on 2026-10-17 22:56
+
+import random
+
+from django.db import migrations, models
+import recipes.models
+
+
+def randomize_existing_keys(apps, schema_editor):
+    # AddField gives every existing row the same default, so draw a fresh
+    # key per recipe.
+    Recipe = apps.get_model("recipes", "Recipe")
+    recipes = []
+    for recipe in Recipe.objects.only("pk").iterator(chunk_size=1000):
+        recipe.random_key = random.random()
+        recipes.append(recipe)
+        if len(recipes) == 1000:
+            Recipe.objects.bulk_update(recipes, ["random_key"])
+            recipes = []
+    Recipe.objects.bulk_update(recipes, ["random_key"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0016_recipe_cache_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='random_key',
+            field=models.FloatField(db_index=True, default=recipes.models.make_random_key, editable=False),
+        ),
+        migrations.RunPython(randomize_existing_keys,
+                             migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['user', 'random_key'], name='recipes_rec_user_id_549c8e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['public', 'random_key'], name='recipes_rec_public_698684_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.1.14 on 2026-10-17 23:02
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0017_recipe_random_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('item', models.CharField(max_length=255)),
+                ('unit', models.CharField(blank=True, max_length=20)),
+                ('quantity', models.DecimalField(blank=True, decimal_places=4, max_digits=12, null=True)),
+                ('meal_plan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list_items', to='recipes.mealplan')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list_items', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='shoppinglistitem',
+            index=models.Index(fields=['user', 'date', 'item', 'unit'], name='recipes_sho_user_id_79c6f4_idx'),
+        ),
+    ]
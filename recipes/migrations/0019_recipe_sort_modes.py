@@ -0,0 +1,63 @@
+# Generated by Django 3.1.14 on 2026-10-17 23:16
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_total_time(apps, schema_editor):
+    # NULL if either time is NULL, just like Recipe.total_time_in_minutes().
+    Recipe = apps.get_model("recipes", "Recipe")
+    Recipe.objects.update(total_time=F("prep_time_in_minutes") +
+                          F("cook_time_in_minutes"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0018_shopping_list'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='total_time',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(fill_total_time, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['public', 'title', 'id'], name='recipes_rec_public_820b3b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['public', 'id'], name='recipes_rec_public_8019fc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['times_favorited', 'id'], name='recipes_rec_times_f_2b062c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['public', 'times_favorited', 'id'], name='recipes_rec_public_a0c126_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['times_cooked', 'id'], name='recipes_rec_times_c_a79ce4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['public', 'times_cooked', 'id'], name='recipes_rec_public_ef7c73_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['total_time', 'id'], name='recipes_rec_total_t_b34f52_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['public', 'total_time', 'id'], name='recipes_rec_public_8da8a9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['user', 'title', 'id'], name='recipes_rec_user_id_0ea1ad_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 3.1.14 on 2026-10-17 23:19
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counts(apps, schema_editor):
+    Recipe = apps.get_model("recipes", "Recipe")
+    Tag = apps.get_model("recipes", "Tag")
+    public_recipes = Recipe.tags.through.objects.filter(
+        tag=OuterRef("pk"), recipe__public=True).order_by().values(
+            "tag").annotate(count=Count("pk")).values("count")[:1]
+    Tag.objects.update(
+        public_recipe_count=Coalesce(Subquery(public_recipes), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0019_recipe_sort_modes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='public_recipe_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_counts, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['-public_recipe_count', 'tag'], name='recipes_tag_public__048875_idx'),
+        ),
+    ]
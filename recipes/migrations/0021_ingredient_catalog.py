@@ -0,0 +1,31 @@
+# Generated by Django 3.1.14 on 2026-10-17 23:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0020_tag_public_recipe_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='catalog_item',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ingredients', to='recipes.catalogitem'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='pantry_items',
+            field=models.ManyToManyField(blank=True, related_name='_user_pantry_items_+', to='recipes.CatalogItem'),
+        ),
+    ]
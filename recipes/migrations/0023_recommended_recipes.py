@@ -0,0 +1,43 @@
+# Generated by Django 3.1.14 on 2026-10-17 23:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0022_similar_recipes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommendationState',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='recommendation_state', serialize=False, to='recipes.recipe')),
+                ('favorites_version', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='RecommendedRecipe',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommended_recipe_links', to='recipes.recipe')),
+                ('recommended', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='recipes.recipe')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='recommendedrecipe',
+            index=models.Index(fields=['recipe', '-score', 'recommended'], name='recipes_rec_recipe__380553_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='recommendedrecipe',
+            unique_together={('recipe', 'recommended')},
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 3.1.14 on 2026-10-17 23:39
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_fork_counts(apps, schema_editor):
+    Recipe = apps.get_model("recipes", "Recipe")
+    forks = Recipe.objects.filter(original_recipe=OuterRef(
+        "pk")).order_by().values("original_recipe").annotate(
+            count=Count("pk")).values("count")[:1]
+    originals = Recipe.objects.filter(
+        original_recipe__isnull=False).values("original_recipe")
+    Recipe.objects.filter(pk__in=originals).update(
+        fork_count=Coalesce(Subquery(forks), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0023_recommended_recipes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='fork_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_fork_counts, migrations.RunPython.noop),
+    ]
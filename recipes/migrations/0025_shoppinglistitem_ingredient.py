@@ -0,0 +1,57 @@
+# Generated by Django 3.1.14 on 2026-10-18 00:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def delete_shopping_list_items(apps, schema_editor):
+    ShoppingListItem = apps.get_model("recipes", "ShoppingListItem")
+    ShoppingListItem.objects.all().delete()
+
+
+def rebuild_shopping_lists(apps, schema_editor):
+    from recipes.shopping import make_shopping_list_item
+
+    Ingredient = apps.get_model("recipes", "Ingredient")
+    ShoppingListItem = apps.get_model("recipes", "ShoppingListItem")
+    ingredients = Ingredient.objects.filter(
+        recipe__meal_plans__isnull=False).values_list(
+            "recipe__meal_plans", "recipe__meal_plans__user",
+            "recipe__meal_plans__date", "pk", "amount", "item")
+    items = []
+    for row in ingredients.iterator():
+        item = make_shopping_list_item(*row)
+        items.append(
+            ShoppingListItem(meal_plan_id=item.meal_plan_id,
+                             user_id=item.user_id,
+                             date=item.date,
+                             ingredient_id=item.ingredient_id,
+                             item=item.item,
+                             unit=item.unit,
+                             quantity=item.quantity))
+        if len(items) == 1000:
+            ShoppingListItem.objects.bulk_create(items)
+            items = []
+    ShoppingListItem.objects.bulk_create(items)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0024_recipe_fork_count'),
+    ]
+
+    operations = [
+        # The stored items were merged per meal plan; they are rebuilt with
+        # one row per ingredient below.
+        migrations.RunPython(delete_shopping_list_items,
+                             migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='shoppinglistitem',
+            name='ingredient',
+            field=models.ForeignKey(default=0, on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list_items', to='recipes.ingredient'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(rebuild_shopping_lists,
+                             delete_shopping_list_items),
+    ]
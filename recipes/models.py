@@ -1,17 +1,209 @@
+import datetime
+import random
+
 from django.contrib.auth.models import AbstractUser
-from django.db import models
-from django.db.models import Q
+from django.core.cache import cache
+from django.db import connection, models, transaction
+from django.db.models import (
+    BooleanField,
+    Case,
+    Count,
+    Exists,
+    F,
+    Max,
+    Min,
+    OuterRef,
+    Q,
+    Subquery,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce
 from ordered_model.models import OrderedModel
 
+from .lru import LRUCache
+from .prefix_index import PrefixIndex
+
+# Maps tag names to Tag pks. Kept current in this process by
+# recipes.signals; the TTL bounds staleness from other processes.
+tag_id_cache = LRUCache(maxsize=10000, ttl=300)
+
+# Maps ingredient catalog names to CatalogItem pks, like tag_id_cache.
+catalog_item_id_cache = LRUCache(maxsize=10000, ttl=300)
+
+# Every tag name, for autocomplete. Kept current the same way.
+tag_name_index = PrefixIndex(
+    load=lambda: Tag.objects.values_list("pk", "tag").iterator(), ttl=300)
+
+
+FAVORITE_IDS_CACHE_TIMEOUT = 60 * 60
+
+# The largest value an AutoField pk (or an IntegerField) can hold in every
+# database we run on.
+MAX_PK = 2**31 - 1
+
+# How many random pks RecipeQuerySet.random() looks up before falling back
+# to `random_key`.
+RANDOM_PICK_DRAWS = 100
+
+# How many copies away lineage queries look. A cycle of `original_recipe`
+# links (which only the admin can create) is walked round until this
+# depth, so the queries keep each recipe at the depth it is first met.
+MAX_LINEAGE_DEPTH = 100
+
+
+class RecipeChanged(Exception):
+    """
+    Raised when a recipe has been changed since the version a change was
+    based on.
+    """
+
+
+def parse_pk(value):
+    """
+    Return `value` as a pk, raising ValueError if it isn't one.
+    """
+    pk = int(value)
+    if not 0 < pk <= MAX_PK:
+        raise ValueError("Invalid pk.")
+    return pk
+
+
+def make_random_key():
+    return random.random()
+
+
+def make_favorite_ids_key(user_pk):
+    return f"user:{user_pk}:favorite_recipe_ids"
+
 
 class User(AbstractUser):
+    # The ingredients the user has at home, for recipes.pantry.
+    pantry_items = models.ManyToManyField(to="CatalogItem",
+                                          related_name="+",
+                                          blank=True)
+
     def is_favorite_recipe(self, recipe):
-        return self.favorite_recipes.filter(pk=recipe.pk).count() == 1
+        return recipe.pk in self.get_favorite_recipe_ids()
+
+    def get_favorite_recipe_ids(self):
+        """
+        Return the set of pks of this user's favorite recipes, from the
+        cache if possible.
+        """
+        key = make_favorite_ids_key(self.pk)
+        recipe_ids = cache.get(key)
+        if recipe_ids is None:
+            recipe_ids = set(
+                self.favorite_recipes.values_list("pk", flat=True))
+            cache.set(key, recipe_ids, FAVORITE_IDS_CACHE_TIMEOUT)
+        return recipe_ids
+
+    def toggle_favorite_recipe(self, recipe):
+        """
+        Favorite `recipe` if it isn't a favorite yet and unfavorite it if
+        it is, and return whether it is now a favorite.
+
+        This tries a DELETE first and only INSERTs if nothing was deleted,
+        instead of loading the user's favorites to check. The cached
+        favorite ids are dropped once the change is committed, rather
+        than edited, so that two toggles at once can't write back stale
+        sets.
+        """
+        through = Recipe.favorited_by.through
+        with transaction.atomic():
+            deleted, _ = through.objects.filter(user=self,
+                                                recipe=recipe).delete()
+            if not deleted:
+                through.objects.bulk_create(
+                    [through(user=self, recipe=recipe)],
+                    ignore_conflicts=True)
+            # Neither query sends m2m_changed, so update the counters here.
+            Recipe.objects.filter(pk=recipe.pk).favorites_changed()
+
+        key = make_favorite_ids_key(self.pk)
+        transaction.on_commit(lambda: cache.delete(key))
+        return not deleted
+
+
+class TagQuerySet(models.QuerySet):
+    def resolve_names(self, tag_names, create=True, verify=False):
+        """
+        Given a list of tag names, return a dict mapping each name to its
+        Tag's pk, creating any tags that do not exist yet unless `create`
+        is False (in which case unknown names are left out).
+
+        Names are served from `tag_id_cache` where possible and the rest
+        are looked up and created in bulk, so this costs at most three
+        queries however many names are given.
+
+        The cache is per process, so another worker may have deleted or
+        renamed a cached tag since. Pass `verify=True` when the pks are
+        about to be written to the database: every name is then looked up
+        in the database, which costs one indexed query like checking the
+        cached pks would, and the cache is refreshed from the result.
+        """
+        tag_ids = {} if verify else tag_id_cache.get_many(tag_names)
+        missing = [name for name in tag_names if name not in tag_ids]
+        if missing:
+            found = dict(self.filter(tag__in=missing).values_list("tag", "pk"))
+            new_names = [name for name in missing if name not in found]
+            if new_names and create:
+                # Another request may create the same tags concurrently, so
+                # ignore conflicts and read back the winners' pks.
+                self.bulk_create([Tag(tag=name) for name in new_names],
+                                 ignore_conflicts=True)
+                found.update(
+                    self.filter(tag__in=new_names).values_list("tag", "pk"))
+            def update_caches():
+                tag_id_cache.set_many(found)
+                # bulk_create() skips post_save, so add new names here.
+                tag_name_index.add_many(
+                    {pk: name
+                     for name, pk in found.items()})
+
+            # Only cache pks once they are committed, so a rollback can't
+            # leave the cache pointing at tags that don't exist.
+            transaction.on_commit(update_caches)
+            tag_ids.update(found)
+        return tag_ids
+
+    def refresh_recipe_counts(self):
+        """
+        Recompute the stored public recipe counts of these tags in a
+        single UPDATE.
+        """
+        public_recipes = Recipe.tags.through.objects.filter(
+            tag=OuterRef("pk"), recipe__public=True).order_by().values(
+                "tag").annotate(count=Count("pk")).values("count")[:1]
+        return self.update(
+            public_recipe_count=Coalesce(Subquery(public_recipes), 0))
+
+    def count_recipe(self, recipe_pk, delta):
+        """
+        Add `delta` to the stored public recipe counts of these tags if
+        the recipe `recipe_pk` is public, in a single UPDATE that reads
+        its `public` flag from the database.
+        """
+        return self.filter(
+            Exists(Recipe.objects.filter(pk=recipe_pk, public=True))).update(
+                public_recipe_count=F("public_recipe_count") + delta)
 
 
 class Tag(models.Model):
+    objects = TagQuerySet.as_manager()
+
     tag = models.CharField(max_length=100, unique=True)
 
+    # Denormalized for the tag cloud and kept current by recipes.signals.
+    public_recipe_count = models.PositiveIntegerField(default=0,
+                                                      editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-public_recipe_count", "tag"]),
+        ]
+
     def __str__(self):
         return self.tag
 
@@ -27,6 +219,186 @@ class RecipeQuerySet(models.QuerySet):
     def public(self):
         return self.filter(public=True)
 
+    def with_details(self, user, prefetch=True):
+        """
+        Load everything the recipe detail page shows in a fixed number of
+        queries: the recipe with its owner and original recipe, then one
+        query each for its tags, ingredients and ordered steps.
+
+        Each recipe is also annotated with `is_user_favorite` for `user`.
+
+        Pass `prefetch=False` when the tags, ingredients and steps will
+        usually come from the fragment cache, so that they are only
+        queried on a cache miss.
+        """
+        recipes = self.select_related("user", "original_recipe")
+        if prefetch:
+            recipes = recipes.prefetch_related("tags", "ingredients",
+                                               "steps")
+
+        if user.is_authenticated:
+            is_user_favorite = Exists(
+                Recipe.favorited_by.through.objects.filter(
+                    recipe=OuterRef("pk"), user=user))
+        else:
+            is_user_favorite = Value(False, output_field=BooleanField())
+        return recipes.annotate(is_user_favorite=is_user_favorite)
+
+    def with_actual_counters(self):
+        """
+        Annotate each recipe with its favorite and meal plan counters as
+        computed from the M2M tables, named `actual_<counter>`.
+        """
+        return self.annotate(**{
+            f"actual_{name}": expression
+            for name, expression in counter_expressions().items()
+        })
+
+    def bump_cache_version(self):
+        """
+        Invalidate the cached page fragments for these recipes.
+        """
+        return self.update(cache_version=F("cache_version") + 1)
+
+    def refresh_counters(self):
+        """
+        Recompute the stored favorite and meal plan counters for these
+        recipes in a single UPDATE.
+        """
+        return self.update(**counter_expressions())
+
+    def refresh_fork_counts(self):
+        """
+        Recompute the stored fork counts of these recipes in a single
+        UPDATE.
+        """
+        return self.update(fork_count=fork_count_expression())
+
+    def favorites_changed(self):
+        """
+        Refresh the counters of these recipes after their favorites have
+        changed, and bump their `favorites_version` so that the next
+        update_recommendations run recomputes them, in a single UPDATE.
+        """
+        return self.update(favorites_version=F("favorites_version") + 1,
+                           **counter_expressions())
+
+    def random(self):
+        """
+        Return one of these recipes chosen uniformly at random, or None if
+        there are none.
+
+        Rather than sorting the whole result set with ORDER BY RANDOM(),
+        this draws RANDOM_PICK_DRAWS random pks between the smallest and
+        largest pk of these recipes, looks them all up in one query and
+        takes the first draw that is one of these recipes. Every recipe is
+        as likely to be hit as any other.
+
+        If these recipes are too sparse among those pks for any draw to
+        hit, this takes the first recipe at or after a random point in
+        `random_key` instead. That favours recipes after a wide gap between
+        keys, so the recipe it takes gets a new key and doesn't stay
+        favoured.
+        """
+        bounds = self.aggregate(first_pk=Min("pk"), last_pk=Max("pk"))
+        if bounds["first_pk"] is None:
+            return None
+
+        draws = [
+            random.randint(bounds["first_pk"], bounds["last_pk"])
+            for _ in range(RANDOM_PICK_DRAWS)
+        ]
+        recipes = self.in_bulk(set(draws))
+        for pk in draws:
+            if pk in recipes:
+                return recipes[pk]
+
+        recipes = self.order_by("random_key")
+        point = random.random()
+        recipe = (recipes.filter(random_key__gte=point).first()
+                  or recipes.filter(random_key__lt=point).first())
+        if recipe is not None:
+            Recipe.objects.filter(pk=recipe.pk).update(
+                random_key=make_random_key())
+        return recipe
+
+    def bulk_insert(self, recipes):
+        """
+        Insert new `recipes` and set their pks, with a single INSERT where
+        the database can return the new pks (PostgreSQL) and a save() per
+        recipe otherwise. Either way the recipes are queued for search
+        indexing and the fork counts of their originals are refreshed.
+        """
+        from .search import reindex_on_commit
+
+        if connection.features.can_return_rows_from_bulk_insert:
+            for recipe in recipes:
+                # bulk_create() skips save(), which keeps this current.
+                recipe.total_time = recipe.total_time_in_minutes()
+            self.bulk_create(recipes)
+            # bulk_create() skips post_save, so do its work here.
+            reindex_on_commit(recipe.pk for recipe in recipes)
+            Recipe.objects.filter(pk__in={
+                recipe.original_recipe_id
+                for recipe in recipes if recipe.original_recipe_id is not None
+            }).refresh_fork_counts()
+        else:
+            for recipe in recipes:
+                recipe.save()
+        return recipes
+
+    def fork_for(self, user):
+        """
+        Copy these recipes, with their ingredients, steps and tags, to
+        `user` in a single transaction and return the copies.
+
+        Children are written with one bulk INSERT per table no matter how
+        many recipes are copied. Step orders are assigned up front instead
+        of being looked up row by row.
+        """
+        originals = list(
+            self.order_by("pk").prefetch_related("ingredients", "steps",
+                                                 "tags"))
+        copies = [
+            Recipe(
+                title=original.title + " (Copy)",
+                prep_time_in_minutes=original.prep_time_in_minutes,
+                cook_time_in_minutes=original.cook_time_in_minutes,
+                user=user,
+                original_recipe=original,
+            ) for original in originals
+        ]
+
+        with transaction.atomic():
+            Recipe.objects.bulk_insert(copies)
+
+            ingredients = []
+            steps = []
+            recipe_tags = []
+            for original, copy in zip(originals, copies):
+                ingredients.extend(
+                    Ingredient(recipe=copy,
+                               amount=ingredient.amount,
+                               item=ingredient.item,
+                               catalog_item_id=ingredient.catalog_item_id)
+                    for ingredient in original.ingredients.all())
+                steps.extend(
+                    RecipeStep(recipe=copy, text=step.text, order=order)
+                    for order, step in enumerate(original.steps.all()))
+                recipe_tags.extend(
+                    Recipe.tags.through(recipe=copy, tag=tag)
+                    for tag in original.tags.all())
+
+            Ingredient.objects.bulk_create(ingredients, batch_size=1000)
+            RecipeStep.objects.bulk_create(steps, batch_size=1000)
+            Recipe.tags.through.objects.bulk_create(recipe_tags,
+                                                    batch_size=1000)
+            Tag.objects.filter(
+                pk__in={recipe_tag.tag_id
+                        for recipe_tag in recipe_tags}).refresh_recipe_counts()
+
+        return copies
+
 
 class Recipe(models.Model):
     objects = RecipeQuerySet.as_manager()
@@ -47,6 +419,81 @@ class Recipe(models.Model):
                                           related_name="favorite_recipes",
                                           blank=True)
 
+    # Denormalized from `favorited_by` and `meal_plans` and kept current by
+    # the m2m_changed receivers in recipes.signals.
+    times_favorited = models.PositiveIntegerField(default=0, editable=False)
+    times_cooked = models.PositiveIntegerField(default=0, editable=False)
+    first_cooked = models.DateField(null=True, blank=True, editable=False)
+
+    # How many recipes were copied from this one. Kept current by
+    # RecipeQuerySet.fork_for() and recipes.signals.
+    fork_count = models.PositiveIntegerField(default=0, editable=False)
+
+    # Denormalized from total_time_in_minutes() by save() so the recipe
+    # list can sort on it with an index.
+    total_time = models.PositiveIntegerField(null=True,
+                                             blank=True,
+                                             editable=False)
+
+    # Part of the key for this recipe's cached page fragments. Bumped by
+    # recipes.signals whenever the recipe's content changes.
+    cache_version = models.PositiveIntegerField(default=1, editable=False)
+
+    # Bumped by RecipeQuerySet.favorites_changed() whenever a user favorites
+    # or unfavorites this recipe. See recipes.recommendations.
+    favorites_version = models.PositiveIntegerField(default=0,
+                                                    editable=False)
+
+    # A uniformly distributed key, which RecipeQuerySet.random() falls back
+    # to.
+    random_key = models.FloatField(default=make_random_key,
+                                   editable=False,
+                                   db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["title", "id"]),
+            models.Index(fields=["user", "random_key"]),
+            models.Index(fields=["public", "random_key"]),
+            # One pair per recipe list sort mode (see RECIPE_SORT_MODES in
+            # recipes.views): the unprefixed index is read in order and
+            # filtered for logged-in users, the public one serves anonymous
+            # users. Sorting by "newest" uses the primary key.
+            models.Index(fields=["public", "title", "id"]),
+            models.Index(fields=["public", "id"]),
+            models.Index(fields=["times_favorited", "id"]),
+            models.Index(fields=["public", "times_favorited", "id"]),
+            models.Index(fields=["times_cooked", "id"]),
+            models.Index(fields=["public", "times_cooked", "id"]),
+            models.Index(fields=["total_time", "id"]),
+            models.Index(fields=["public", "total_time", "id"]),
+            # A user's own recipes in title order.
+            models.Index(fields=["user", "title", "id"]),
+        ]
+
+    # Columns that are only ever changed by UPDATE queries of their own, so
+    # saving a recipe loaded before one of those must not write back its
+    # old values.
+    MAINTAINED_FIELDS = {
+        "times_favorited",
+        "times_cooked",
+        "first_cooked",
+        "fork_count",
+        "cache_version",
+        "favorites_version",
+    }
+
+    def save(self, *args, **kwargs):
+        self.total_time = self.total_time_in_minutes()
+        if (not self._state.adding and not kwargs.get("force_insert")
+                and kwargs.get("update_fields") is None):
+            kwargs["update_fields"] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.MAINTAINED_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
     def get_tag_names(self):
         tag_names = []
         for tag in self.tags.all():
@@ -60,43 +507,255 @@ class Recipe(models.Model):
         create any tags that do not currently exist, and associate all
         of these tags with the recipe.
         """
-        tag_names = tag_names.split()
-        tags = []
-        for tag_name in tag_names:
-            tag = Tag.objects.filter(tag=tag_name).first()
-            if tag is None:
-                tag = Tag.objects.create(tag=tag_name)
-            tags.append(tag)
-        self.tags.set(tags)
+        tag_names = list(dict.fromkeys(tag_names.split()))
+        tag_ids = Tag.objects.resolve_names(tag_names, verify=True)
+        self.tags.set([tag_ids[tag_name] for tag_name in tag_names])
+
+    def reorder_steps(self, step_pks, version):
+        """
+        Put this recipe's steps in the order of `step_pks`, which must list
+        each of them exactly once, with a single UPDATE, and return the
+        recipe's new version.
+
+        `version` is the `cache_version` the new order was based on. If
+        the recipe has changed since then, for instance because someone
+        else reordered or added steps, RecipeChanged is raised and nothing
+        is written.
+        """
+        step_pks = list(step_pks)
+        with transaction.atomic():
+            # Bumping the version only if it still matches both checks it
+            # and locks the recipe's row until commit, so of two concurrent
+            # reorders the second always sees a stale version.
+            if not Recipe.objects.filter(
+                    pk=self.pk, cache_version=version).bump_cache_version():
+                raise RecipeChanged()
+
+            current_pks = self.steps.values_list("pk", flat=True)
+            if sorted(step_pks) != sorted(current_pks):
+                raise ValueError("Every step must be listed exactly once.")
+            if step_pks:
+                self.steps.update(order=Case(
+                    *[
+                        When(pk=pk, then=Value(order))
+                        for order, pk in enumerate(step_pks)
+                    ],
+                    output_field=models.PositiveIntegerField()))
+
+        self.cache_version = version + 1
+        return self.cache_version
+
+    def get_ancestors(self, user):
+        """
+        Return the recipes this one was copied from that `user` can see,
+        following `original_recipe` all the way up in one recursive query,
+        oldest first. Each has a `depth`: 1 for the recipe this one was
+        copied from, 2 for the one that was copied from and so on.
+        """
+        return list(
+            Recipe.objects.raw(
+                f"""
+                WITH RECURSIVE ancestors (id, depth) AS (
+                    SELECT original_recipe_id, 1
+                    FROM {Recipe._meta.db_table}
+                    WHERE id = %s AND original_recipe_id IS NOT NULL
+                  UNION ALL
+                    SELECT recipe.original_recipe_id, ancestors.depth + 1
+                    FROM {Recipe._meta.db_table} recipe
+                    JOIN ancestors ON recipe.id = ancestors.id
+                    WHERE recipe.original_recipe_id IS NOT NULL
+                      AND ancestors.depth < %s
+                )
+                SELECT recipe.id, recipe.title, ancestors.depth
+                FROM (
+                    SELECT id, MIN(depth) AS depth
+                    FROM ancestors
+                    WHERE id != %s
+                    GROUP BY id
+                ) ancestors
+                JOIN {Recipe._meta.db_table} recipe
+                  ON recipe.id = ancestors.id
+                WHERE recipe.public OR recipe.user_id = %s
+                ORDER BY ancestors.depth DESC
+                """, [self.pk, MAX_LINEAGE_DEPTH, self.pk, user.pk]))
+
+    def get_fork_tree(self, user, limit):
+        """
+        Return the recipes copied from this one, from those and so on,
+        that `user` can see, in one recursive query: a list of up to
+        `limit` of them in tree order, nearest copies first, and how many
+        there are in all. A copy `user` can't see hides its own copies.
+
+        Each recipe has a `depth` (1 for direct copies), the pk of the
+        recipe it was copied from as `original_recipe_id` and its owner's
+        name as `username`.
+        """
+        descendants = list(
+            Recipe.objects.raw(
+                f"""
+                WITH RECURSIVE descendants (id, depth) AS (
+                    SELECT id, 1
+                    FROM {Recipe._meta.db_table}
+                    WHERE original_recipe_id = %s
+                      AND (public OR user_id = %s)
+                  UNION ALL
+                    SELECT recipe.id, descendants.depth + 1
+                    FROM {Recipe._meta.db_table} recipe
+                    JOIN descendants
+                      ON recipe.original_recipe_id = descendants.id
+                    WHERE (recipe.public OR recipe.user_id = %s)
+                      AND descendants.depth < %s
+                )
+                SELECT recipe.id, recipe.title, recipe.original_recipe_id,
+                       recipe.fork_count, descendants.depth,
+                       owner.username,
+                       COUNT(*) OVER () AS total
+                FROM (
+                    SELECT id, MIN(depth) AS depth
+                    FROM descendants
+                    WHERE id != %s
+                    GROUP BY id
+                ) descendants
+                JOIN {Recipe._meta.db_table} recipe
+                  ON recipe.id = descendants.id
+                JOIN {User._meta.db_table} owner ON owner.id = recipe.user_id
+                ORDER BY descendants.depth, recipe.id
+                LIMIT %s
+                """, [
+                    self.pk, user.pk, user.pk, MAX_LINEAGE_DEPTH, self.pk,
+                    limit
+                ]))
+        if not descendants:
+            return [], 0
+
+        # Rows come breadth first, so every copy's original is among them;
+        # put each copy right after the one it was copied from. Each recipe
+        # is placed once, even if its links were edited into a cycle.
+        forks = {}
+        for recipe in descendants:
+            forks.setdefault(recipe.original_recipe_id, []).append(recipe)
+        tree = []
+        placed = {self.pk}
+        stack = forks.get(self.pk, [])[::-1]
+        while stack:
+            recipe = stack.pop()
+            if recipe.pk in placed:
+                continue
+            placed.add(recipe.pk)
+            tree.append(recipe)
+            stack.extend(forks.get(recipe.pk, [])[::-1])
+        return tree, descendants[0].total
 
     def total_time_in_minutes(self):
         if self.cook_time_in_minutes is None or self.prep_time_in_minutes is None:
             return None
         return self.cook_time_in_minutes + self.prep_time_in_minutes
 
-    def to_dict(self):
-        return {
+    def to_dict(self, include_children=False):
+        """
+        Return a JSON-serializable dict of this recipe. With
+        `include_children`, this also includes its tags, ingredients and
+        ordered steps, which should be prefetched when doing this for
+        many recipes.
+        """
+        data = {
             "id": self.id,
             "title": self.title,
             "prep_time_in_minutes": self.prep_time_in_minutes,
             "cook_time_in_minutes": self.cook_time_in_minutes,
             "public": self.public,
         }
+        if include_children:
+            data.update({
+                "user_id": self.user_id,
+                "original_recipe_id": self.original_recipe_id,
+                "tags": [tag.tag for tag in self.tags.all()],
+                "ingredients": [{
+                    "amount": ingredient.amount,
+                    "item": ingredient.item,
+                } for ingredient in self.ingredients.all()],
+                "steps": [step.text for step in self.steps.all()],
+            })
+        return data
 
     def __str__(self):
         return self.title
 
 
+class CatalogItemQuerySet(models.QuerySet):
+    def resolve_names(self, names, create=True):
+        """
+        Given a list of catalog names, return a dict mapping each name to
+        its CatalogItem's pk, creating any that do not exist yet unless
+        `create` is False (in which case unknown names are left out).
+        Works like TagQuerySet.resolve_names().
+        """
+        item_ids = catalog_item_id_cache.get_many(names)
+        missing = [name for name in names if name not in item_ids]
+        if missing:
+            found = dict(
+                self.filter(name__in=missing).values_list("name", "pk"))
+            new_names = [name for name in missing if name not in found]
+            if new_names and create:
+                self.bulk_create(
+                    [CatalogItem(name=name) for name in new_names],
+                    ignore_conflicts=True)
+                found.update(
+                    self.filter(name__in=new_names).values_list("name", "pk"))
+            transaction.on_commit(
+                lambda: catalog_item_id_cache.set_many(found))
+            item_ids.update(found)
+        return item_ids
+
+
+class CatalogItem(models.Model):
+    """
+    A canonical ingredient, such as "tomato", that the free-text items of
+    many ingredients map to. See recipes.catalog.
+    """
+    objects = CatalogItemQuerySet.as_manager()
+
+    name = models.CharField(max_length=255, unique=True)
+
+    def __str__(self):
+        return self.name
+
+
 class Ingredient(models.Model):
     recipe = models.ForeignKey(to=Recipe,
                                on_delete=models.CASCADE,
                                related_name="ingredients")
     amount = models.CharField(max_length=20)
     item = models.CharField(max_length=255)
+    catalog_item = models.ForeignKey(to=CatalogItem,
+                                     on_delete=models.SET_NULL,
+                                     null=True,
+                                     blank=True,
+                                     editable=False,
+                                     related_name="ingredients")
 
     def __str__(self):
         return f"{self.amount} {self.item}"
 
+    def save(self, *args, **kwargs):
+        self.catalog_item_id = get_catalog_item_ids([self.item])[self.item]
+        super().save(*args, **kwargs)
+
+
+def get_catalog_item_ids(items):
+    """
+    Return a dict mapping each free-text ingredient item in `items` to the
+    pk of its CatalogItem, or to None if it has no catalog name. Bulk
+    inserts of ingredients use this to fill in `catalog_item_id`, which
+    Ingredient.save() does for single ones.
+    """
+    from .catalog import normalize_ingredient
+
+    names = {item: normalize_ingredient(item) for item in items}
+    item_ids = CatalogItem.objects.resolve_names(
+        list(dict.fromkeys(name for name in names.values() if name)))
+    return {item: item_ids.get(name) for item, name in names.items()}
+
 
 class RecipeStep(OrderedModel):
     recipe = models.ForeignKey(to=Recipe,
@@ -109,7 +768,203 @@ class RecipeStep(OrderedModel):
         return f"{self.order} {self.text}"
 
 
+class SearchPosting(models.Model):
+    """
+    One entry in the recipe search inverted index: how strongly `term`
+    is associated with `recipe`. Maintained by recipes.search.
+    """
+    term = models.CharField(max_length=100)
+    recipe = models.ForeignKey(to=Recipe,
+                               on_delete=models.CASCADE,
+                               related_name="search_postings")
+    weight = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = [
+            "term",
+            "recipe",
+        ]
+
+
+class RecipeSignature(models.Model):
+    """
+    The MinHash signature of a public recipe's tags and catalog items, as
+    of its `cache_version`. Maintained by recipes.similarity.
+    """
+    recipe = models.OneToOneField(to=Recipe,
+                                  on_delete=models.CASCADE,
+                                  primary_key=True,
+                                  related_name="signature")
+    cache_version = models.PositiveIntegerField()
+    minhash = models.BinaryField()
+
+
+class SignatureBucket(models.Model):
+    """
+    One LSH bucket that a recipe's signature falls in, one row per band.
+    Recipes that share a bucket are candidates for being similar.
+    """
+    recipe = models.ForeignKey(to=Recipe,
+                               on_delete=models.CASCADE,
+                               related_name="+")
+    bucket = models.BigIntegerField(db_index=True)
+
+
+class SimilarRecipe(models.Model):
+    """
+    One of the public recipes most similar to `recipe`, with the estimated
+    Jaccard similarity of their tags and catalog items. Maintained by
+    recipes.similarity.
+    """
+    recipe = models.ForeignKey(to=Recipe,
+                               on_delete=models.CASCADE,
+                               related_name="similar_recipe_links")
+    similar = models.ForeignKey(to=Recipe,
+                                on_delete=models.CASCADE,
+                                related_name="+")
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = [
+            "recipe",
+            "similar",
+        ]
+        indexes = [
+            models.Index(fields=["recipe", "-score", "similar"]),
+        ]
+
+
+class RecommendationState(models.Model):
+    """
+    The `favorites_version` of a public recipe that its RecommendedRecipe
+    rows were computed from. Maintained by recipes.recommendations.
+    """
+    recipe = models.OneToOneField(to=Recipe,
+                                  on_delete=models.CASCADE,
+                                  primary_key=True,
+                                  related_name="recommendation_state")
+    favorites_version = models.PositiveIntegerField()
+
+
+class RecommendedRecipe(models.Model):
+    """
+    One of the public recipes most often favorited by the users who
+    favorited `recipe`, scored by the cosine similarity of who favorited
+    the two. Maintained by recipes.recommendations.
+    """
+    recipe = models.ForeignKey(to=Recipe,
+                               on_delete=models.CASCADE,
+                               related_name="recommended_recipe_links")
+    recommended = models.ForeignKey(to=Recipe,
+                                    on_delete=models.CASCADE,
+                                    related_name="+")
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = [
+            "recipe",
+            "recommended",
+        ]
+        indexes = [
+            models.Index(fields=["recipe", "-score", "recommended"]),
+        ]
+
+
+class MealPlanQuerySet(models.QuerySet):
+    def with_recipes(self):
+        """
+        Prefetch each plan's recipes, in title order, in one extra query.
+        """
+        return self.prefetch_related(
+            models.Prefetch("recipes",
+                            queryset=Recipe.objects.order_by("title")))
+
+    def recipes_by_date(self, start, end):
+        """
+        Return a dict mapping each date from `start` to `end` (inclusive)
+        to the list of recipes planned for it, using two queries.
+        """
+        plans = {
+            plan.date: plan.recipes.all()
+            for plan in self.filter(date__range=(start, end)).with_recipes()
+        }
+        days = (end - start).days + 1
+        return {
+            date: list(plans.get(date, []))
+            for date in (start + datetime.timedelta(days=offset)
+                         for offset in range(days))
+        }
+
+    def apply_changes(self, user, changes):
+        """
+        Apply a batch of (date, recipe pk, action) changes to `user`'s meal
+        plans, where action is "add" or "remove", in one transaction.
+
+        Only the last change to each (date, recipe) pair counts, and adding
+        a recipe that is already planned or removing one that isn't is a
+        no-op, so replaying a batch is safe. Changes to recipes the user
+        can't see are ignored. Returns the number of changes applied.
+        """
+        from .shopping import rebuild_shopping_lists
+
+        final_actions = {}
+        for date, recipe_pk, action in changes:
+            final_actions[(date, recipe_pk)] = action
+
+        visible_pks = set(
+            Recipe.objects.for_user(user).filter(
+                pk__in={recipe_pk
+                        for _, recipe_pk in final_actions}).values_list(
+                            "pk", flat=True))
+        final_actions = {(date, recipe_pk): action
+                         for (date, recipe_pk), action in final_actions.items()
+                         if recipe_pk in visible_pks}
+        if not final_actions:
+            return 0
+
+        through = MealPlan.recipes.through
+        with transaction.atomic():
+            added_dates = {
+                date
+                for (date, _), action in final_actions.items()
+                if action == "add"
+            }
+            # Meal plans are only created once something is added to them.
+            MealPlan.objects.bulk_create(
+                [MealPlan(user=user, date=date) for date in added_dates],
+                ignore_conflicts=True)
+            plan_ids = dict(
+                self.filter(user=user,
+                            date__in={date
+                                      for date, _ in final_actions
+                                      }).values_list("date", "pk"))
+
+            added = [
+                through(mealplan_id=plan_ids[date], recipe_id=recipe_pk)
+                for (date, recipe_pk), action in final_actions.items()
+                if action == "add"
+            ]
+            through.objects.bulk_create(added, ignore_conflicts=True)
+
+            removed = Q(pk__in=[])
+            for (date, recipe_pk), action in final_actions.items():
+                if action == "remove" and date in plan_ids:
+                    removed |= Q(mealplan_id=plan_ids[date],
+                                 recipe_id=recipe_pk)
+            through.objects.filter(removed).delete()
+
+            # Bulk writes to the through table skip m2m_changed, so update
+            # the counters and shopping lists its receivers would have kept
+            # in step.
+            Recipe.objects.filter(pk__in=visible_pks).refresh_counters()
+            rebuild_shopping_lists(plan_ids.values())
+
+        return len(final_actions)
+
+
 class MealPlan(models.Model):
+    objects = MealPlanQuerySet.as_manager()
+
     user = models.ForeignKey(to=User,
                              on_delete=models.CASCADE,
                              related_name="meal_plans")
@@ -121,3 +976,69 @@ class MealPlan(models.Model):
             "user",
             "date",
         ]
+
+
+class ShoppingListItem(models.Model):
+    """
+    One ingredient of a meal plan's shopping list, parsed and kept up to
+    date by recipes.shopping. `user` and `date` are copied from the meal
+    plan so that a date range can be read straight off the index.
+    """
+    meal_plan = models.ForeignKey(to=MealPlan,
+                                  on_delete=models.CASCADE,
+                                  related_name="shopping_list_items")
+    ingredient = models.ForeignKey(to=Ingredient,
+                                   on_delete=models.CASCADE,
+                                   related_name="shopping_list_items")
+    user = models.ForeignKey(to=User,
+                             on_delete=models.CASCADE,
+                             related_name="shopping_list_items")
+    date = models.DateField()
+    item = models.CharField(max_length=255)
+    unit = models.CharField(max_length=20, blank=True)
+    quantity = models.DecimalField(max_digits=12,
+                                   decimal_places=4,
+                                   null=True,
+                                   blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "date", "item", "unit"]),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity or ''} {self.unit} {self.item}".strip()
+
+
+def _aggregate_per_recipe(through, aggregate):
+    return Subquery(
+        through.objects.filter(recipe=OuterRef("pk")).order_by().values(
+            "recipe").annotate(value=aggregate).values("value")[:1])
+
+
+def fork_count_expression():
+    """
+    Return an expression that counts a recipe's direct copies.
+    """
+    forks = Recipe.objects.filter(original_recipe=OuterRef(
+        "pk")).order_by().values("original_recipe").annotate(
+            count=Count("pk")).values("count")[:1]
+    return Coalesce(Subquery(forks), 0)
+
+
+def counter_expressions():
+    """
+    Return expressions that compute each of a recipe's denormalized
+    counters from the underlying M2M tables.
+    """
+    return {
+        "times_favorited":
+        Coalesce(_aggregate_per_recipe(Recipe.favorited_by.through,
+                                       Count("pk")), 0),
+        "times_cooked":
+        Coalesce(_aggregate_per_recipe(MealPlan.recipes.through, Count("pk")),
+                 0),
+        "first_cooked":
+        _aggregate_per_recipe(MealPlan.recipes.through,
+                              Min("mealplan__date")),
+    }
@@ -0,0 +1,136 @@
+import base64
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Q
+
+from .models import MAX_PK, parse_pk
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """
+    Paginate a queryset by seeking past the last row of the previous page
+    instead of using OFFSET, so every page costs the same single query no
+    matter how far down the list the reader has scrolled.
+
+    Rows are ordered by `order_field` (prefix it with "-" for descending
+    order) with the primary key as a tie-breaker. NULLs always sort last:
+    when the field can be NULL they are read with a second query once the
+    rest run out, so that each query can walk an index on
+    (order_field, pk) in order instead of sorting.
+    """
+    def __init__(self, queryset, order_field, per_page=50, nullable=None):
+        self.queryset = queryset
+        self.descending = order_field.startswith("-")
+        self.field = order_field.lstrip("-")
+        self.per_page = per_page
+        try:
+            self.order_field = queryset.model._meta.get_field(self.field)
+            self.nullable = self.order_field.null
+        except FieldDoesNotExist:
+            # An annotation, which might be NULL unless the caller knows
+            # better.
+            self.order_field = None
+            self.nullable = True
+        if nullable is not None:
+            self.nullable = nullable
+
+    def get_ordering(self):
+        if self.descending:
+            return [F(self.field).desc(), "-pk"]
+        return [F(self.field).asc(), "pk"]
+
+    def page(self, cursor=None):
+        value, pk = self.decode_cursor(cursor) if cursor else (None, None)
+
+        # Fetch one extra row so we know whether there is another page
+        # without having to COUNT the whole result set.
+        limit = self.per_page + 1
+        rows = []
+        if pk is None or value is not None:
+            queryset = self.queryset.order_by(*self.get_ordering())
+            if self.nullable:
+                queryset = queryset.filter(
+                    **{f"{self.field}__isnull": False})
+            if pk is not None:
+                queryset = queryset.filter(self.seek(value, pk))
+            rows = list(queryset[:limit])
+        if self.nullable and len(rows) < limit:
+            queryset = self.queryset.filter(**{
+                f"{self.field}__isnull": True
+            }).order_by("-pk" if self.descending else "pk")
+            if value is None and pk is not None:
+                queryset = queryset.filter(self.seek(None, pk))
+            rows.extend(queryset[:limit - len(rows)])
+
+        next_cursor = None
+        if len(rows) > self.per_page:
+            rows = rows[:self.per_page]
+            last_row = rows[-1]
+            next_cursor = self.encode_cursor(getattr(last_row, self.field),
+                                             last_row.pk)
+        return KeysetPage(rows, next_cursor)
+
+    def seek(self, value, pk):
+        """
+        Build the filter that selects every row after (value, pk) in this
+        paginator's ordering, among the rows whose field is NULL if
+        `value` is None and among the others otherwise.
+        """
+        direction = "lt" if self.descending else "gt"
+        after_pk = Q(**{f"pk__{direction}": pk})
+
+        if value is None:
+            return after_pk
+
+        return (Q(**{f"{self.field}__{direction}": value})
+                | (Q(**{self.field: value}) & after_pk))
+
+    def encode_cursor(self, value, pk):
+        data = json.dumps([value, pk], cls=DjangoJSONEncoder)
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+    def decode_cursor(self, cursor):
+        try:
+            padding = "=" * (-len(cursor) % 4)
+            value, pk = json.loads(base64.urlsafe_b64decode(cursor + padding))
+            if value is not None:
+                value = self.clean_value(value)
+            return value, parse_pk(pk)
+        except (ValueError, TypeError, ValidationError):
+            raise InvalidCursor(cursor)
+
+    def clean_value(self, value):
+        """
+        Convert a value read from a cursor to the order field's type,
+        raising ValueError, TypeError or ValidationError if it can't be
+        compared with the field in a query.
+        """
+        if self.order_field is not None:
+            value = self.order_field.to_python(value)
+        elif not isinstance(value, (str, int, float)):
+            raise TypeError("Invalid cursor value.")
+        if isinstance(value, int) and not -MAX_PK <= value <= MAX_PK:
+            raise ValueError("Invalid cursor value.")
+        return value
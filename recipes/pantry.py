@@ -0,0 +1,271 @@
+"""
+"What can I cook?": rank recipes by how much of them a user's pantry
+covers.
+
+PantryIndex keeps, in the memory of each process, a bitmap per catalog
+item of the recipes that use it, with recipes numbered by their position
+in pk order. Bitmaps are Python ints, so combining two is a single
+operation over machine words. Per-recipe counts are kept "bit-sliced":
+one bitmap per binary digit of the count. Counting the pantry items in
+every recipe at once then takes a few dozen whole-bitmap operations, which
+keeps a match to milliseconds across a million recipes. Items used by few
+recipes are kept as plain lists of positions and only turned into bitmaps
+when a pantry needs them, with the most recently needed ones cached.
+
+The index is built on first use and rebuilt in a background thread once
+it is `ttl` seconds old, so recipe changes show up in matches soon after
+that. Matches keep using the old index until the new one is ready; only
+the first build makes requests wait.
+"""
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from django.db import connections
+
+from .lru import LRUCache
+from .models import Ingredient
+
+# Items used by more than this share of recipes are kept as bitmaps.
+DENSE_ITEM_SHARE = 1 / 32
+
+# How many bitmaps of the other items to keep once a pantry has needed
+# them.
+SPARSE_BITMAP_CACHE_SIZE = 256
+
+NONZERO_BYTE_RE = re.compile(rb"[^\x00]")
+
+
+def make_bitmap(positions, size):
+    bits = bytearray(size // 8 + 1)
+    for position in positions:
+        bits[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(bits, "little")
+
+
+def iter_positions(bitmap):
+    # Let the regex engine skip the empty stretches of the bitmap.
+    data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+    for match in NONZERO_BYTE_RE.finditer(data):
+        byte = data[match.start()]
+        for bit in range(8):
+            if byte >> bit & 1:
+                yield match.start() * 8 + bit
+
+
+def add_to_counts(planes, bitmap):
+    """
+    Add one to the bit-sliced counts in `planes` (least significant digit
+    first) for every recipe in `bitmap`.
+    """
+    carry = bitmap
+    for digit, plane in enumerate(planes):
+        if not carry:
+            return
+        planes[digit], carry = plane ^ carry, plane & carry
+    if carry:
+        planes.append(carry)
+
+
+def subtract_counts(planes, other_planes):
+    """
+    Return the bit-sliced difference of two sets of counts, where no count
+    in `other_planes` is larger than its counterpart in `planes`.
+    """
+    result = []
+    borrow = 0
+    for digit, plane in enumerate(planes):
+        other = other_planes[digit] if digit < len(other_planes) else 0
+        result.append(plane ^ other ^ borrow)
+        borrow = (~plane & (other | borrow)) | (other & borrow)
+    return result
+
+
+def count_equals(planes, value, universe):
+    """
+    Return the bitmap of the recipes in `universe` whose count is `value`.
+    """
+    if value >> len(planes):
+        return 0
+    bitmap = universe
+    for digit, plane in enumerate(planes):
+        bitmap &= plane if value >> digit & 1 else ~plane
+    return bitmap
+
+
+class PantryMatch:
+    def __init__(self, recipe_pk, matched, total):
+        self.recipe_pk = recipe_pk
+        self.matched = matched
+        self.total = total
+
+    @property
+    def missing(self):
+        return self.total - self.matched
+
+
+class PantryIndexState:
+    def __init__(self):
+        self.recipe_pks = array("q")
+        self.items = {}
+        self.total_planes = []
+        self.public = 0
+        self.sparse_bitmaps = LRUCache(maxsize=SPARSE_BITMAP_CACHE_SIZE)
+
+
+class PantryIndex:
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._state = None
+        self._expires = None
+        self._generation = 0
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def get_state(self):
+        with self._lock:
+            if self._state is None:
+                self._state = self.build()
+                self._expires = self.get_expiry()
+            elif (self._expires is not None
+                  and self._expires < time.monotonic()
+                  and not self._refreshing):
+                self._refreshing = True
+                self.start_refresh()
+            return self._state
+
+    def get_expiry(self):
+        return time.monotonic() + self.ttl if self.ttl else None
+
+    def start_refresh(self):
+        threading.Thread(target=self.refresh_in_background,
+                         daemon=True).start()
+
+    def refresh_in_background(self):
+        try:
+            self.refresh()
+        finally:
+            # The thread's database connection isn't closed for us.
+            connections.close_all()
+
+    def refresh(self):
+        """
+        Rebuild the index and put it in place of the old one, unless the
+        index was cleared in the meantime.
+        """
+        generation = self._generation
+        try:
+            state = self.build()
+            with self._lock:
+                if self._generation == generation:
+                    self._state = state
+                    self._expires = self.get_expiry()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def build(self):
+        state = PantryIndexState()
+        postings = {}
+        counts = array("I")
+        public_positions = array("I")
+        rows = Ingredient.objects.filter(catalog_item__isnull=False).order_by(
+            "recipe_id", "catalog_item_id").values_list(
+                "recipe_id", "catalog_item_id", "recipe__public").distinct()
+        for recipe_pk, item_pk, public in rows.iterator(chunk_size=10000):
+            if not state.recipe_pks or state.recipe_pks[-1] != recipe_pk:
+                state.recipe_pks.append(recipe_pk)
+                counts.append(0)
+                if public:
+                    public_positions.append(len(counts) - 1)
+            postings.setdefault(item_pk, array("I")).append(len(counts) - 1)
+            counts[-1] += 1
+
+        size = len(state.recipe_pks)
+        for item_pk, positions in postings.items():
+            if len(positions) > size * DENSE_ITEM_SHARE:
+                state.items[item_pk] = make_bitmap(positions, size)
+            else:
+                state.items[item_pk] = positions
+
+        for digit in range(max(counts, default=0).bit_length()):
+            state.total_planes.append(
+                make_bitmap((position for position, count in enumerate(counts)
+                             if count >> digit & 1), size))
+        state.public = make_bitmap(public_positions, size)
+        return state
+
+    def get_positions(self, state, recipe_pks):
+        for recipe_pk in recipe_pks:
+            position = bisect_left(state.recipe_pks, recipe_pk)
+            if (position < len(state.recipe_pks)
+                    and state.recipe_pks[position] == recipe_pk):
+                yield position
+
+    def match(self, user, item_pks, limit=50):
+        """
+        Return up to `limit` PantryMatches for the recipes visible to
+        `user` that use any of the catalog items `item_pks`, those missing
+        the fewest ingredients first and then those using the most.
+        """
+        state = self.get_state()
+        size = len(state.recipe_pks)
+
+        matched_planes = []
+        for item_pk in set(item_pks):
+            recipes = state.items.get(item_pk)
+            if recipes is None:
+                continue
+            if not isinstance(recipes, int):
+                positions = recipes
+                recipes = state.sparse_bitmaps.get(item_pk)
+                if recipes is None:
+                    recipes = make_bitmap(positions, size)
+                    state.sparse_bitmaps.set_many({item_pk: recipes})
+            add_to_counts(matched_planes, recipes)
+        if not matched_planes:
+            return []
+
+        visible = state.public
+        if user.is_authenticated:
+            private_pks = user.recipes.filter(public=False).values_list(
+                "pk", flat=True)
+            visible |= make_bitmap(self.get_positions(state, private_pks),
+                                   size)
+
+        # A recipe matches at least one item if any digit of its count is set.
+        remaining = 0
+        for plane in matched_planes:
+            remaining |= plane
+        remaining &= visible
+
+        missing_planes = subtract_counts(state.total_planes, matched_planes)
+        most_matched = (1 << len(matched_planes)) - 1
+        matches = []
+        for missing in range(1 << len(missing_planes)):
+            if not remaining:
+                break
+            with_missing = count_equals(missing_planes, missing, remaining)
+            remaining &= ~with_missing
+            for matched in range(most_matched, 0, -1):
+                if not with_missing:
+                    break
+                found = count_equals(matched_planes, matched, with_missing)
+                with_missing &= ~found
+                for position in iter_positions(found):
+                    matches.append(
+                        PantryMatch(state.recipe_pks[position], matched,
+                                    matched + missing))
+                    if len(matches) == limit:
+                        return matches
+        return matches
+
+    def clear(self):
+        with self._lock:
+            self._state = None
+            self._generation += 1
+
+
+pantry_index = PantryIndex(ttl=300)
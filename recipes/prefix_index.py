@@ -0,0 +1,89 @@
+import threading
+import time
+from bisect import bisect_left, insort
+
+
+class PrefixIndex:
+    """
+    A thread-safe, in-process index of names for prefix lookups.
+
+    Names are kept in a list sorted by their case-folded form, so a lookup
+    is a binary search followed by a short scan. The index is loaded on
+    first use by calling `load`, which returns (key, name) pairs, and is
+    updated in place with add_many() and remove(). If `ttl` is given, it
+    is reloaded that many seconds after loading to pick up changes made by
+    other processes.
+    """
+    def __init__(self, load, ttl=None):
+        self.load = load
+        self.ttl = ttl
+        self._entries = []
+        self._names = {}
+        self._expires = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _ensure_loaded(self):
+        if self._loaded and (self._expires is None
+                             or self._expires > time.monotonic()):
+            return
+
+        names = dict(self.load())
+        entries = sorted((name.casefold(), name) for name in names.values())
+        self._names = names
+        self._entries = entries
+        self._expires = time.monotonic() + self.ttl if self.ttl else None
+        self._loaded = True
+
+    def _remove(self, key):
+        name = self._names.pop(key, None)
+        if name is not None:
+            entry = (name.casefold(), name)
+            index = bisect_left(self._entries, entry)
+            if index < len(self._entries) and self._entries[index] == entry:
+                del self._entries[index]
+
+    def add_many(self, mapping):
+        """
+        Add or rename the names in `mapping` of keys to names.
+        """
+        with self._lock:
+            if not self._loaded:
+                # The first lookup will load them.
+                return
+            for key, name in mapping.items():
+                if self._names.get(key) == name:
+                    continue
+                self._remove(key)
+                self._names[key] = name
+                insort(self._entries, (name.casefold(), name))
+
+    def remove(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def complete(self, prefix, limit=10):
+        """
+        Return up to `limit` names starting with `prefix`, ignoring case,
+        in alphabetical order.
+        """
+        prefix = prefix.casefold()
+        with self._lock:
+            self._ensure_loaded()
+            entries = self._entries
+            index = bisect_left(entries, (prefix, ))
+            names = []
+            while (index < len(entries) and len(names) < limit
+                   and entries[index][0].startswith(prefix)):
+                names.append(entries[index][1])
+                index += 1
+        return names
+
+    def clear(self):
+        with self._lock:
+            self._entries = []
+            self._names = {}
+            self._loaded = False
+
+    def __len__(self):
+        return len(self._names)
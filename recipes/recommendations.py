@@ -0,0 +1,272 @@
+"""
+"People who favorited this also favorited": for each public recipe, the
+public recipes most often favorited by the same users, stored in
+`RecommendedRecipe` so the recipe detail page reads them with one
+indexed lookup.
+
+The favorites table is read as a sparse SciPy user x recipe matrix of
+ones, indexed by pk. Multiplying the columns of a batch of recipes by
+the matrix gives, for each of them, how many users favorited it along
+with every other recipe. Only recipes favorited by at least
+MIN_CO_FAVORITES of the same users are scored, by the cosine similarity
+co / sqrt(n_a * n_b) of who favorited the two, so that the most popular
+recipes don't top every list. Users with more than MAX_USER_FAVORITES
+favorites say little about any one of them and would make every recipe
+they favorited slow to score, so they are left out of the matrix.
+
+update_recommendations() is incremental: it only recomputes recipes whose
+`favorites_version` differs from the one their recommendations were built
+from, plus the recipes whose lists pointed at them. It is run offline by
+the update_recommendations command.
+"""
+from itertools import chain
+
+import numpy as np
+from django.db import transaction
+from django.db.models import F
+from scipy.sparse import csr_matrix
+
+from .models import Recipe, RecommendationState, RecommendedRecipe
+
+# How many recommendations to keep per recipe.
+RECOMMENDED_RECIPE_COUNT = 10
+MIN_CO_FAVORITES = 2
+MAX_USER_FAVORITES = 1000
+
+# How many pks to put in one IN (...) list.
+QUERY_CHUNK_SIZE = 10000
+
+# How many recipes' co-favorite counts to compute in one product. The
+# counts of a popular recipe can span most of the other recipes.
+SCORE_CHUNK_SIZE = 64
+
+
+def in_batches(pks, batch_size):
+    for start in range(0, len(pks), batch_size):
+        yield pks[start:start + batch_size]
+
+
+def make_favorites_matrix(user_pks, recipe_pks):
+    """
+    Return the sparse user x recipe matrix of the favorites given as the
+    arrays `user_pks` and `recipe_pks`, leaving out users with more than
+    MAX_USER_FAVORITES favorites.
+    """
+    if not len(user_pks):
+        return csr_matrix((0, 0), dtype=np.int32)
+    light = np.bincount(user_pks)[user_pks] <= MAX_USER_FAVORITES
+    return csr_matrix(
+        (np.ones(np.count_nonzero(light), dtype=np.int32),
+         (user_pks[light], recipe_pks[light])),
+        shape=(user_pks.max() + 1, recipe_pks.max() + 1))
+
+
+def get_favorites_matrix(user_pks=None):
+    """
+    Return the matrix of the public favorites of the users in `user_pks`
+    (or of every user).
+    """
+    favorites = Recipe.favorited_by.through.objects.filter(
+        recipe__public=True).order_by().values_list("user_id", "recipe_id")
+    if user_pks is None:
+        batches = [favorites.iterator(chunk_size=QUERY_CHUNK_SIZE)]
+    else:
+        batches = (favorites.filter(user_id__in=batch)
+                   for batch in in_batches(sorted(user_pks),
+                                           QUERY_CHUNK_SIZE))
+
+    pairs = np.fromiter(chain.from_iterable(chain.from_iterable(batches)),
+                        dtype=np.int64).reshape(-1, 2)
+    return make_favorites_matrix(pairs[:, 0], pairs[:, 1])
+
+
+def get_counts(favorite_counts, pks):
+    """
+    Look up `pks` in the array of stored favorite counts, which doesn't
+    cover recipes favorited since it was read.
+    """
+    counts = np.zeros(len(pks), dtype=np.int64)
+    known = pks < len(favorite_counts)
+    counts[known] = favorite_counts[pks[known]]
+    return counts
+
+
+def score_co_favorites(matrix, fans, recipe_pks, favorite_counts):
+    """
+    Yield (recipe pk, pks, scores) for each of `recipe_pks` that is in
+    the favorites `matrix`, with the arrays of the recipes that at least
+    MIN_CO_FAVORITES of the users who favorited it also favorited and of
+    their scores. `fans` is the transpose of `matrix` as a CSR matrix, so
+    that a recipe's users are a row of it, and `favorite_counts` is an
+    array of how many users favorited each recipe, indexed by pk.
+    """
+    recipe_pks = np.array([pk for pk in recipe_pks if pk < matrix.shape[1]],
+                          dtype=np.int64)
+    for chunk in in_batches(recipe_pks, SCORE_CHUNK_SIZE):
+        rows = fans[chunk]
+        co_favorites = (rows @ matrix).tocsr()
+        # The stored counters include users left out of the matrix, but
+        # can only fall short of it if they are out of date.
+        favorites = np.maximum(get_counts(favorite_counts, chunk),
+                               np.diff(rows.indptr))
+        for row, recipe_pk in enumerate(chunk.tolist()):
+            start, end = co_favorites.indptr[row:row + 2]
+            pks = co_favorites.indices[start:end]
+            counts = co_favorites.data[start:end]
+            scored = (counts >= MIN_CO_FAVORITES) & (pks != recipe_pk)
+            pks, counts = pks[scored], counts[scored]
+            other_favorites = np.maximum(get_counts(favorite_counts, pks),
+                                         counts)
+            yield recipe_pk, pks, counts / np.sqrt(
+                favorites[row] * other_favorites)
+
+
+def get_best_scores(pks, scores):
+    """
+    Return the RECOMMENDED_RECIPE_COUNT best of `scores` as (score, pk)
+    pairs, breaking ties by pk.
+    """
+    best = np.lexsort((pks, -scores))[:RECOMMENDED_RECIPE_COUNT]
+    return list(zip(scores[best].tolist(), pks[best].tolist()))
+
+
+def update_batch(recipe_pks,
+                 versions,
+                 favorite_counts,
+                 matrix=None,
+                 fans=None):
+    """
+    Recompute the recommendations of `recipe_pks`, and add each of them to
+    the lists of the recipes it is recommended alongside where it ranks
+    high enough. `versions` holds the `favorites_version` of those of
+    them whose favorites changed.
+    """
+    if matrix is None:
+        matrix = get_favorites_matrix(
+            set(Recipe.favorited_by.through.objects.filter(
+                recipe_id__in=recipe_pks).values_list("user_id", flat=True)))
+        fans = matrix.T.tocsr()
+
+    batch = set(recipe_pks)
+    links = []
+    reverse_links = []
+    for recipe_pk, pks, scores in score_co_favorites(matrix, fans,
+                                                     recipe_pks,
+                                                     favorite_counts):
+        links.extend(
+            RecommendedRecipe(recipe_id=recipe_pk,
+                              recommended_id=pk,
+                              score=score)
+            for score, pk in get_best_scores(pks, scores))
+        # Recipes in this batch get their own list computed here.
+        reverse_links.extend(
+            RecommendedRecipe(recipe_id=pk,
+                              recommended_id=recipe_pk,
+                              score=score)
+            for pk, score in zip(pks.tolist(), scores.tolist())
+            if pk not in batch)
+
+    with transaction.atomic():
+        RecommendedRecipe.objects.filter(recipe_id__in=recipe_pks).delete()
+        RecommendedRecipe.objects.filter(
+            recommended_id__in=recipe_pks).delete()
+        RecommendedRecipe.objects.bulk_create(links, batch_size=1000)
+        RecommendedRecipe.objects.bulk_create(reverse_links, batch_size=1000)
+        trim_recommendations({link.recipe_id for link in reverse_links})
+
+        changed_pks = [pk for pk in recipe_pks if pk in versions]
+        RecommendationState.objects.filter(recipe_id__in=changed_pks).delete()
+        RecommendationState.objects.bulk_create(
+            [RecommendationState(recipe_id=pk, favorites_version=versions[pk])
+             for pk in changed_pks],
+            batch_size=1000)
+
+
+def trim_recommendations(recipe_pks):
+    """
+    Drop all but the RECOMMENDED_RECIPE_COUNT best recommendations from
+    the lists of `recipe_pks`.
+    """
+    rows = RecommendedRecipe.objects.filter(
+        recipe_id__in=recipe_pks).order_by("recipe_id", "-score",
+                                           "recommended_id").values_list(
+                                               "pk", "recipe_id")
+    kept = {}
+    extra_pks = []
+    for pk, recipe_pk in rows:
+        kept[recipe_pk] = kept.get(recipe_pk, 0) + 1
+        if kept[recipe_pk] > RECOMMENDED_RECIPE_COUNT:
+            extra_pks.append(pk)
+    RecommendedRecipe.objects.filter(pk__in=extra_pks).delete()
+
+
+def get_favorite_counts():
+    """
+    Return an array of how many users favorited each public recipe,
+    indexed by pk.
+    """
+    pairs = np.fromiter(
+        chain.from_iterable(
+            Recipe.objects.filter(
+                public=True, times_favorited__gt=0).values_list(
+                    "pk", "times_favorited").iterator(
+                        chunk_size=QUERY_CHUNK_SIZE)),
+        dtype=np.int64).reshape(-1, 2)
+    favorite_counts = np.zeros(pairs[:, 0].max() + 1 if len(pairs) else 0,
+                               dtype=np.int64)
+    favorite_counts[pairs[:, 0]] = pairs[:, 1]
+    return favorite_counts
+
+
+def update_recommendations(full=False, batch_size=500):
+    """
+    Bring the stored recommendations up to date with the favorites of
+    public recipes, recomputing everything if `full` is set. Returns the
+    number of recipes whose favorites had changed and of lists that were
+    recomputed.
+    """
+    if full:
+        with transaction.atomic():
+            RecommendedRecipe.objects.all().delete()
+            RecommendationState.objects.all().delete()
+
+    # Recipes that were deleted took their rows with them; the ones made
+    # private are dropped here.
+    unlisted_pks = list(
+        RecommendationState.objects.filter(recipe__public=False).values_list(
+            "recipe_id", flat=True))
+
+    # Recipes that were never favorited have nothing to recommend.
+    stale = dict(
+        Recipe.objects.filter(public=True).exclude(
+            recommendation_state__favorites_version=F(
+                "favorites_version")).exclude(
+                    times_favorited=0,
+                    recommendation_state__isnull=True).values_list(
+                        "pk", "favorites_version"))
+    changed_pks = list(stale) + unlisted_pks
+    affected_pks = set(stale)
+    for batch in in_batches(changed_pks, batch_size):
+        affected_pks.update(
+            RecommendedRecipe.objects.filter(
+                recommended_id__in=batch).values_list("recipe_id",
+                                                      flat=True))
+    affected_pks.difference_update(unlisted_pks)
+
+    for batch in in_batches(unlisted_pks, batch_size):
+        with transaction.atomic():
+            RecommendedRecipe.objects.filter(recipe_id__in=batch).delete()
+            RecommendedRecipe.objects.filter(
+                recommended_id__in=batch).delete()
+            RecommendationState.objects.filter(recipe_id__in=batch).delete()
+
+    favorite_counts = get_favorite_counts()
+    # A full run needs every user's favorites, so read them all at once.
+    matrix = fans = None
+    if full:
+        matrix = get_favorites_matrix()
+        fans = matrix.T.tocsr()
+    for batch in in_batches(sorted(affected_pks), batch_size):
+        update_batch(batch, stale, favorite_counts, matrix, fans)
+
+    return len(stale), len(affected_pks)
@@ -0,0 +1,181 @@
+"""
+Full-text search over recipe titles, tags, ingredients and steps.
+
+On PostgreSQL each recipe carries a weighted `search_vector` tsvector
+column with a GIN index (added by migration 0015 and invisible to the
+ORM). Every other database uses an inverted index stored in
+`SearchPosting`, one row per (term, recipe). Either way a query only
+touches the index entries for its own terms, so it stays fast as the
+catalog grows.
+"""
+import re
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models import BooleanField, Count, FloatField, Sum
+from django.db.models.expressions import RawSQL
+
+from .models import Recipe, SearchPosting
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+STOP_WORDS = frozenset(
+    ["a", "an", "and", "at", "for", "in", "into", "of", "on", "or", "the",
+     "to", "with"])
+
+# How much a term counts towards a recipe's rank, by where it was found.
+FIELD_WEIGHTS = {
+    "title": 8,
+    "tag": 4,
+    "ingredient": 2,
+    "step": 1,
+}
+
+
+def normalize_term(term):
+    """
+    Fold simple English plurals so that "tomatoes" finds "tomato".
+    """
+    if len(term) > 4 and term.endswith("ies"):
+        return term[:-3] + "y"
+    if len(term) > 4 and term.endswith("oes"):
+        return term[:-2]
+    if len(term) > 3 and term.endswith("s") and not term.endswith("ss"):
+        return term[:-1]
+    return term
+
+
+def tokenize(text):
+    return [
+        normalize_term(token) for token in TOKEN_RE.findall(text.lower())
+        if token not in STOP_WORDS
+    ]
+
+
+class PostingsSearchBackend:
+    """
+    Database-agnostic backend that keeps a term -> recipe inverted index
+    in the SearchPosting table.
+    """
+    def index_recipes(self, recipe_pks):
+        recipes = Recipe.objects.filter(pk__in=recipe_pks).prefetch_related(
+            "tags", "ingredients", "steps")
+
+        postings = []
+        for recipe in recipes:
+            weights = Counter()
+            for field, text in self.get_recipe_text(recipe):
+                for term in tokenize(text):
+                    weights[term[:100]] += FIELD_WEIGHTS[field]
+            postings.extend(
+                SearchPosting(term=term, recipe=recipe, weight=weight)
+                for term, weight in weights.items())
+
+        with transaction.atomic():
+            SearchPosting.objects.filter(recipe_id__in=recipe_pks).delete()
+            SearchPosting.objects.bulk_create(postings, batch_size=1000)
+
+    def get_recipe_text(self, recipe):
+        yield "title", recipe.title
+        for tag in recipe.tags.all():
+            yield "tag", tag.tag
+        for ingredient in recipe.ingredients.all():
+            yield "ingredient", ingredient.item
+        for step in recipe.steps.all():
+            yield "step", step.text
+
+    def search(self, recipes, query):
+        terms = set(tokenize(query))
+        if not terms:
+            return recipes.none()
+
+        return recipes.filter(search_postings__term__in=terms).annotate(
+            search_rank=Sum("search_postings__weight"),
+            matched_terms=Count("search_postings"),
+        ).filter(matched_terms=len(terms)).order_by("-search_rank", "pk")
+
+
+class PostgresSearchBackend:
+    """
+    Backend that uses PostgreSQL's built-in full-text search against the
+    GIN-indexed `search_vector` column on the recipe table.
+    """
+    config = "english"
+
+    update_sql = """
+        UPDATE recipes_recipe AS recipe SET search_vector =
+            setweight(to_tsvector(%(config)s, recipe.title), 'A') ||
+            setweight(to_tsvector(%(config)s, coalesce((
+                SELECT string_agg(tag.tag, ' ')
+                FROM recipes_tag AS tag
+                JOIN recipes_recipe_tags AS recipe_tag
+                  ON recipe_tag.tag_id = tag.id
+                WHERE recipe_tag.recipe_id = recipe.id), '')), 'B') ||
+            setweight(to_tsvector(%(config)s, coalesce((
+                SELECT string_agg(ingredient.item, ' ')
+                FROM recipes_ingredient AS ingredient
+                WHERE ingredient.recipe_id = recipe.id), '')), 'C') ||
+            setweight(to_tsvector(%(config)s, coalesce((
+                SELECT string_agg(step.text, ' ')
+                FROM recipes_recipestep AS step
+                WHERE step.recipe_id = recipe.id), '')), 'D')
+        WHERE recipe.id = ANY(%(recipe_pks)s)
+    """
+
+    def index_recipes(self, recipe_pks):
+        with connection.cursor() as cursor:
+            cursor.execute(self.update_sql, {
+                "config": self.config,
+                "recipe_pks": list(recipe_pks),
+            })
+
+    def search(self, recipes, query):
+        if not query.strip():
+            return recipes.none()
+
+        tsquery = "plainto_tsquery(%s::regconfig, %s)"
+        return recipes.annotate(
+            search_match=RawSQL(
+                f"recipes_recipe.search_vector @@ {tsquery}",
+                [self.config, query],
+                output_field=BooleanField(),
+            ),
+            search_rank=RawSQL(
+                f"ts_rank(recipes_recipe.search_vector, {tsquery})",
+                [self.config, query],
+                output_field=FloatField(),
+            ),
+        ).filter(search_match=True).order_by("-search_rank", "pk")
+
+
+def get_search_backend():
+    if connection.vendor == "postgresql":
+        return PostgresSearchBackend()
+    return PostingsSearchBackend()
+
+
+def index_recipes(recipe_pks):
+    """
+    Bring the search index up to date for the given recipes.
+    """
+    recipe_pks = list(recipe_pks)
+    if recipe_pks:
+        get_search_backend().index_recipes(recipe_pks)
+
+
+def reindex_on_commit(recipe_pks):
+    """
+    Reindex the given recipes once the current transaction commits, so
+    the index sees the final state of the recipe and its children.
+    """
+    recipe_pks = list(recipe_pks)
+    if recipe_pks:
+        transaction.on_commit(lambda: index_recipes(recipe_pks))
+
+
+def search_recipes(recipes, query):
+    """
+    Filter the `recipes` queryset down to those matching `query`, best
+    matches first. Each result is annotated with `search_rank`.
+    """
+    return get_search_backend().search(recipes, query)
@@ -0,0 +1,190 @@
+"""
+Shopping lists built from meal plans.
+
+Each ingredient of a meal plan's recipes is parsed and stored as a
+ShoppingListItem row, kept up to date as the plan's recipes and their
+ingredients change, and like items are merged when the list is read.
+Reading a shopping list for any range of dates is then a single query
+over the (user, date) index, and editing an ingredient updates just its
+own rows.
+"""
+import re
+from decimal import Decimal
+from fractions import Fraction
+from functools import lru_cache
+
+from django.db.models import Sum
+
+from .models import Ingredient, MealPlan, ShoppingListItem
+from .search import normalize_term
+
+UNICODE_FRACTIONS = {
+    "¼": "1/4",
+    "½": "1/2",
+    "¾": "3/4",
+    "⅓": "1/3",
+    "⅔": "2/3",
+    "⅛": "1/8",
+}
+
+UNITS = {
+    "c": "cup",
+    "cup": "cup",
+    "cups": "cup",
+    "t": "tsp",
+    "tsp": "tsp",
+    "teaspoon": "tsp",
+    "teaspoons": "tsp",
+    "T": "tbsp",
+    "tbs": "tbsp",
+    "tbsp": "tbsp",
+    "tablespoon": "tbsp",
+    "tablespoons": "tbsp",
+    "oz": "oz",
+    "ounce": "oz",
+    "ounces": "oz",
+    "lb": "lb",
+    "lbs": "lb",
+    "pound": "lb",
+    "pounds": "lb",
+    "g": "g",
+    "gram": "g",
+    "grams": "g",
+    "kg": "kg",
+    "ml": "ml",
+    "l": "l",
+    "liter": "l",
+    "liters": "l",
+    "clove": "clove",
+    "cloves": "clove",
+    "can": "can",
+    "cans": "can",
+    "pinch": "pinch",
+    "pinches": "pinch",
+}
+
+QUANTITY_RE = re.compile(
+    r"^\s*(?:(?P<whole>\d+(?:\.\d+)?)(?![\d.]|\s*/))?"
+    r"(?:\s*(?P<numerator>\d+)\s*/\s*(?P<denominator>\d+))?"
+    r"(?P<rest>.*)$")
+
+
+@lru_cache(maxsize=4096)
+def parse_amount(amount):
+    """
+    Split an ingredient amount such as "1 1/2 cups" into a quantity and a
+    normalized unit, e.g. (Fraction(3, 2), "cup"). The quantity is None if
+    the amount doesn't start with a number, in which case the whole amount
+    is used as the unit so that identical amounts still merge.
+
+    Amounts repeat a lot across recipes, so results are cached.
+    """
+    for symbol, fraction in UNICODE_FRACTIONS.items():
+        amount = amount.replace(symbol, f" {fraction}")
+
+    match = QUANTITY_RE.match(amount)
+    whole, numerator, denominator, rest = match.group(
+        "whole", "numerator", "denominator", "rest")
+    if whole is None and numerator is None:
+        return None, " ".join(amount.lower().split())
+
+    quantity = Fraction(whole or 0)
+    if numerator is not None:
+        if int(denominator) == 0:
+            return None, " ".join(amount.lower().split())
+        quantity += Fraction(int(numerator), int(denominator))
+
+    unit = rest.strip().rstrip(".")
+    unit = UNITS.get(unit, UNITS.get(unit.lower(), unit.lower()))
+    return quantity, unit
+
+
+def normalize_item(item):
+    return " ".join(normalize_term(word) for word in item.lower().split())
+
+
+def format_quantity(quantity):
+    """
+    Format a Decimal quantity as a whole number and a kitchen fraction,
+    e.g. Decimal("1.5") as "1 1/2".
+    """
+    if quantity is None:
+        return ""
+    fraction = Fraction(quantity).limit_denominator(8)
+    whole, remainder = divmod(fraction.numerator, fraction.denominator)
+    if not remainder:
+        return str(whole)
+    part = f"{remainder}/{fraction.denominator}"
+    return f"{whole} {part}" if whole else part
+
+
+def make_shopping_list_item(meal_plan_id, user_id, date, ingredient_id,
+                            amount, item):
+    quantity, unit = parse_amount(amount)
+    if quantity is not None:
+        quantity = round(Decimal(quantity.numerator) / quantity.denominator,
+                         4)
+    return ShoppingListItem(meal_plan_id=meal_plan_id,
+                            user_id=user_id,
+                            date=date,
+                            ingredient_id=ingredient_id,
+                            item=normalize_item(item),
+                            unit=unit,
+                            quantity=quantity)
+
+
+def rebuild_shopping_lists(meal_plan_ids):
+    """
+    Recompute the stored shopping list items of the given meal plans from
+    their recipes' ingredients, using one read and one bulk write.
+    """
+    meal_plan_ids = set(meal_plan_ids)
+    if not meal_plan_ids:
+        return
+
+    ShoppingListItem.objects.filter(meal_plan_id__in=meal_plan_ids).delete()
+
+    ingredients = Ingredient.objects.filter(
+        recipe__meal_plans__in=meal_plan_ids).values_list(
+            "recipe__meal_plans", "recipe__meal_plans__user",
+            "recipe__meal_plans__date", "pk", "amount", "item")
+    items = [make_shopping_list_item(*row) for row in ingredients]
+    ShoppingListItem.objects.bulk_create(items, batch_size=1000)
+
+
+def add_ingredient_to_shopping_lists(ingredient):
+    """
+    Add a new ingredient to the stored shopping list of each meal plan its
+    recipe is in.
+    """
+    meal_plans = MealPlan.objects.filter(
+        recipes=ingredient.recipe_id).values_list("pk", "user", "date")
+    items = [
+        make_shopping_list_item(meal_plan_id, user_id, date, ingredient.pk,
+                                ingredient.amount, ingredient.item)
+        for meal_plan_id, user_id, date in meal_plans
+    ]
+    ShoppingListItem.objects.bulk_create(items, batch_size=1000)
+
+
+def update_ingredient_in_shopping_lists(ingredient):
+    """
+    Bring an edited ingredient's stored shopping list items up to date
+    with a single UPDATE. Deleted ingredients take their items with them.
+    """
+    new_item = make_shopping_list_item(None, None, None, ingredient.pk,
+                                       ingredient.amount, ingredient.item)
+    ShoppingListItem.objects.filter(ingredient=ingredient).update(
+        item=new_item.item, unit=new_item.unit, quantity=new_item.quantity)
+
+
+def get_shopping_list(user, start, end):
+    """
+    Return the merged shopping list for `user`'s meal plans from `start`
+    to `end` (inclusive) as a list of dicts with item, unit and quantity.
+    """
+    return list(
+        ShoppingListItem.objects.filter(
+            user=user, date__range=(start, end)).values(
+                "item", "unit").annotate(
+                    quantity=Sum("quantity")).order_by("item", "unit"))
@@ -0,0 +1,292 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from .fragments import delete_fragments
+from .models import (
+    Ingredient,
+    MealPlan,
+    Recipe,
+    RecipeStep,
+    Tag,
+    User,
+    make_favorite_ids_key,
+    tag_id_cache,
+    tag_name_index,
+)
+from .search import reindex_on_commit
+from .shopping import (
+    add_ingredient_to_shopping_lists,
+    rebuild_shopping_lists,
+    update_ingredient_in_shopping_lists,
+)
+
+
+def get_changed_recipe_pks(sender, instance, action, pk_set):
+    """
+    Given the arguments of an m2m_changed signal on a relation to Recipe,
+    return the pks of the recipes whose rows changed, or None for the
+    "pre_" actions that happen before anything has changed.
+    """
+    cleared_attr = f"_cleared_{sender._meta.model_name}_pks"
+
+    if isinstance(instance, Recipe):
+        recipe_pks = [instance.pk]
+    elif action == "pre_clear":
+        # Remember which recipes are about to lose a row so we can
+        # update them once the clear has happened.
+        source_field = instance._meta.model_name
+        setattr(
+            instance, cleared_attr,
+            list(
+                sender.objects.filter(**{
+                    source_field: instance
+                }).values_list("recipe_id", flat=True)))
+        return None
+    elif action == "post_clear":
+        recipe_pks = getattr(instance, cleared_attr, [])
+    else:
+        recipe_pks = pk_set
+
+    if action.startswith("pre_"):
+        return None
+    return recipe_pks
+
+
+@receiver(m2m_changed, sender=Recipe.favorited_by.through)
+@receiver(m2m_changed, sender=MealPlan.recipes.through)
+def update_recipe_counters(sender, instance, action, pk_set, **kwargs):
+    """
+    Keep `Recipe.times_favorited`, `times_cooked` and `first_cooked` in
+    step with the favorites and meal plan M2M tables.
+
+    This runs inside the same transaction as the M2M write, so the stored
+    counters never disagree with the rows they summarize.
+    """
+    recipe_pks = get_changed_recipe_pks(sender, instance, action, pk_set)
+    if not recipe_pks:
+        return
+    recipes = Recipe.objects.filter(pk__in=recipe_pks)
+    if sender is Recipe.favorited_by.through:
+        recipes.favorites_changed()
+    else:
+        recipes.refresh_counters()
+
+
+@receiver(m2m_changed, sender=Recipe.favorited_by.through)
+def invalidate_favorite_ids(sender, instance, action, pk_set, **kwargs):
+    """
+    Drop the cached favorite ids of users whose favorites were changed
+    through the M2M manager rather than User.toggle_favorite_recipe().
+    """
+    if isinstance(instance, User):
+        user_pks = [instance.pk]
+    elif action == "pre_clear":
+        instance._cleared_favorited_by_pks = list(
+            instance.favorited_by.values_list("pk", flat=True))
+        return
+    elif action == "post_clear":
+        user_pks = getattr(instance, "_cleared_favorited_by_pks", [])
+    else:
+        user_pks = pk_set
+
+    if action.startswith("post_") and user_pks:
+        keys = [make_favorite_ids_key(user_pk) for user_pk in user_pks]
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def recipe_content_changed(recipe_pks):
+    """
+    Invalidate the cached fragments and search index entries of recipes
+    whose title, tags, ingredients or steps have changed.
+    """
+    recipe_pks = list(recipe_pks)
+    if recipe_pks:
+        Recipe.objects.filter(pk__in=recipe_pks).bump_cache_version()
+        reindex_on_commit(recipe_pks)
+
+
+@receiver(post_save, sender=Recipe)
+def saved_recipe_changed(sender, instance, **kwargs):
+    recipe_content_changed([instance.pk])
+
+
+@receiver(post_delete, sender=Recipe)
+def evict_deleted_recipe(sender, instance, **kwargs):
+    delete_fragments(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def deleted_recipe_fork_count(sender, instance, **kwargs):
+    if instance.original_recipe_id is not None:
+        Recipe.objects.filter(
+            pk=instance.original_recipe_id).refresh_fork_counts()
+
+
+@receiver(post_save, sender=Recipe)
+def saved_recipe_fork_counts(sender, instance, created, **kwargs):
+    # Recipe.objects.bulk_insert() does this itself when it skips save().
+    was_original_recipe_id = getattr(instance, "_was_original_recipe_id",
+                                     instance.original_recipe_id)
+    if created:
+        original_pks = {instance.original_recipe_id}
+    elif was_original_recipe_id != instance.original_recipe_id:
+        original_pks = {was_original_recipe_id, instance.original_recipe_id}
+    else:
+        return
+    original_pks.discard(None)
+    if original_pks:
+        Recipe.objects.filter(pk__in=original_pks).refresh_fork_counts()
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_save, sender=RecipeStep)
+@receiver(post_delete, sender=RecipeStep)
+def recipe_child_changed(sender, instance, **kwargs):
+    recipe_content_changed([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, pk_set, **kwargs):
+    recipe_pks = get_changed_recipe_pks(sender, instance, action, pk_set)
+    if recipe_pks:
+        recipe_content_changed(recipe_pks)
+
+
+@receiver(post_save, sender=Tag)
+def renamed_tag_changed(sender, instance, created, **kwargs):
+    if not created:
+        recipe_content_changed(
+            instance.recipes.values_list("pk", flat=True))
+
+
+@receiver(pre_delete, sender=Tag)
+def deleted_tag_changed(sender, instance, **kwargs):
+    recipe_content_changed(instance.recipes.values_list("pk", flat=True))
+
+
+@receiver(post_save, sender=Tag)
+def update_tag_id_cache(sender, instance, **kwargs):
+    # The tag may have been renamed, so drop whatever name it had before.
+    tag_id_cache.delete_value(instance.pk)
+
+    def update_caches():
+        tag_id_cache.set_many({instance.tag: instance.pk})
+        tag_name_index.add_many({instance.pk: instance.tag})
+
+    transaction.on_commit(update_caches)
+
+
+@receiver(post_delete, sender=Tag)
+def evict_deleted_tag(sender, instance, **kwargs):
+    tag_id_cache.delete_value(instance.pk)
+    tag_name_index.remove(instance.pk)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def update_tag_recipe_counts(sender, instance, action, pk_set, **kwargs):
+    """
+    Keep `Tag.public_recipe_count` in step with the recipe tags M2M table.
+    Tagging or untagging a public recipe moves the counts of just those
+    tags by one.
+    """
+    if isinstance(instance, Tag):
+        if action.startswith("post_"):
+            Tag.objects.filter(pk=instance.pk).refresh_recipe_counts()
+        return
+
+    # remove() is given the pks to remove whether or not they were there.
+    if action == "pre_remove":
+        instance._removed_tag_pks = list(
+            instance.tags.filter(pk__in=pk_set).values_list("pk", flat=True))
+    elif action == "pre_clear":
+        instance._cleared_tag_pks = list(
+            instance.tags.values_list("pk", flat=True))
+    elif action.startswith("post_"):
+        if action == "post_add":
+            tag_pks, delta = pk_set, 1
+        elif action == "post_remove":
+            tag_pks, delta = getattr(instance, "_removed_tag_pks", []), -1
+        else:
+            tag_pks, delta = getattr(instance, "_cleared_tag_pks", []), -1
+        if tag_pks:
+            Tag.objects.filter(pk__in=tag_pks).count_recipe(instance.pk, delta)
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_saved_recipe_state(sender, instance, update_fields, **kwargs):
+    """
+    Remember whether the recipe was public and what it was a copy of
+    before this save, for the counters that depend on them.
+    """
+    instance._was_public = None
+    instance._was_original_recipe_id = instance.original_recipe_id
+    if instance._state.adding or not (update_fields is None
+                                      or {"public", "original_recipe"}
+                                      & set(update_fields)):
+        return
+    row = Recipe.objects.filter(pk=instance.pk).values_list(
+        "public", "original_recipe_id").first()
+    if row is not None:
+        instance._was_public, instance._was_original_recipe_id = row
+        if update_fields is not None and "public" not in update_fields:
+            instance._was_public = None
+
+
+@receiver(post_save, sender=Recipe)
+def saved_recipe_tag_counts(sender, instance, created, **kwargs):
+    # A new recipe has no tags yet, but an old one may have been made
+    # public or private.
+    was_public = getattr(instance, "_was_public", None)
+    if created or was_public is None or was_public == instance.public:
+        return
+    delta = 1 if instance.public else -1
+    Tag.objects.filter(recipes=instance).update(
+        public_recipe_count=F("public_recipe_count") + delta)
+
+
+@receiver(pre_delete, sender=Recipe)
+def remember_deleted_recipe_tags(sender, instance, **kwargs):
+    # Like its meal plan rows, the recipe's tag rows go without an
+    # m2m_changed signal.
+    instance._tag_pks = list(instance.tags.values_list("pk", flat=True))
+
+
+@receiver(post_delete, sender=Recipe)
+def deleted_recipe_tag_counts(sender, instance, **kwargs):
+    tag_pks = getattr(instance, "_tag_pks", [])
+    if tag_pks:
+        Tag.objects.filter(pk__in=tag_pks).refresh_recipe_counts()
+
+
+@receiver(m2m_changed, sender=MealPlan.recipes.through)
+def meal_plan_recipes_changed(sender, instance, action, pk_set, **kwargs):
+    if isinstance(instance, MealPlan):
+        if action.startswith("post_"):
+            rebuild_shopping_lists([instance.pk])
+    elif action == "pre_clear":
+        instance._cleared_meal_plan_ids = list(
+            instance.meal_plans.values_list("pk", flat=True))
+    elif action == "post_clear":
+        rebuild_shopping_lists(getattr(instance, "_cleared_meal_plan_ids", []))
+    elif action.startswith("post_"):
+        rebuild_shopping_lists(pk_set)
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_saved(sender, instance, created, **kwargs):
+    # Deleting an ingredient (or its recipe) deletes its shopping list
+    # items along with it.
+    if created:
+        add_ingredient_to_shopping_lists(instance)
+    else:
+        update_ingredient_in_shopping_lists(instance)
@@ -0,0 +1,279 @@
+"""
+Precomputed "similar recipes": for each public recipe, the public recipes
+whose tags and catalog items (see recipes.catalog) overlap most with its
+own, stored in `SimilarRecipe` so the recipe detail page reads them with
+one indexed lookup.
+
+Comparing every pair of recipes does not scale, so each recipe gets a
+MinHash signature of its features: NUM_HASHES hash functions, each
+keeping the smallest value over the features. Two signatures agree in a
+position with a probability equal to the Jaccard similarity of the two
+feature sets. Signatures are cut into BANDS bands and each band is hashed
+to a bucket (locality-sensitive hashing); only recipes sharing a bucket
+are compared. With 16 bands of 4 rows, a pair with a similarity of 0.5
+shares a bucket two times in three, one with 0.2 about one time in forty.
+
+Signatures are NumPy arrays of unsigned 32-bit ints. A signature is the
+column-wise minimum of its features' hashes, and a recipe's candidates
+are scored against it all at once.
+
+update_similar_recipes() is incremental: it only recomputes recipes whose
+`cache_version` differs from the one their signature was built from (or
+that have none yet), plus the recipes whose neighbour lists pointed at
+them. It is run offline by the update_similar_recipes command.
+"""
+import hashlib
+import heapq
+from functools import lru_cache
+
+import numpy as np
+from django.db import transaction
+from django.db.models import F
+
+from .models import (Ingredient, Recipe, RecipeSignature, SignatureBucket,
+                     SimilarRecipe)
+
+NUM_HASHES = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_HASHES // BANDS
+
+# How many similar recipes to keep per recipe, and how similar they must
+# at least be.
+SIMILAR_RECIPE_COUNT = 10
+MIN_SIMILARITY = 0.2
+
+# Signatures are stored as the bytes of this type.
+SIGNATURE_DTYPE = np.dtype("<u4")
+
+
+@lru_cache(maxsize=65536)
+def hash_feature(feature):
+    """
+    Return NUM_HASHES independent 32-bit hashes of `feature`, read from a
+    single SHAKE-128 digest.
+    """
+    return np.frombuffer(
+        hashlib.shake_128(feature.encode()).digest(NUM_HASHES * 4),
+        dtype=SIGNATURE_DTYPE)
+
+
+def make_signature(features):
+    return np.vstack([hash_feature(feature) for feature in features]).min(
+        axis=0)
+
+
+def get_buckets(signature):
+    buckets = []
+    for band, rows in enumerate(signature.reshape(BANDS, ROWS_PER_BAND)):
+        digest = hashlib.blake2b(bytes([band]) + rows.tobytes(),
+                                 digest_size=8).digest()
+        buckets.append(int.from_bytes(digest, "little", signed=True))
+    return buckets
+
+
+def estimate_similarities(signature, other_signatures):
+    """
+    Return the estimated similarity of `signature` to each row of the
+    matrix `other_signatures`.
+    """
+    return np.count_nonzero(other_signatures == signature,
+                            axis=1) / NUM_HASHES
+
+
+def get_features(recipe_pks):
+    """
+    Return a dict mapping each of `recipe_pks` to the set of its features:
+    its tags and the catalog items of its ingredients.
+    """
+    features = {recipe_pk: set() for recipe_pk in recipe_pks}
+    recipe_tags = Recipe.tags.through.objects.filter(
+        recipe_id__in=recipe_pks).values_list("recipe_id", "tag_id")
+    for recipe_pk, tag_pk in recipe_tags:
+        features[recipe_pk].add(f"tag:{tag_pk}")
+    ingredients = Ingredient.objects.filter(
+        recipe_id__in=recipe_pks,
+        catalog_item__isnull=False).values_list("recipe_id", "catalog_item_id")
+    for recipe_pk, item_pk in ingredients:
+        features[recipe_pk].add(f"item:{item_pk}")
+    return features
+
+
+def update_signatures(recipe_versions):
+    """
+    Store the signatures and buckets of the recipes in `recipe_versions`,
+    a dict mapping recipe pks to the `cache_version` their features were
+    read at. Recipes without features get an empty signature and no
+    buckets.
+    """
+    signatures = []
+    buckets = []
+    for recipe_pk, features in get_features(list(recipe_versions)).items():
+        signature = (make_signature(features)
+                     if features else np.empty(0, SIGNATURE_DTYPE))
+        signatures.append(
+            RecipeSignature(recipe_id=recipe_pk,
+                            cache_version=recipe_versions[recipe_pk],
+                            minhash=signature.tobytes()))
+        if features:
+            buckets.extend(
+                SignatureBucket(recipe_id=recipe_pk, bucket=bucket)
+                for bucket in get_buckets(signature))
+
+    with transaction.atomic():
+        RecipeSignature.objects.filter(recipe_id__in=recipe_versions).delete()
+        SignatureBucket.objects.filter(recipe_id__in=recipe_versions).delete()
+        RecipeSignature.objects.bulk_create(signatures, batch_size=1000)
+        SignatureBucket.objects.bulk_create(buckets, batch_size=1000)
+
+
+def load_signatures(recipe_pks):
+    """
+    Return the signatures of those of `recipe_pks` that have features as
+    the rows of a matrix, and a dict mapping their pks to their rows.
+    """
+    rows = {}
+    minhashes = []
+    signatures = RecipeSignature.objects.filter(
+        recipe_id__in=recipe_pks).values_list("recipe_id", "minhash")
+    for recipe_pk, minhash in signatures:
+        if len(minhash) == NUM_HASHES * SIGNATURE_DTYPE.itemsize:
+            rows[recipe_pk] = len(minhashes)
+            minhashes.append(bytes(minhash))
+    matrix = np.frombuffer(b"".join(minhashes), dtype=SIGNATURE_DTYPE)
+    return matrix.reshape(len(minhashes), NUM_HASHES), rows
+
+
+def update_neighbours(recipe_pks):
+    """
+    Recompute the similar recipes of `recipe_pks` from the stored
+    signatures, and add each of them to the lists of the recipes it is
+    similar to where it ranks high enough.
+    """
+    recipe_buckets = SignatureBucket.objects.filter(
+        recipe_id__in=recipe_pks).values_list("recipe_id", "bucket")
+    buckets = {}
+    for recipe_pk, bucket in recipe_buckets:
+        buckets.setdefault(recipe_pk, []).append(bucket)
+    members = {}
+    bucket_members = SignatureBucket.objects.filter(
+        bucket__in={bucket
+                    for recipe_buckets in buckets.values()
+                    for bucket in recipe_buckets}).values_list(
+                        "bucket", "recipe_id")
+    for bucket, recipe_pk in bucket_members:
+        members.setdefault(bucket, set()).add(recipe_pk)
+
+    candidates = {}
+    for recipe_pk, recipe_buckets in buckets.items():
+        candidates[recipe_pk] = set().union(
+            *(members[bucket] for bucket in recipe_buckets))
+        candidates[recipe_pk].discard(recipe_pk)
+    signature_pks = set(candidates).union(*candidates.values())
+    signatures, rows = load_signatures(signature_pks)
+    # A copy of a recipe is as similar as it gets, but not worth suggesting.
+    originals = dict(
+        Recipe.objects.filter(pk__in=signature_pks).values_list(
+            "pk", "original_recipe_id"))
+
+    links = []
+    reverse_links = []
+    for recipe_pk, candidate_pks in candidates.items():
+        lineage = {recipe_pk, originals[recipe_pk]} - {None}
+        candidate_pks = [
+            candidate_pk for candidate_pk in candidate_pks
+            if candidate_pk not in lineage
+            and originals[candidate_pk] not in lineage
+        ]
+        similarities = estimate_similarities(
+            signatures[rows[recipe_pk]],
+            signatures[[rows[candidate_pk] for candidate_pk in candidate_pks]])
+        scores = []
+        for index in np.flatnonzero(similarities >= MIN_SIMILARITY):
+            candidate_pk = candidate_pks[index]
+            score = float(similarities[index])
+            scores.append((score, -candidate_pk))
+            # Recipes in this batch get their own list computed here.
+            if candidate_pk not in candidates:
+                reverse_links.append(
+                    SimilarRecipe(recipe_id=candidate_pk,
+                                  similar_id=recipe_pk,
+                                  score=score))
+        links.extend(
+            SimilarRecipe(recipe_id=recipe_pk,
+                          similar_id=-candidate_pk,
+                          score=score)
+            for score, candidate_pk in heapq.nlargest(SIMILAR_RECIPE_COUNT,
+                                                      scores))
+
+    with transaction.atomic():
+        SimilarRecipe.objects.filter(recipe_id__in=recipe_pks).delete()
+        SimilarRecipe.objects.filter(similar_id__in=recipe_pks).delete()
+        SimilarRecipe.objects.bulk_create(links, batch_size=1000)
+        SimilarRecipe.objects.bulk_create(reverse_links, batch_size=1000)
+        trim_neighbours({link.recipe_id for link in reverse_links})
+
+
+def trim_neighbours(recipe_pks):
+    """
+    Drop all but the SIMILAR_RECIPE_COUNT most similar recipes from the
+    lists of `recipe_pks`.
+    """
+    rows = SimilarRecipe.objects.filter(recipe_id__in=recipe_pks).order_by(
+        "recipe_id", "-score", "similar_id").values_list("pk", "recipe_id")
+    kept = {}
+    extra_pks = []
+    for pk, recipe_pk in rows:
+        kept[recipe_pk] = kept.get(recipe_pk, 0) + 1
+        if kept[recipe_pk] > SIMILAR_RECIPE_COUNT:
+            extra_pks.append(pk)
+    SimilarRecipe.objects.filter(pk__in=extra_pks).delete()
+
+
+def in_batches(pks, batch_size):
+    for start in range(0, len(pks), batch_size):
+        yield pks[start:start + batch_size]
+
+
+def update_similar_recipes(full=False, batch_size=500):
+    """
+    Bring the stored signatures and similar recipes up to date with the
+    public recipes, recomputing everything if `full` is set. Returns the
+    number of signatures and of neighbour lists that were recomputed.
+    """
+    if full:
+        with transaction.atomic():
+            SimilarRecipe.objects.all().delete()
+            SignatureBucket.objects.all().delete()
+            RecipeSignature.objects.all().delete()
+
+    # Recipes that were deleted took their rows with them; the ones made
+    # private are dropped here.
+    unlisted_pks = list(
+        RecipeSignature.objects.filter(recipe__public=False).values_list(
+            "recipe_id", flat=True))
+
+    stale = dict(
+        Recipe.objects.filter(public=True).exclude(
+            signature__cache_version=F("cache_version")).values_list(
+                "pk", "cache_version"))
+    changed_pks = list(stale) + unlisted_pks
+    affected_pks = set(stale)
+    for batch in in_batches(changed_pks, batch_size):
+        affected_pks.update(
+            SimilarRecipe.objects.filter(similar_id__in=batch).values_list(
+                "recipe_id", flat=True))
+    affected_pks.difference_update(unlisted_pks)
+
+    for batch in in_batches(unlisted_pks, batch_size):
+        with transaction.atomic():
+            SimilarRecipe.objects.filter(recipe_id__in=batch).delete()
+            SimilarRecipe.objects.filter(similar_id__in=batch).delete()
+            SignatureBucket.objects.filter(recipe_id__in=batch).delete()
+            RecipeSignature.objects.filter(recipe_id__in=batch).delete()
+
+    for batch in in_batches(sorted(stale), batch_size):
+        update_signatures({recipe_pk: stale[recipe_pk] for recipe_pk in batch})
+    for batch in in_batches(sorted(affected_pks), batch_size):
+        update_neighbours(batch)
+
+    return len(stale), len(affected_pks)
@@ -0,0 +1,44 @@
+from django import template
+
+from recipes.fragments import render_fragment
+
+register = template.Library()
+
+
+class RecipeFragmentNode(template.Node):
+    def __init__(self, nodelist, recipe, name):
+        self.nodelist = nodelist
+        self.recipe = recipe
+        self.name = name
+
+    def render(self, context):
+        recipe = self.recipe.resolve(context)
+        name = self.name.resolve(context)
+        return render_fragment(recipe, name,
+                               lambda: self.nodelist.render(context))
+
+
+@register.tag
+def recipefragment(parser, token):
+    """
+    Cache the enclosed template for a recipe until the recipe changes.
+
+    Usage::
+
+        {% recipefragment recipe "ingredients" %}
+            ...
+        {% endrecipefragment %}
+
+    Only put markup in here that is the same for every viewer.
+    """
+    try:
+        tag_name, recipe, name = token.split_contents()
+    except ValueError:
+        raise template.TemplateSyntaxError(
+            f"{token.contents.split()[0]!r} tag requires a recipe and a "
+            "fragment name")
+
+    nodelist = parser.parse(("endrecipefragment", ))
+    parser.delete_first_token()
+    return RecipeFragmentNode(nodelist, parser.compile_filter(recipe),
+                              parser.compile_filter(name))
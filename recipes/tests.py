@@ -1,5 +1,62 @@
-from django.test import TestCase
-from recipes.models import Recipe
+import datetime
+import io
+import json
+import random
+import re
+import tempfile
+import time
+from decimal import Decimal
+from fractions import Fraction
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count
+from django.test import (
+    RequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.http import urlencode
+from recipes import async_views
+from recipes.catalog import normalize_ingredient
+from recipes.checks import check_async_middleware
+from recipes.fragments import get_fragment_cache, get_stats, reset_stats
+from recipes.importer import import_recipes
+from recipes.management.commands.benchmark_routes import (
+    get_routes,
+    get_sample,
+    get_url,
+    send_request,
+)
+from recipes.metrics import DB_QUERIES, TEMPLATE_DURATION, reset_metrics
+from recipes.models import (
+    CatalogItem,
+    Ingredient,
+    MealPlan,
+    Recipe,
+    Tag,
+    User,
+    catalog_item_id_cache,
+    tag_id_cache,
+    tag_name_index,
+)
+from recipes.pagination import InvalidCursor, KeysetPaginator
+from recipes.pantry import PantryIndex, pantry_index
+from recipes.recommendations import update_recommendations
+from recipes.search import index_recipes, search_recipes
+from recipes.shopping import get_shopping_list, parse_amount
+from recipes.similarity import update_similar_recipes
+from recipes.views import MAX_RECIPES_PER_COPY, RECIPE_SORT_MODES
 
 
 class RecipeTestCase(TestCase):
@@ -10,3 +67,1782 @@ class RecipeTestCase(TestCase):
     def test_total_recipe_time_is_none_if_cook_or_prep_time_is_none(self):
         recipe = Recipe(prep_time_in_minutes=10)
         self.assertIsNone(recipe.total_time_in_minutes())
+
+    def test_total_time_is_stored_on_save(self):
+        user = User.objects.create(username="cook")
+        recipe = Recipe.objects.create(user=user,
+                                       title="Soup",
+                                       prep_time_in_minutes=10)
+        self.assertIsNone(recipe.total_time)
+        recipe.cook_time_in_minutes = 20
+        recipe.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.total_time, 30)
+
+    def test_save_keeps_counters_changed_since_the_recipe_was_loaded(self):
+        user = User.objects.create(username="cook")
+        recipe = Recipe.objects.create(user=user, title="Soup")
+        stale = Recipe.objects.get(pk=recipe.pk)
+        Recipe.objects.filter(pk=recipe.pk).fork_for(user)
+        user.toggle_favorite_recipe(recipe)
+        recipe.refresh_from_db()
+
+        stale.title = "Broth"
+        stale.save()
+        saved = Recipe.objects.get(pk=recipe.pk)
+        self.assertEqual(saved.title, "Broth")
+        self.assertEqual(saved.times_favorited, 1)
+        self.assertEqual(saved.fork_count, 1)
+        self.assertEqual(saved.favorites_version,
+                         recipe.favorites_version)
+        # Saving bumps the version once more rather than taking it back.
+        self.assertEqual(saved.cache_version, recipe.cache_version + 1)
+
+
+class TagNamesTestCase(TransactionTestCase):
+    def setUp(self):
+        tag_id_cache.clear()
+        catalog_item_id_cache.clear()
+        self.user = User.objects.create(username="cook")
+        self.recipe = Recipe.objects.create(user=self.user, title="Soup")
+
+    def count_queries(self, tag_names):
+        recipe = Recipe.objects.create(user=self.user, title="Stew")
+        with CaptureQueriesContext(connection) as queries:
+            recipe.set_tag_names(tag_names)
+        return len(queries)
+
+    def test_set_tag_names_costs_the_same_for_any_number_of_tags(self):
+        one_tag = self.count_queries("tag0")
+        twenty_tags = self.count_queries(" ".join(f"tag{i}"
+                                                  for i in range(1, 21)))
+        self.assertEqual(twenty_tags, one_tag)
+        self.assertEqual(Tag.objects.count(), 21)
+
+        # Once the tags exist, they no longer need creating.
+        self.assertLess(self.count_queries("tag0 tag1 tag2"), one_tag)
+
+    def test_renamed_and_deleted_tags_leave_the_cache(self):
+        self.recipe.set_tag_names("soup soup lunch")
+        self.assertEqual(self.recipe.get_tag_names(), "soup lunch")
+
+        tag = Tag.objects.get(tag="soup")
+        tag.tag = "stew"
+        tag.save()
+        Tag.objects.get(tag="lunch").delete()
+        self.assertEqual(Tag.objects.resolve_names(["soup", "lunch"],
+                                                   create=False), {})
+        self.assertEqual(Tag.objects.resolve_names(["stew"]),
+                         {"stew": tag.pk})
+
+    def test_tags_deleted_by_other_processes_are_recreated(self):
+        self.recipe.set_tag_names("soup")
+        tag = Tag.objects.get(tag="soup")
+        tag.delete()
+        # The cache of a worker other than the one that deleted the tag
+        # still has its pk.
+        tag_id_cache.set_many({"soup": tag.pk})
+
+        self.recipe.set_tag_names("soup")
+        self.assertEqual(self.recipe.get_tag_names(), "soup")
+        self.assertEqual(tag_id_cache.get_many(["soup"]),
+                         {"soup": Tag.objects.get(tag="soup").pk})
+
+
+@override_settings(
+    STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage")
+class TagBrowsingTestCase(TransactionTestCase):
+    def setUp(self):
+        tag_id_cache.clear()
+        catalog_item_id_cache.clear()
+        tag_name_index.clear()
+        self.user = User.objects.create(username="cook")
+        self.recipe = Recipe.objects.create(user=self.user, title="Soup")
+
+    def autocomplete(self, prefix):
+        response = self.client.get(reverse("tag_autocomplete"), {"q": prefix})
+        return response.json()["tags"]
+
+    def get_counts(self):
+        return dict(Tag.objects.values_list("tag", "public_recipe_count"))
+
+    def test_autocomplete_follows_tag_changes_without_queries(self):
+        self.recipe.set_tag_names("Soup sourdough salad")
+        self.assertEqual(self.autocomplete("SO"), ["Soup", "sourdough"])
+
+        Recipe.objects.create(user=self.user,
+                              title="Stew").set_tag_names("sorrel")
+        tag = Tag.objects.get(tag="Soup")
+        tag.tag = "broth"
+        tag.save()
+        Tag.objects.get(tag="sourdough").delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.autocomplete("so"), ["sorrel"])
+            self.assertEqual(self.autocomplete("b"), ["broth"])
+            self.assertEqual(self.autocomplete(""), [])
+
+    def test_tag_cloud_counts_public_recipes(self):
+        self.recipe.set_tag_names("soup lunch")
+        stew = Recipe.objects.create(user=self.user, title="Stew")
+        stew.set_tag_names("lunch")
+        self.assertEqual(self.get_counts(), {"soup": 1, "lunch": 2})
+
+        stew.public = False
+        stew.save()
+        self.assertEqual(self.get_counts(), {"soup": 1, "lunch": 1})
+
+        # Only changes that make a difference touch the counts.
+        stew.title = "Beef stew"
+        with CaptureQueriesContext(connection) as queries:
+            stew.save()
+            stew.tags.remove(Tag.objects.get(tag="soup"))
+        self.assertFalse([
+            query for query in queries
+            if query["sql"].startswith('UPDATE "recipes_tag"')
+        ])
+        self.assertEqual(self.get_counts(), {"soup": 1, "lunch": 1})
+
+        self.recipe.tags.clear()
+        self.assertEqual(self.get_counts(), {"soup": 0, "lunch": 0})
+
+        stew.public = True
+        stew.save()
+        Recipe.objects.filter(pk=stew.pk).fork_for(self.user)
+        self.assertEqual(self.get_counts(), {"soup": 0, "lunch": 2})
+
+        stew.delete()
+        self.assertEqual(self.get_counts(), {"soup": 0, "lunch": 1})
+
+        response = self.client.get(reverse("tag_cloud"))
+        self.assertEqual([tag.tag for tag, _ in response.context["cloud"]],
+                         ["lunch"])
+
+
+@override_settings(
+    STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage")
+class FavoriteRecipesTestCase(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        tag_id_cache.clear()
+        catalog_item_id_cache.clear()
+        self.user = User.objects.create(username="cook")
+        self.recipe = Recipe.objects.create(user=self.user, title="Soup")
+        self.client.force_login(self.user)
+
+    def toggle(self):
+        return self.client.post(
+            reverse("toggle_favorite_recipe",
+                    kwargs={"recipe_pk": self.recipe.pk})).json()["favorite"]
+
+    def test_toggle_invalidates_cached_ids(self):
+        self.assertEqual(self.user.get_favorite_recipe_ids(), set())
+
+        self.assertTrue(self.toggle())
+        with self.assertNumQueries(1):
+            self.assertTrue(self.user.is_favorite_recipe(self.recipe))
+        with self.assertNumQueries(0):
+            self.assertTrue(self.user.is_favorite_recipe(self.recipe))
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.times_favorited, 1)
+
+        self.assertFalse(self.toggle())
+        with self.assertNumQueries(1):
+            self.assertFalse(self.user.is_favorite_recipe(self.recipe))
+        self.assertFalse(self.user.favorite_recipes.exists())
+
+    def test_m2m_changes_invalidate_cached_ids(self):
+        self.assertEqual(self.user.get_favorite_recipe_ids(), set())
+        self.recipe.favorited_by.add(self.user)
+        self.assertEqual(self.user.get_favorite_recipe_ids(), {self.recipe.pk})
+        self.recipe.favorited_by.clear()
+        self.assertEqual(self.user.get_favorite_recipe_ids(), set())
+
+    def test_recipe_list_marks_favorites(self):
+        self.recipe.favorited_by.add(self.user)
+        for number in range(5):
+            Recipe.objects.create(user=self.user, title=f"Stew {number}")
+
+        # Session, user, favorite ids and the page of recipes.
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse("recipe_list"))
+        self.assertContains(response, "One of your favorites", count=1)
+
+
+@override_settings(
+    STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage")
+class AsyncViewsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="cook")
+        self.recipe = Recipe.objects.create(user=self.user, title="Soup")
+        self.factory = RequestFactory()
+
+    def call(self, view, request, **kwargs):
+        request.user = self.user
+        return async_to_sync(view)(request, **kwargs)
+
+    def test_toggle_favorite_recipe(self):
+        request = self.factory.post("/")
+        response = self.call(async_views.toggle_favorite_recipe,
+                             request,
+                             recipe_pk=self.recipe.pk)
+        self.assertEqual(json.loads(response.content), {"favorite": True})
+        self.assertTrue(self.user.favorite_recipes.filter(
+            pk=self.recipe.pk).exists())
+
+    def test_meal_plan_endpoints(self):
+        request = self.factory.post("/", {
+            "date": "2021-02-01",
+            "pk": self.recipe.pk,
+            "action": "add"
+        })
+        response = self.call(async_views.meal_plan_add_remove_recipe,
+                             request)
+        self.assertEqual(response.status_code, 204)
+
+        request = self.factory.post("/",
+                                    json.dumps([{
+                                        "date": "2021-02-01",
+                                        "pk": self.recipe.pk,
+                                        "action": "remove"
+                                    }]),
+                                    content_type="application/json")
+        response = self.call(async_views.meal_plan_update, request)
+        self.assertEqual(json.loads(response.content), {"applied": 1})
+        self.assertFalse(MealPlan.recipes.through.objects.exists())
+
+    def test_get_is_not_allowed(self):
+        response = self.call(async_views.meal_plan_update,
+                             self.factory.get("/"))
+        self.assertEqual(response.status_code, 405)
+
+    def test_recipe_list_partial(self):
+        request = self.factory.get("/",
+                                   HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+        response = self.call(async_views.recipe_list, request)
+        self.assertContains(response, "Soup")
+        self.assertNotContains(response, "<html")
+
+    @override_settings(DEBUG=True)
+    def test_asgi_profile_runs_views_on_the_event_loop(self):
+        # Django logs each middleware it has to adapt between sync and
+        # async, which would put the async views in a thread.
+        middleware = [
+            path for path in settings.MIDDLEWARE
+            if path != "debug_toolbar.middleware.DebugToolbarMiddleware"
+        ]
+        with override_settings(MIDDLEWARE=middleware), mock.patch(
+                "django.core.handlers.base.logger") as logger:
+            ASGIHandler()
+        self.assertEqual(logger.debug.call_args_list, [])
+
+        with override_settings(ASYNC_VIEWS=True):
+            self.assertEqual(
+                [warning.obj for warning in check_async_middleware(None)],
+                ["debug_toolbar.middleware.DebugToolbarMiddleware"])
+            with override_settings(MIDDLEWARE=middleware):
+                self.assertEqual(check_async_middleware(None), [])
+
+
+@override_settings(
+    STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage")
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        reset_metrics()
+        self.user = User.objects.create(username="cook")
+        self.recipe = Recipe.objects.create(user=self.user, title="Soup")
+        self.client.force_login(self.user)
+
+    def test_requests_are_recorded_per_view(self):
+        self.client.get(reverse("recipe_list"))
+        self.client.get(reverse("recipe_list"))
+
+        self.assertEqual(DB_QUERIES.histograms["recipe_list"].count, 2)
+        self.assertGreater(DB_QUERIES.histograms["recipe_list"].sum, 0)
+        self.assertGreater(TEMPLATE_DURATION.histograms["recipe_list"].sum,
+                           0)
+
+        response = self.client.get(reverse("metrics"))
+        self.assertContains(
+            response,
+            'recipes_request_duration_seconds_count{view="recipe_list"} 2')
+        self.assertContains(
+            response, 'recipes_request_db_queries_bucket{view="recipe_list",'
+            'le="+Inf"} 2')
+
+    async def test_async_requests_are_recorded(self):
+        await sync_to_async(self.async_client.force_login)(self.user)
+        await self.async_client.get(reverse("recipe_list"))
+
+        self.assertEqual(DB_QUERIES.histograms["recipe_list"].count, 1)
+        self.assertGreater(DB_QUERIES.histograms["recipe_list"].sum, 0)
+        self.assertGreater(TEMPLATE_DURATION.histograms["recipe_list"].sum,
+                           0)
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code,
+                         403)
+        response = self.client.get(reverse("metrics"),
+                                   HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+    def test_slow_queries_are_logged_with_their_view(self):
+        with self.assertLogs("recipes.slow_queries") as logs:
+            self.client.get(
+                reverse("recipe_detail", kwargs={"recipe_pk": self.recipe.pk}))
+        self.assertIn("in recipe_detail: SELECT", logs.output[-1])
+
+
+@override_settings(
+    STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage")
+class BenchmarkCommandsTestCase(TransactionTestCase):
+    def setUp(self):
+        tag_id_cache.clear()
+        catalog_item_id_cache.clear()
+
+    def test_generate_sample_data_and_benchmark_routes(self):
+        call_command("generate_sample_data",
+                     users=3,
+                     recipes=20,
+                     favorites=2,
+                     meal_plans=2,
+                     seed=1,
+                     stdout=io.StringIO())
+        self.assertEqual(Recipe.objects.count(), 20)
+        self.assertEqual(Recipe.favorited_by.through.objects.count(), 6)
+        recipe = Recipe.objects.filter(times_favorited__gt=0).first()
+        self.assertEqual(recipe.times_favorited, recipe.favorited_by.count())
+        self.assertTrue(MealPlan.objects.filter(recipes__isnull=False).exists())
+
+        # Sequences still work after the explicit pks.
+        user = User.objects.create(username="cook")
+        Recipe.objects.create(user=user, title="Soup")
+
+        with tempfile.NamedTemporaryFile("r", suffix=".json") as output:
+            call_command("benchmark_routes",
+                         user="cook",
+                         iterations=2,
+                         route=["recipe_list", "export_recipes"],
+                         output=output.name,
+                         stdout=io.StringIO())
+            results = json.load(output)
+        self.assertEqual(set(results["routes"]),
+                         {"recipe_list", "export_recipes"})
+        self.assertEqual(results["routes"]["recipe_list"]["status"], [200])
+        self.assertEqual(Recipe.objects.count(), 21)
+
+    def test_benchmark_recommendations(self):
+        stdout = io.StringIO()
+        call_command("benchmark_recommendations",
+                     favorites=2000,
+                     users=100,
+                     recipes=300,
+                     sample=50,
+                     stdout=stdout)
+        self.assertIn("scoring: 50 recipes", stdout.getvalue())
+
+
+# The most queries each route may run for one request, with a cold
+# fragment cache. Every route in project/urls.py must have a budget.
+QUERY_BUDGETS = {
+    "homepage": 2,
+    "recipe_list": 3,
+    "export_recipes": 6,
+    "search_recipes": 3,
+    "recipe_detail": 8,
+    "recipe_forks": 5,
+    "edit_recipe": 4,
+    "delete_recipe": 3,
+    "copy_recipe": 17,
+    "copy_recipes": 16,
+    "toggle_favorite_recipe": 8,
+    "add_recipe": 2,
+    "add_ingredient": 3,
+    "add_recipe_step": 3,
+    "reorder_recipe_steps": 8,
+    # Includes the fallback to `random_key` and re-keying the pick.
+    "random_recipe": 8,
+    "todays_meal_plan": 3,
+    "show_meal_plan": 3,
+    "show_meal_plan_week": 3,
+    "show_meal_plan_month": 4,
+    "meal_plan_recipe_picker": 3,
+    "mealplan/add-remove/": 12,
+    "meal_plan_update": 12,
+    "shopping_list": 3,
+    # Builds the pantry index, which is then reused.
+    "pantry": 6,
+    "tag_cloud": 3,
+    "view_tag": 4,
+    # Loads the tag name index, which is then reused.
+    "tag_autocomplete": 1,
+    "metrics": 0,
+}
+
+# Query strings each route is requested with besides its bare URL, so
+# that searches, filters and sort orders are checked too.
+ROUTE_QUERY_STRINGS = {
+    "recipe_list": lambda sample: [{
+        "order": mode
+    } for mode in RECIPE_SORT_MODES],
+    "export_recipes": lambda sample: [{
+        "format": "json",
+        "gzip": "1"
+    }, {
+        "after": sample["recipe_pk"]
+    }],
+    "search_recipes": lambda sample: [{
+        "q": sample["search_term"]
+    }],
+    "random_recipe": lambda sample: [{
+        "scope": "public",
+        "tag": sample["tag_name"]
+    }],
+    "meal_plan_recipe_picker": lambda sample: [{
+        "q": sample["search_term"]
+    }, {
+        "date": sample["date"]
+    }],
+    "shopping_list": lambda sample: [{
+        "start": sample["date"],
+        "end": sample["date"]
+    }],
+    "tag_autocomplete": lambda sample: [{
+        "q": sample["tag_name"][:2]
+    }],
+}
+
+# The status of routes that don't answer with a 200.
+ROUTE_STATUSES = {
+    "homepage": 302,
+    "copy_recipe": 302,
+    "copy_recipes": 302,
+    "random_recipe": 302,
+    "mealplan/add-remove/": 204,
+}
+
+# Tables that must never be read with a full scan, and the full scans
+# each route is allowed to make anyway, as (table, index) pairs. The
+# index is None when the table itself is read.
+SCAN_CHECKED_TABLES = {
+    "recipes_recipe",
+    "recipes_ingredient",
+    "recipes_recipestep",
+    "recipes_recipe_tags",
+    "recipes_recipe_favorited_by",
+    "recipes_mealplan_recipes",
+}
+# A page of recipes visible to a logged in user ("public OR user_id =
+# ...") is read by walking the sort order's index from the start until
+# the page is full. "newest" walks the table itself in pk order. Each sort
+# mode may only walk its own index, so losing one shows up as a scan.
+RECIPE_LIST_ALLOWED_SCANS = {
+    "title": {("recipes_recipe", "recipes_rec_title_3771db_idx")},
+    "newest": {("recipes_recipe", None)},
+    "favorited": {("recipes_recipe", "recipes_rec_times_f_2b062c_idx")},
+    "cooked": {("recipes_recipe", "recipes_rec_times_c_a79ce4_idx")},
+    "quickest": set(),
+}
+
+ALLOWED_TABLE_SCANS = {
+    "meal_plan_recipe_picker": {
+        ("recipes_recipe", "recipes_rec_title_3771db_idx"),
+    },
+    # Exports every visible recipe in pk order, so reading the whole
+    # table is the point.
+    "export_recipes": {("recipes_recipe", None)},
+    # Building the pantry index reads the catalog items of every public
+    # recipe once; later requests reuse it.
+    "pantry": {
+        ("recipes_ingredient", "recipes_ingredient_recipe_id_1877a0b2"),
+    },
+}
+
+SQLITE_ALIAS_RE = re.compile(r'"(\w+)" (U\d+)\b')
+SQLITE_SCAN_RE = re.compile(
+    r"^SCAN (?:TABLE )?(\w+)(?: USING (?:COVERING )?INDEX (\w+))?$")
+POSTGRES_SCAN_RE = re.compile(r"Seq Scan on (\w+)")
+SORT_RE = re.compile(r"USE TEMP B-TREE FOR ORDER BY|^[\s>-]*(Incremental )?Sort\b")
+
+
+def explain(sql):
+    """
+    Return the lines of the database's query plan for `sql`. On
+    PostgreSQL sequential scans are disabled while planning, so that they
+    only show up when no index can be used.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute(f"EXPLAIN {sql}")
+            return [line for (line, ) in cursor.fetchall()]
+
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+        return [detail for *_, detail in cursor.fetchall()]
+
+
+def find_table_scans(sql):
+    """
+    Return the full scans the database would make to run `sql`, as
+    (table, index) pairs: the index is the one walked from end to end, or
+    None if the table itself is read.
+    """
+    statement = sql.lstrip().split(None, 1)[0].upper()
+    if statement not in ("SELECT", "UPDATE", "DELETE"):
+        return set()
+
+    if connection.vendor == "postgresql":
+        return {(match.group(1), None)
+                for line in explain(sql)
+                for match in [POSTGRES_SCAN_RE.search(line)] if match}
+
+    aliases = {alias: table for table, alias in SQLITE_ALIAS_RE.findall(sql)}
+    return {(aliases.get(match.group(1), match.group(1)), match.group(2))
+            for line in explain(sql)
+            for match in [SQLITE_SCAN_RE.match(line)] if match}
+
+
+def sorts_rows(sql):
+    """
+    Return whether the database would sort the rows of `sql` itself
+    rather than reading them from an index in order.
+    """
+    return any(SORT_RE.search(line) for line in explain(sql))
+
+
+@override_settings(
+    STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage")
+class QueryBudgetTestCase(TestCase):
+    """
+    Request every route against a seeded dataset and check that it stays
+    within its query budget and that none of its queries scan a large
+    table.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        call_command("generate_sample_data",
+                     users=5,
+                     recipes=200,
+                     favorites=10,
+                     meal_plans=20,
+                     seed=1,
+                     stdout=io.StringIO())
+        cls.user = User.objects.annotate(
+            num_recipes=Count("recipes")).order_by("-num_recipes").first()
+        cls.sample = get_sample(cls.user)
+
+    def setUp(self):
+        get_fragment_cache().clear()
+        tag_name_index.clear()
+        pantry_index.clear()
+        self.client.force_login(self.user)
+
+    def capture_routes(self):
+        """
+        Request every route, bare and with each of its query strings, and
+        return (label, url, captured queries) triples, checking that each
+        request succeeds.
+        """
+        captured = []
+        for label, route in get_routes():
+            url = get_url(route, self.sample)
+            query_strings = ROUTE_QUERY_STRINGS.get(label,
+                                                    lambda sample: [])
+            urls = [url] + [
+                f"{url}?{urlencode(params)}"
+                for params in query_strings(self.sample)
+            ]
+            for url in urls:
+                with CaptureQueriesContext(connection) as queries:
+                    response = send_request(self.client, label, url,
+                                            self.sample)
+                self.assertEqual(response.status_code,
+                                 ROUTE_STATUSES.get(label, 200), url)
+                captured.append((label, url, queries.captured_queries))
+        return captured
+
+    def test_every_route_has_a_budget(self):
+        self.assertEqual({label for label, _ in get_routes()},
+                         set(QUERY_BUDGETS))
+
+    def test_routes_stay_within_their_query_budgets(self):
+        for label, url, queries in self.capture_routes():
+            with self.subTest(route=label, url=url):
+                self.assertLessEqual(
+                    len(queries), QUERY_BUDGETS.get(label, 0),
+                    "\n".join(query["sql"] for query in queries))
+
+    def test_routes_do_not_scan_large_tables(self):
+        for label, url, queries in self.capture_routes():
+            allowed = ALLOWED_TABLE_SCANS.get(label, set())
+            if label == "recipe_list":
+                mode = parse_qs(urlsplit(url).query).get("order", ["title"])
+                allowed = RECIPE_LIST_ALLOWED_SCANS[mode[0]]
+            for query in queries:
+                with self.subTest(route=label, url=url, sql=query["sql"]):
+                    scans = {(table, index)
+                             for table, index in find_table_scans(query["sql"])
+                             if table in SCAN_CHECKED_TABLES}
+                    self.assertFalse(scans - allowed)
+
+    def test_recipe_list_sort_modes_read_an_index_in_order(self):
+        recipe_list_url = reverse("recipe_list")
+        for logged_in in [True, False]:
+            if not logged_in:
+                self.client.logout()
+            for mode in RECIPE_SORT_MODES:
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(recipe_list_url,
+                                               {"order": mode})
+                    self.client.get(recipe_list_url, {
+                        "order": mode,
+                        "after": response.context["recipes"].next_cursor,
+                    })
+                for query in queries:
+                    if "recipes_recipe" not in query["sql"]:
+                        continue
+                    with self.subTest(mode=mode,
+                                      logged_in=logged_in,
+                                      sql=query["sql"]):
+                        self.assertFalse(sorts_rows(query["sql"]))
+                        # Walking the sort order's index from the start is
+                        # the point; the LIMIT stops it after one page.
+                        # SQLite reports reading its rowid table, which is
+                        # the primary key index, in order as a scan.
+                        scans = {
+                            (table, index)
+                            for table, index in find_table_scans(query["sql"])
+                            if table == "recipes_recipe"
+                        }
+                        if connection.vendor == "sqlite":
+                            self.assertLessEqual(
+                                scans, RECIPE_LIST_ALLOWED_SCANS[mode])
+                        else:
+                            self.assertFalse(scans)
+
+
+class ReorderStepsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="cook")
+        self.recipe = Recipe.objects.create(user=self.user, title="Stew")
+        for number in range(30):
+            self.recipe.steps.create(text=f"Step {number}")
+        self.recipe.refresh_from_db()
+        self.step_pks = list(self.recipe.steps.values_list("pk", flat=True))
+        self.client.force_login(self.user)
+
+    def reorder(self, step_pks, version):
+        return self.client.post(reverse("reorder_recipe_steps",
+                                        kwargs={"recipe_pk": self.recipe.pk}),
+                                json.dumps({
+                                    "steps": step_pks,
+                                    "version": version
+                                }),
+                                content_type="application/json")
+
+    def test_reorder_rewrites_every_step_in_one_update(self):
+        new_order = self.step_pks[::-1]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.reorder(new_order, self.recipe.cache_version)
+        self.assertEqual(response.json(),
+                         {"version": self.recipe.cache_version + 1})
+        self.assertEqual(
+            len([q for q in queries if q["sql"].startswith("UPDATE")]), 2)
+        self.assertEqual(list(self.recipe.steps.values_list("pk", flat=True)),
+                         new_order)
+
+    def test_second_reorder_from_the_same_version_is_refused(self):
+        version = self.recipe.cache_version
+        self.assertEqual(self.reorder(self.step_pks[::-1], version).status_code,
+                         200)
+        self.assertEqual(self.reorder(self.step_pks, version).status_code, 409)
+        self.assertEqual(list(self.recipe.steps.values_list("pk", flat=True)),
+                         self.step_pks[::-1])
+
+    def test_reorder_must_list_every_step_once(self):
+        version = self.recipe.cache_version
+        for step_pks in [self.step_pks[1:], self.step_pks + self.step_pks[:1]]:
+            self.assertEqual(self.reorder(step_pks, version).status_code, 400)
+        self.assertEqual(self.reorder("nonsense", version).status_code, 400)
+        self.assertEqual(self.reorder(self.step_pks, 2**63).status_code, 400)
+        self.assertEqual(
+            self.reorder(self.step_pks[1:] + [2**63], version).status_code,
+            400)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.cache_version, version)
+
+    def test_only_the_owner_can_reorder(self):
+        self.client.force_login(User.objects.create(username="other"))
+        response = self.reorder(self.step_pks[::-1], self.recipe.cache_version)
+        self.assertEqual(response.status_code, 404)
+
+
+class ForkRecipesTestCase(TestCase):
+    def test_fork_copies_children_in_order(self):
+        cook = User.objects.create(username="cook")
+        recipe = Recipe.objects.create(user=cook, title="Stew")
+        recipe.ingredients.create(amount="1 lb", item="beef")
+        for text in ["Brown", "Simmer", "Serve"]:
+            recipe.steps.create(text=text)
+        recipe.steps.get(text="Serve").up()
+        recipe.set_tag_names("dinner winter")
+
+        forker = User.objects.create(username="forker")
+        copy, = Recipe.objects.filter(pk=recipe.pk).fork_for(forker)
+        copy.refresh_from_db()
+        self.assertEqual(copy.title, "Stew (Copy)")
+        self.assertEqual(copy.user, forker)
+        self.assertEqual(copy.original_recipe, recipe)
+        self.assertEqual([str(i) for i in copy.ingredients.all()],
+                         ["1 lb beef"])
+        self.assertEqual([step.text for step in copy.steps.all()],
+                         ["Brown", "Serve", "Simmer"])
+        self.assertEqual(copy.get_tag_names(), "dinner winter")
+
+    def test_copy_recipes_rejects_invalid_pks(self):
+        user = User.objects.create(username="cook")
+        recipe = Recipe.objects.create(user=user, title="Stew")
+        self.client.force_login(user)
+        url = reverse("copy_recipes")
+        for pks in (["soup"], [str(10**30)], [recipe.pk] *
+                    (MAX_RECIPES_PER_COPY + 1)):
+            response = self.client.post(url, {"pk": pks})
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(Recipe.objects.count(), 1)
+
+        response = self.client.post(url, {"pk": [recipe.pk]})
+        self.assertRedirects(response,
+                             reverse("recipe_list"),
+                             fetch_redirect_response=False)
+        self.assertEqual(Recipe.objects.count(), 2)
+
+    @mock.patch("recipes.views.MAX_RECIPES_PER_COPY", 2)
+    @override_settings(STATICFILES_STORAGE=(
+        "django.contrib.staticfiles.storage.StaticFilesStorage"))
+    def test_tag_page_copies_at_most_the_limit(self):
+        user = User.objects.create(username="cook")
+        for title in ["Chili", "Soup", "Stew"]:
+            Recipe.objects.create(user=user,
+                                  title=title).set_tag_names("dinner")
+        self.client.force_login(user)
+
+        response = self.client.get(
+            reverse("view_tag", kwargs={"tag_name": "dinner"}))
+        self.assertContains(response, 'name="pk"', count=2)
+        self.assertContains(response, "Copy the first 2 of these recipes")
+
+        pks = re.findall(r'name="pk" value="(\d+)"',
+                         response.content.decode())
+        response = self.client.post(reverse("copy_recipes"), {"pk": pks})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Recipe.objects.count(), 5)
+
+
+@override_settings(
+    STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage")
+class ForkLineageTestCase(TestCase):
+    def setUp(self):
+        cook = User.objects.create(username="cook")
+        self.alice = User.objects.create(username="alice")
+        self.bob = User.objects.create(username="bob")
+        self.stew = Recipe.objects.create(user=cook, title="Stew")
+        self.alices_stew = self.fork(self.stew, self.alice, "Alice's stew")
+        self.bobs_stew = self.fork(self.alices_stew, self.bob, "Bob's stew")
+        self.secret_stew = self.fork(self.stew,
+                                     self.bob,
+                                     "Secret stew",
+                                     public=False)
+        self.spicy_stew = self.fork(self.secret_stew, self.bob, "Spicy stew")
+
+    def fork(self, recipe, user, title, public=True):
+        copy, = Recipe.objects.filter(pk=recipe.pk).fork_for(user)
+        Recipe.objects.filter(pk=copy.pk).update(title=title, public=public)
+        copy.refresh_from_db()
+        return copy
+
+    def test_fork_counts_are_kept_current(self):
+        self.stew.refresh_from_db()
+        self.assertEqual(self.stew.fork_count, 2)
+        self.bobs_stew.delete()
+        self.alices_stew.refresh_from_db()
+        self.assertEqual(self.alices_stew.fork_count, 0)
+
+    def test_fork_counts_follow_changes_to_the_original(self):
+        copy = Recipe.objects.create(user=self.bob,
+                                     title="Stew again",
+                                     original_recipe=self.alices_stew)
+        self.alices_stew.refresh_from_db()
+        self.assertEqual(self.alices_stew.fork_count, 2)
+
+        copy.original_recipe = self.bobs_stew
+        copy.save()
+        self.alices_stew.refresh_from_db()
+        self.bobs_stew.refresh_from_db()
+        self.assertEqual(self.alices_stew.fork_count, 1)
+        self.assertEqual(self.bobs_stew.fork_count, 1)
+
+        copy.original_recipe = None
+        copy.save()
+        self.bobs_stew.refresh_from_db()
+        self.assertEqual(self.bobs_stew.fork_count, 0)
+
+    def test_reconcile_fixes_drifted_fork_counts(self):
+        Recipe.objects.filter(pk=self.stew.pk).update(fork_count=5)
+        output = io.StringIO()
+        call_command("reconcile_recipe_counters", stdout=output)
+        self.assertIn("Fixed 1 recipe(s)", output.getvalue())
+        self.stew.refresh_from_db()
+        self.assertEqual(self.stew.fork_count, 2)
+
+    def test_ancestors_are_listed_oldest_first(self):
+        ancestors = self.bobs_stew.get_ancestors(AnonymousUser())
+        self.assertEqual([(recipe.title, recipe.depth)
+                          for recipe in ancestors],
+                         [("Stew", 2), ("Alice's stew", 1)])
+        self.assertEqual(
+            [recipe.title for recipe in self.spicy_stew.get_ancestors(
+                self.alice)], ["Stew"])
+
+    def test_fork_tree_hides_what_the_user_cannot_see(self):
+        forks, total = self.stew.get_fork_tree(self.alice, limit=10)
+        self.assertEqual([(recipe.title, recipe.depth) for recipe in forks],
+                         [("Alice's stew", 1), ("Bob's stew", 2)])
+        self.assertEqual(total, 2)
+
+        forks, total = self.stew.get_fork_tree(self.bob, limit=10)
+        self.assertEqual(
+            [recipe.title for recipe in forks],
+            ["Alice's stew", "Bob's stew", "Secret stew", "Spicy stew"])
+        self.assertEqual(total, 4)
+
+        # The nearest copies are kept when the tree is cut short.
+        forks, total = self.stew.get_fork_tree(self.bob, limit=2)
+        self.assertEqual([recipe.title for recipe in forks],
+                         ["Alice's stew", "Secret stew"])
+        self.assertEqual(total, 4)
+
+    def test_forks_page(self):
+        response = self.client.get(
+            reverse("recipe_forks", kwargs={"recipe_pk": self.bobs_stew.pk}))
+        self.assertContains(response, "Alice&#x27;s stew")
+        self.assertContains(response, "Copies (0)")
+
+        response = self.client.get(
+            reverse("recipe_forks", kwargs={"recipe_pk": self.stew.pk}))
+        self.assertEqual([recipe.title for recipe in response.context["forks"]],
+                         ["Alice's stew", "Bob's stew"])
+        self.assertContains(response, "(by bob)")
+
+    def test_cycles_are_walked_once(self):
+        # Only the admin can point a recipe at one of its own copies.
+        Recipe.objects.filter(pk=self.stew.pk).update(
+            original_recipe=self.alices_stew)
+
+        ancestors = self.stew.get_ancestors(self.alice)
+        self.assertEqual([(recipe.title, recipe.depth)
+                          for recipe in ancestors], [("Alice's stew", 1)])
+
+        forks, total = self.stew.get_fork_tree(self.alice, limit=10)
+        self.assertEqual([(recipe.title, recipe.depth) for recipe in forks],
+                         [("Alice's stew", 1), ("Bob's stew", 2)])
+        self.assertEqual(total, 2)
+
+        forks, total = self.alices_stew.get_fork_tree(self.alice, limit=10)
+        self.assertEqual([recipe.title for recipe in forks],
+                         ["Stew", "Bob's stew"])
+        self.assertEqual(total, 2)
+
+        response = self.client.get(
+            reverse("recipe_forks", kwargs={"recipe_pk": self.stew.pk}))
+        self.assertEqual(response.status_code, 200)
+
+
+class RandomRecipeTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="cook")
+        self.client.force_login(self.user)
+
+    def test_random_picks_from_the_filtered_recipes(self):
+        Recipe.objects.create(user=self.user, title="Private", public=False)
+        public = Recipe.objects.create(user=self.user, title="Public")
+        for _ in range(10):
+            self.assertEqual(Recipe.objects.public().random(), public)
+
+    def test_random_picks_are_uniform(self):
+        recipes = [
+            Recipe.objects.create(user=self.user, title=str(key))
+            for key in [0, 0.01, 0.02, 0.9]
+        ]
+        for recipe, key in zip(recipes, [0, 0.01, 0.02, 0.9]):
+            Recipe.objects.filter(pk=recipe.pk).update(random_key=key)
+
+        random.seed(0)
+        counts = {recipe: 0 for recipe in recipes}
+        for _ in range(400):
+            counts[Recipe.objects.random()] += 1
+        for count in counts.values():
+            self.assertGreater(count, 70)
+
+    def test_random_falls_back_to_the_random_key(self):
+        recipe = Recipe.objects.create(user=self.user, title="Soup")
+        with mock.patch("recipes.models.RANDOM_PICK_DRAWS", 0):
+            self.assertEqual(Recipe.objects.random(), recipe)
+        # The picked recipe gets a new key.
+        self.assertNotEqual(
+            Recipe.objects.get(pk=recipe.pk).random_key, recipe.random_key)
+
+    def test_random_recipe_with_no_recipes_redirects_to_list(self):
+        response = self.client.get(reverse("random_recipe"))
+        self.assertRedirects(response,
+                             reverse("recipe_list"),
+                             fetch_redirect_response=False)
+
+    def test_random_recipe_with_tag(self):
+        Recipe.objects.create(user=self.user, title="Untagged")
+        tagged = Recipe.objects.create(user=self.user, title="Tagged")
+        tagged.set_tag_names("soup")
+        response = self.client.get(reverse("random_recipe") + "?tag=soup")
+        self.assertRedirects(response,
+                             reverse("recipe_detail",
+                                     kwargs={"recipe_pk": tagged.pk}),
+                             fetch_redirect_response=False)
+
+
+@override_settings(
+    STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage")
+class ExportRecipesTestCase(TestCase):
+    def test_export_streams_visible_recipes_as_jsonl(self):
+        user = User.objects.create(username="cook")
+        soup = Recipe.objects.create(user=user, title="Soup")
+        soup.ingredients.create(amount="1", item="onion")
+        soup.steps.create(text="Chop")
+        soup.set_tag_names("lunch")
+        Recipe.objects.create(user=user, title="Secret", public=False)
+        stew = Recipe.objects.create(user=user, title="Stew")
+
+        response = self.client.get(reverse("export_recipes"))
+        rows = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).splitlines()
+        ]
+        self.assertEqual([row["title"] for row in rows], ["Soup", "Stew"])
+        self.assertEqual(rows[0]["ingredients"], [{
+            "amount": "1",
+            "item": "onion"
+        }])
+        self.assertEqual(rows[0]["steps"], ["Chop"])
+        self.assertEqual(rows[0]["tags"], ["lunch"])
+
+        response = self.client.get(
+            reverse("export_recipes") + f"?after={soup.pk}")
+        rows = b"".join(response.streaming_content).splitlines()
+        self.assertEqual([json.loads(row)["id"] for row in rows], [stew.pk])
+
+        for after in ["soup", str(2**63)]:
+            response = self.client.get(
+                reverse("export_recipes") + f"?after={after}")
+            self.assertEqual(response.status_code, 404)
+
+
+class ImportRecipesTestCase(TestCase):
+    def test_import_reports_bad_rows_and_keeps_the_rest(self):
+        user = User.objects.create(username="cook")
+        stream = io.StringIO("\n".join([
+            json.dumps({
+                "title": "Soup",
+                "tags": ["lunch", "easy"],
+                "ingredients": [{
+                    "amount": "1",
+                    "item": "onion"
+                }],
+                "steps": ["Chop", "Simmer"],
+            }),
+            "not json",
+            json.dumps({"title": ""}),
+            json.dumps({
+                "title": "Stew",
+                "public": False,
+                "tags": "dinner easy"
+            }),
+        ]))
+
+        result = import_recipes(stream, user, batch_size=2)
+        self.assertEqual(result.imported, 2)
+        self.assertEqual([line for line, errors in result.errors], [2, 3])
+
+        soup = Recipe.objects.get(title="Soup")
+        self.assertEqual(soup.to_dict(include_children=True)["steps"],
+                         ["Chop", "Simmer"])
+        self.assertEqual(soup.get_tag_names(), "lunch easy")
+        self.assertFalse(Recipe.objects.get(title="Stew").public)
+
+    def test_import_skips_rows_with_fields_of_the_wrong_type(self):
+        user = User.objects.create(username="cook")
+        stream = io.StringIO("\n".join(
+            json.dumps(row) for row in [
+                {"title": "Soup", "steps": "Chop and simmer"},
+                {"title": "Stew", "steps": 5},
+                {"title": "Pie", "steps": [{"text": "Bake"}]},
+                {"title": "Tart", "ingredients": "flour"},
+                {"title": "Cake", "tags": 5},
+                {"title": "Bread", "tags": ["yeast", 5]},
+                {"title": "Salad", "steps": ["Toss"]},
+            ]))
+
+        result = import_recipes(stream, user)
+        self.assertEqual(result.imported, 1)
+        self.assertEqual([line for line, errors in result.errors],
+                         [1, 2, 3, 4, 5, 6])
+        self.assertEqual(list(Recipe.objects.values_list("title", flat=True)),
+                         ["Salad"])
+
+
+@override_settings(
+    STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage")
+class MealPlanViewsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="cook")
+        self.client.force_login(self.user)
+
+    def test_viewing_a_day_does_not_create_a_plan(self):
+        self.client.get(
+            reverse("show_meal_plan",
+                    kwargs={
+                        "year": 2020,
+                        "month": 6,
+                        "day": 1
+                    }))
+        self.assertFalse(MealPlan.objects.exists())
+
+    def test_month_view_loads_plans_in_a_fixed_number_of_queries(self):
+        for day in range(1, 29):
+            recipe = Recipe.objects.create(user=self.user, title=f"R{day}")
+            plan = MealPlan.objects.create(user=self.user,
+                                           date=datetime.date(2021, 2, day))
+            plan.recipes.add(recipe)
+
+        url = reverse("show_meal_plan_month",
+                      kwargs={
+                          "year": 2021,
+                          "month": 2
+                      })
+        # Session, user, plans and their recipes.
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        self.assertContains(response, "R28")
+
+    def test_periods_at_the_ends_of_the_calendar_are_not_found(self):
+        for name, kwargs in [
+            ("show_meal_plan", {"year": 9999, "month": 12, "day": 31}),
+            ("show_meal_plan_week", {"year": 9999, "month": 12, "day": 31}),
+            ("show_meal_plan_week", {"year": 1, "month": 1, "day": 1}),
+            ("show_meal_plan_month", {"year": 9999, "month": 12}),
+            ("show_meal_plan_month", {"year": 1, "month": 1}),
+            ("show_meal_plan", {"year": 10**20, "month": 1, "day": 1}),
+            ("show_meal_plan_month", {"year": 10**20, "month": 1}),
+        ]:
+            response = self.client.get(reverse(name, kwargs=kwargs))
+            self.assertEqual(response.status_code, 404, kwargs)
+
+        response = self.client.get(
+            reverse("show_meal_plan_month", kwargs={"year": 9999, "month": 11}))
+        self.assertEqual(response.status_code, 200)
+
+    def test_batch_update_is_idempotent(self):
+        soup = Recipe.objects.create(user=self.user, title="Soup")
+        salad = Recipe.objects.create(user=self.user, title="Salad")
+        other = User.objects.create(username="other")
+        private = Recipe.objects.create(user=other,
+                                        title="Private",
+                                        public=False)
+        changes = json.dumps([
+            {"date": "2021-02-01", "pk": soup.pk, "action": "add"},
+            {"date": "2021-02-01", "pk": salad.pk, "action": "add"},
+            {"date": "2021-02-01", "pk": salad.pk, "action": "remove"},
+            {"date": "2021-02-02", "pk": soup.pk, "action": "add"},
+            {"date": "2021-02-02", "pk": private.pk, "action": "add"},
+        ])
+
+        for _ in range(2):
+            response = self.client.post(reverse("meal_plan_update"),
+                                        changes,
+                                        content_type="application/json")
+            self.assertEqual(response.json(), {"applied": 3})
+
+        plans = MealPlan.objects.recipes_by_date(datetime.date(2021, 2, 1),
+                                                 datetime.date(2021, 2, 2))
+        self.assertEqual(plans, {
+            datetime.date(2021, 2, 1): [soup],
+            datetime.date(2021, 2, 2): [soup],
+        })
+        soup.refresh_from_db()
+        self.assertEqual(soup.times_cooked, 2)
+
+    def test_batch_update_rejects_bad_changes(self):
+        for change in [
+            {"date": "2021-02-30"},
+            {"date": "2021-02-01", "pk": 10**30, "action": "add"},
+            {"date": "2021-02-01", "pk": -1, "action": "add"},
+        ]:
+            response = self.client.post(reverse("meal_plan_update"),
+                                        json.dumps([change]),
+                                        content_type="application/json")
+            self.assertEqual(response.status_code, 400)
+
+    def test_picker_leaves_out_planned_recipes(self):
+        planned = Recipe.objects.create(user=self.user, title="Planned")
+        Recipe.objects.create(user=self.user, title="Available")
+        plan = MealPlan.objects.create(user=self.user,
+                                       date=datetime.date(2021, 2, 1))
+        plan.recipes.add(planned)
+
+        response = self.client.get(
+            reverse("meal_plan_recipe_picker") + "?date=2021-02-01")
+        self.assertEqual(
+            [recipe["title"] for recipe in response.json()["recipes"]],
+            ["Available"])
+
+    @mock.patch("recipes.views.MEAL_PLAN_PICKER_PAGE_SIZE", 2)
+    def test_picker_pages_through_search_results(self):
+        recipes = [
+            Recipe.objects.create(user=self.user, title=title) for title in
+            ["Tomato soup", "Tomato salad", "Tomato tart", "Bread"]
+        ]
+        # The index is only updated on commit.
+        index_recipes(recipe.pk for recipe in recipes)
+
+        titles = []
+        params = {"q": "tomato"}
+        while True:
+            data = self.client.get(reverse("meal_plan_recipe_picker"),
+                                   params).json()
+            titles.extend(recipe["title"] for recipe in data["recipes"])
+            if data["next"] is None:
+                break
+            params["after"] = data["next"]
+        self.assertEqual(sorted(titles),
+                         ["Tomato salad", "Tomato soup", "Tomato tart"])
+
+
+@override_settings(
+    STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage")
+class ShoppingListTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="cook")
+        self.soup = Recipe.objects.create(user=self.user, title="Soup")
+        self.soup.ingredients.create(amount="1 1/2 cups", item="Onions")
+        self.soup.ingredients.create(amount="a pinch", item="salt")
+        self.stew = Recipe.objects.create(user=self.user, title="Stew")
+        self.stew.ingredients.create(amount="½ cup", item="onion")
+        self.monday = MealPlan.objects.create(user=self.user,
+                                              date=datetime.date(2021, 2, 1))
+        self.tuesday = MealPlan.objects.create(user=self.user,
+                                               date=datetime.date(
+                                                   2021, 2, 2))
+
+    def get_list(self):
+        return [(item["item"], item["unit"], item["quantity"])
+                for item in get_shopping_list(self.user,
+                                              datetime.date(2021, 2, 1),
+                                              datetime.date(2021, 2, 7))]
+
+    def test_parse_amount(self):
+        self.assertEqual(parse_amount("1 1/2 cups"), (Fraction(3, 2), "cup"))
+        self.assertEqual(parse_amount("2 Tbsp."), (2, "tbsp"))
+        self.assertEqual(parse_amount("0.5"), (Fraction(1, 2), ""))
+        self.assertEqual(parse_amount("A  pinch"), (None, "a pinch"))
+
+    def test_like_ingredients_merge_across_plans(self):
+        self.monday.recipes.add(self.soup)
+        self.tuesday.recipes.add(self.stew)
+
+        self.assertEqual(self.get_list(), [
+            ("onion", "cup", Decimal(2)),
+            ("salt", "a pinch", None),
+        ])
+
+    def test_list_follows_plan_and_ingredient_changes(self):
+        self.monday.recipes.add(self.soup, self.stew)
+        self.soup.ingredients.filter(item="salt").delete()
+        self.stew.ingredients.create(amount="2", item="carrots")
+        self.monday.recipes.remove(self.soup)
+
+        self.assertEqual(self.get_list(), [
+            ("carrot", "", Decimal(2)),
+            ("onion", "cup", Decimal("0.5")),
+        ])
+
+        self.stew.delete()
+        self.assertEqual(self.get_list(), [])
+
+    def test_ingredient_edits_update_only_their_own_items(self):
+        self.monday.recipes.add(self.soup, self.stew)
+        self.tuesday.recipes.add(self.soup)
+        onions = self.soup.ingredients.get(item="Onions")
+        onions.amount = "2 cups"
+
+        with CaptureQueriesContext(connection) as queries:
+            onions.save()
+        shopping_queries = [
+            query["sql"] for query in queries
+            if "shoppinglistitem" in query["sql"]
+            or "mealplan" in query["sql"]
+        ]
+        self.assertEqual(len(shopping_queries), 1)
+        self.assertTrue(shopping_queries[0].startswith("UPDATE"))
+        self.assertEqual(self.get_list(), [
+            ("onion", "cup", Decimal("4.5")),
+            ("salt", "a pinch", None),
+        ])
+
+    def test_view_rejects_dates_out_of_range(self):
+        self.client.force_login(self.user)
+        response = self.client.get(
+            reverse("shopping_list") + "?start=9999-12-30")
+        self.assertEqual(response.status_code, 404)
+
+    def test_view_reads_the_list_in_one_query(self):
+        self.monday.recipes.add(self.soup, self.stew)
+        self.client.force_login(self.user)
+
+        # Session, user and the shopping list.
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                reverse("shopping_list") + "?start=2021-02-01&end=2021-02-01")
+        self.assertContains(response, "2 cup onion")
+
+
+class KeysetPaginatorTestCase(TestCase):
+    def setUp(self):
+        user = User.objects.create(username="cook")
+        for title, prep_time in [("Soup", 5), ("Bread", None), ("Stew", 5),
+                                 ("Salad", 1), ("Pie", None)]:
+            Recipe.objects.create(user=user,
+                                  title=title,
+                                  prep_time_in_minutes=prep_time)
+
+    def collect_pages(self, order_field, per_page=2):
+        paginator = KeysetPaginator(Recipe.objects.all(),
+                                    order_field,
+                                    per_page=per_page)
+        titles = []
+        cursor = None
+        while True:
+            page = paginator.page(cursor)
+            titles.extend(recipe.title for recipe in page)
+            if not page.has_next:
+                return titles
+            cursor = page.next_cursor
+
+    def test_pages_cover_every_row_in_order(self):
+        self.assertEqual(self.collect_pages("title"),
+                         ["Bread", "Pie", "Salad", "Soup", "Stew"])
+
+    def test_ties_and_nulls_are_paged_through(self):
+        self.assertEqual(self.collect_pages("-prep_time_in_minutes"),
+                         ["Stew", "Soup", "Salad", "Pie", "Bread"])
+        self.assertEqual(self.collect_pages("prep_time_in_minutes"),
+                         ["Salad", "Soup", "Stew", "Bread", "Pie"])
+
+    def test_each_page_is_a_single_query(self):
+        paginator = KeysetPaginator(Recipe.objects.all(), "title", per_page=2)
+        cursor = paginator.page().next_cursor
+        with self.assertNumQueries(1):
+            paginator.page(cursor)
+
+    def test_crafted_cursors_are_invalid(self):
+        paginator = KeysetPaginator(Recipe.objects.all(), "-times_favorited")
+        cursors = [
+            paginator.encode_cursor(value, pk)
+            for value, pk in [(0, 2**63), (0, 0), (0, "x"), ([1], 1),
+                              ("many", 1), (2**63, 1)]
+        ] + ["not base64!", paginator.encode_cursor(0, 1)[:-2]]
+        for cursor in cursors:
+            with self.assertRaises(InvalidCursor):
+                paginator.page(cursor)
+
+        self.client.force_login(User.objects.get())
+        response = self.client.get(reverse("recipe_list"), {
+            "order": "favorited",
+            "after": cursors[0]
+        })
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(
+            reverse("meal_plan_recipe_picker"),
+            {"after": paginator.encode_cursor("Soup", 2**63)})
+        self.assertEqual(response.status_code, 404)
+
+
+class IngredientCatalogTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="cook")
+        self.recipe = Recipe.objects.create(user=self.user, title="Salsa")
+
+    def test_items_are_normalized(self):
+        self.assertEqual(normalize_ingredient("Tomatoes, diced"), "tomato")
+        self.assertEqual(normalize_ingredient("fresh basil (chopped)"),
+                         "basil")
+        self.assertEqual(normalize_ingredient("2 large eggs"), "egg")
+        self.assertEqual(normalize_ingredient("to taste"), "")
+
+    def test_ingredients_are_linked_on_save_and_fork(self):
+        chopped = self.recipe.ingredients.create(amount="1",
+                                                 item="Onions, chopped")
+        plain = self.recipe.ingredients.create(amount="1", item="onion")
+        salt = self.recipe.ingredients.create(amount="", item="to taste")
+        self.assertEqual(chopped.catalog_item.name, "onion")
+        self.assertEqual(plain.catalog_item_id, chopped.catalog_item_id)
+        self.assertIsNone(salt.catalog_item_id)
+
+        copy, = Recipe.objects.filter(pk=self.recipe.pk).fork_for(self.user)
+        self.assertEqual(
+            sorted(copy.ingredients.values_list("catalog_item_id", flat=True),
+                   key=str), sorted([chopped.catalog_item_id] * 2 + [None],
+                                    key=str))
+
+    def test_backfill_links_unlinked_ingredients(self):
+        self.recipe.ingredients.create(amount="1", item="Limes")
+        self.recipe.ingredients.create(amount="1", item="lime")
+        Ingredient.objects.update(catalog_item=None)
+        CatalogItem.objects.all().delete()
+        other = Recipe.objects.create(user=self.user, title="Toast")
+        versions = dict(
+            Recipe.objects.values_list("pk", "cache_version"))
+
+        call_command("backfill_ingredient_catalog", stdout=io.StringIO())
+        lime = CatalogItem.objects.get()
+        self.assertEqual(lime.name, "lime")
+        self.assertEqual(lime.ingredients.count(), 2)
+        # The relinked recipe's signature has to be recomputed.
+        self.recipe.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.recipe.cache_version,
+                         versions[self.recipe.pk] + 1)
+        self.assertEqual(other.cache_version, versions[other.pk])
+
+
+@override_settings(
+    STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage")
+class PantryTestCase(TestCase):
+    def setUp(self):
+        pantry_index.clear()
+        self.user = User.objects.create(username="cook")
+        self.client.force_login(self.user)
+
+    def create_recipe(self, title, items, user=None, public=True):
+        recipe = Recipe.objects.create(user=user or self.user,
+                                       title=title,
+                                       public=public)
+        for item in items:
+            recipe.ingredients.create(amount="1", item=item)
+        return recipe
+
+    def test_pantry_page_ranks_recipes_by_missing_ingredients(self):
+        pancakes = self.create_recipe("Pancakes",
+                                      ["eggs", "flour", "milk", "butter"])
+        omelette = self.create_recipe("Omelette", ["eggs", "butter"])
+        self.create_recipe("Salad", ["lettuce", "tomatoes"])
+        self.create_recipe("Secret eggs", ["eggs"],
+                           user=User.objects.create(username="other"),
+                           public=False)
+
+        response = self.client.post(reverse("pantry"),
+                                    {"items": "Eggs, melted butter\nmilk, yak"},
+                                    follow=True)
+        self.assertContains(response, "No recipes use yak")
+        self.assertEqual([str(item) for item in response.context["items"]],
+                         ["butter", "egg", "milk"])
+        self.assertEqual([(recipe, match.matched, match.missing)
+                          for recipe, match in response.context["matches"]],
+                         [(omelette, 2, 0), (pancakes, 3, 1)])
+
+    def test_removing_items(self):
+        self.create_recipe("Omelette", ["eggs", "butter"])
+        self.client.post(reverse("pantry"), {"items": "eggs, butter"})
+        eggs = self.user.pantry_items.get(name="egg")
+
+        for remove in ["eggs", str(2**63), eggs.pk]:
+            response = self.client.post(reverse("pantry"), {"remove": remove})
+            self.assertRedirects(response, reverse("pantry"))
+        self.assertEqual([str(item) for item in self.user.pantry_items.all()],
+                         ["butter"])
+
+    def test_bitmap_ranking_matches_a_brute_force_one(self):
+        rng = random.Random(1)
+        letters = "abcdefghijklmnopqrtuvwxyz"
+        items = [f"z{first}{second}" for first in letters[:4]
+                 for second in letters[:10]]
+        other = User.objects.create(username="other")
+        used = {}
+        for number in range(150):
+            recipe = self.create_recipe(
+                f"Recipe {number}",
+                rng.sample(items, rng.randint(1, 12)),
+                user=rng.choice([self.user, other]),
+                public=rng.random() < 0.7)
+            if recipe.public or recipe.user == self.user:
+                used[recipe.pk] = set(
+                    recipe.ingredients.values_list("catalog_item_id",
+                                                   flat=True))
+
+        pantry = set(
+            CatalogItem.objects.filter(
+                name__in=rng.sample(items, 15)).values_list("pk", flat=True))
+        self.assertEqual(len(pantry), 15)
+        expected = sorted(
+            ((len(item_pks - pantry), -len(item_pks & pantry), recipe_pk)
+             for recipe_pk, item_pks in used.items() if item_pks & pantry))
+        matches = pantry_index.match(self.user, pantry, limit=1000)
+        self.assertEqual([(match.missing, -match.matched, match.recipe_pk)
+                          for match in matches], expected)
+
+    def test_expired_index_is_served_while_it_is_rebuilt(self):
+        index = PantryIndex(ttl=0.01)
+        anonymous = AnonymousUser()
+        self.create_recipe("Omelette", ["eggs"])
+        eggs = CatalogItem.objects.get(name="egg").pk
+        self.assertEqual(len(index.match(anonymous, [eggs])), 1)
+
+        self.create_recipe("Fried eggs", ["eggs"])
+        time.sleep(0.02)
+        with mock.patch.object(index, "start_refresh") as start_refresh:
+            with self.assertNumQueries(0):
+                self.assertEqual(len(index.match(anonymous, [eggs])), 1)
+                self.assertEqual(len(index.match(anonymous, [eggs])), 1)
+            start_refresh.assert_called_once_with()
+
+            index.refresh()
+            self.assertEqual(len(index.match(anonymous, [eggs])), 2)
+
+
+@override_settings(
+    STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage")
+class SimilarRecipesTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="cook")
+        self.client.force_login(self.user)
+        self.pesto = self.create_recipe(
+            "Pesto pasta", "italian quick",
+            ["basil", "garlic", "parmesan", "olive oil", "pasta"])
+        self.pistou = self.create_recipe(
+            "Pistou pasta", "french quick",
+            ["basil", "garlic", "parmesan", "olive oil", "pasta", "tomato"])
+        self.sundae = self.create_recipe("Sundae", "dessert",
+                                         ["ice cream", "chocolate sauce"])
+
+    def create_recipe(self, title, tag_names, items, public=True):
+        recipe = Recipe.objects.create(user=self.user,
+                                       title=title,
+                                       public=public)
+        recipe.set_tag_names(tag_names)
+        for item in items:
+            recipe.ingredients.create(amount="1", item=item)
+        return recipe
+
+    def get_similar(self, recipe):
+        return list(
+            recipe.similar_recipe_links.order_by("-score").values_list(
+                "similar__title", flat=True))
+
+    def test_similar_recipes_are_shown_on_the_detail_page(self):
+        self.assertEqual(update_similar_recipes(), (3, 3))
+        self.assertEqual(self.get_similar(self.pesto), ["Pistou pasta"])
+        self.assertEqual(self.get_similar(self.sundae), [])
+
+        response = self.client.get(
+            reverse("recipe_detail", kwargs={"recipe_pk": self.pesto.pk}))
+        self.assertEqual(response.context["similar_recipes"], [self.pistou])
+        self.assertContains(response, "Similar recipes")
+
+    def test_only_changed_recipes_are_recomputed(self):
+        update_similar_recipes()
+        self.assertEqual(update_similar_recipes(), (0, 0))
+
+        sorbet = self.create_recipe("Sorbet", "dessert",
+                                    ["ice cream", "chocolate sauce", "mint"])
+        self.assertEqual(update_similar_recipes(), (1, 1))
+        self.assertEqual(self.get_similar(self.sundae), ["Sorbet"])
+
+        self.sundae.set_tag_names("dessert cold")
+        self.assertEqual(update_similar_recipes(), (1, 2))
+        self.assertEqual(self.get_similar(sorbet), ["Sundae"])
+
+    def test_private_recipes_and_copies_are_left_out(self):
+        self.create_recipe("Secret pesto", "italian quick",
+                           ["basil", "garlic", "parmesan", "olive oil"],
+                           public=False)
+        Recipe.objects.filter(pk=self.pesto.pk).fork_for(self.user)
+        update_similar_recipes()
+        self.assertEqual(self.get_similar(self.pesto), ["Pistou pasta"])
+
+        self.pistou.public = False
+        self.pistou.save()
+        self.assertEqual(update_similar_recipes(), (0, 2))
+        self.assertEqual(self.get_similar(self.pesto), [])
+        self.assertEqual(self.get_similar(self.pistou), [])
+
+
+@override_settings(
+    STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage")
+class RecommendationsTestCase(TestCase):
+    def setUp(self):
+        owner = User.objects.create(username="cook")
+        self.soup, self.bread, self.stew, self.salad = [
+            Recipe.objects.create(user=owner, title=title)
+            for title in ["Soup", "Bread", "Stew", "Salad"]
+        ]
+        self.users = [
+            User.objects.create(username=f"fan{number}")
+            for number in range(3)
+        ]
+        self.favorite(self.users[0], self.soup, self.bread, self.stew)
+        self.favorite(self.users[1], self.soup, self.bread)
+        self.favorite(self.users[2], self.stew, self.salad)
+
+    def favorite(self, user, *recipes):
+        for recipe in recipes:
+            user.toggle_favorite_recipe(recipe)
+
+    def get_recommended(self, recipe):
+        return list(
+            recipe.recommended_recipe_links.order_by(
+                "-score", "recommended_id").values_list(
+                    "recommended__title", flat=True))
+
+    def test_recipes_favorited_by_the_same_users_are_recommended(self):
+        self.assertEqual(update_recommendations(), (4, 4))
+        # Stew shares only one fan with Soup, which isn't enough.
+        self.assertEqual(self.get_recommended(self.soup), ["Bread"])
+        self.assertEqual(self.get_recommended(self.bread), ["Soup"])
+        self.assertEqual(self.get_recommended(self.stew), [])
+
+        self.client.force_login(self.users[0])
+        response = self.client.get(
+            reverse("recipe_detail", kwargs={"recipe_pk": self.soup.pk}))
+        self.assertEqual(response.context["recommended_recipes"],
+                         [self.bread])
+        self.assertContains(response,
+                            "People who favorited this also favorited")
+
+    def test_only_recipes_with_new_favorites_are_recomputed(self):
+        update_recommendations()
+        self.assertEqual(update_recommendations(), (0, 0))
+
+        # Only Stew's list is recomputed; it is added to the others'.
+        self.favorite(self.users[1], self.stew)
+        self.assertEqual(update_recommendations(), (1, 1))
+        self.assertEqual(self.get_recommended(self.soup), ["Bread", "Stew"])
+        self.assertEqual(self.get_recommended(self.stew), ["Soup", "Bread"])
+
+        # Unfavoriting Bread also recomputes the lists that included it.
+        self.favorite(self.users[0], self.bread)
+        self.assertEqual(update_recommendations(), (1, 3))
+        self.assertEqual(self.get_recommended(self.soup), ["Stew"])
+        self.assertEqual(self.get_recommended(self.bread), [])
+
+    def test_private_recipes_are_left_out(self):
+        update_recommendations()
+        self.bread.public = False
+        self.bread.save()
+        self.assertEqual(update_recommendations(), (0, 1))
+        self.assertEqual(self.get_recommended(self.soup), [])
+        self.assertEqual(self.get_recommended(self.bread), [])
+
+
+@override_settings(
+    STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage")
+class RecipeListTestCase(TestCase):
+    def setUp(self):
+        user = User.objects.create(username="cook")
+        for title, prep_time in [("Soup", 5), ("Bread", None), ("Stew", 15),
+                                 ("Salad", 1)]:
+            Recipe.objects.create(user=user,
+                                  title=title,
+                                  prep_time_in_minutes=prep_time,
+                                  cook_time_in_minutes=10)
+        self.client.force_login(user)
+
+    def test_quickest_lists_recipes_without_times_last(self):
+        response = self.client.get(reverse("recipe_list"),
+                                   {"order": "quickest"})
+        self.assertEqual(
+            [recipe.title for recipe in response.context["recipes"]],
+            ["Salad", "Soup", "Stew", "Bread"])
+
+    def test_unknown_order_is_not_found(self):
+        response = self.client.get(reverse("recipe_list"),
+                                   {"order": "user__password"})
+        self.assertEqual(response.status_code, 404)
+
+
+class RecipeCountersTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="cook")
+        self.recipe = Recipe.objects.create(user=self.user, title="Soup")
+
+    def test_favorites_are_counted_from_either_side(self):
+        other_user = User.objects.create(username="eater")
+        self.recipe.favorited_by.add(self.user)
+        other_user.favorite_recipes.add(self.recipe)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.times_favorited, 2)
+
+        other_user.favorite_recipes.clear()
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.times_favorited, 1)
+
+    def test_meal_plans_update_times_and_first_cooked(self):
+        today = datetime.date.today()
+        yesterday = today - datetime.timedelta(days=1)
+        for date in [today, yesterday]:
+            plan = MealPlan.objects.create(user=self.user, date=date)
+            plan.recipes.add(self.recipe)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.times_cooked, 2)
+        self.assertEqual(self.recipe.first_cooked, yesterday)
+
+        self.user.meal_plans.get(date=yesterday).recipes.remove(self.recipe)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.times_cooked, 1)
+        self.assertEqual(self.recipe.first_cooked, today)
+
+    def test_reconcile_fixes_drifted_counters(self):
+        today = datetime.date.today()
+        self.recipe.favorited_by.add(self.user)
+        MealPlan.objects.create(user=self.user,
+                                date=today).recipes.add(self.recipe)
+        untouched = Recipe.objects.create(user=self.user, title="Stew")
+        # update() skips the signals that keep the counters current.
+        Recipe.objects.filter(pk=self.recipe.pk).update(times_favorited=5,
+                                                        times_cooked=0,
+                                                        first_cooked=None)
+        self.recipe.refresh_from_db()
+        version = self.recipe.favorites_version
+
+        output = io.StringIO()
+        call_command("reconcile_recipe_counters", dry_run=True, stdout=output)
+        self.assertIn("Found 1 recipe(s)", output.getvalue())
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.times_favorited, 5)
+        self.assertEqual(self.recipe.favorites_version, version)
+
+        output = io.StringIO()
+        call_command("reconcile_recipe_counters", batch_size=1, stdout=output)
+        self.assertIn("Fixed 1 recipe(s)", output.getvalue())
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.times_favorited, 1)
+        self.assertEqual(self.recipe.times_cooked, 1)
+        self.assertEqual(self.recipe.first_cooked, today)
+        self.assertEqual(self.recipe.favorites_version, version + 1)
+        self.assertEqual(
+            Recipe.objects.get(pk=untouched.pk).favorites_version,
+            untouched.favorites_version)
+
+        output = io.StringIO()
+        call_command("reconcile_recipe_counters", stdout=output)
+        self.assertIn("Fixed 0 recipe(s)", output.getvalue())
+
+
+class RecipeSearchTestCase(TransactionTestCase):
+    def setUp(self):
+        tag_id_cache.clear()
+        catalog_item_id_cache.clear()
+        self.user = User.objects.create(username="cook")
+        self.stew = Recipe.objects.create(user=self.user, title="Beef Stew")
+        self.stew.ingredients.create(amount="2", item="tomatoes")
+        self.stew.steps.create(text="Simmer the beef for two hours.")
+        self.salad = Recipe.objects.create(user=self.user,
+                                           title="Tomato Salad",
+                                           public=False)
+        self.salad.set_tag_names("summer")
+
+    def search(self, query, user=None):
+        recipes = Recipe.objects.for_user(user or self.user)
+        return list(search_recipes(recipes, query))
+
+    def test_results_are_ranked_by_where_terms_match(self):
+        self.assertEqual(self.search("tomato"), [self.salad, self.stew])
+        self.assertEqual(self.search("summer tomatoes"), [self.salad])
+
+    def test_results_respect_visibility(self):
+        self.assertEqual(self.search("tomato", AnonymousUser()), [self.stew])
+
+    def test_index_follows_changes_to_children(self):
+        self.stew.ingredients.all().delete()
+        self.stew.steps.create(text="Serve with crusty bread.")
+        self.assertEqual(self.search("tomato"), [self.salad])
+        self.assertEqual(self.search("bread"), [self.stew])
+
+
+@override_settings(
+    STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage")
+class RecipeDetailTestCase(TestCase):
+    def setUp(self):
+        get_fragment_cache().clear()
+        self.user = User.objects.create(username="cook")
+        original = Recipe.objects.create(user=self.user, title="Stew")
+        self.recipe = Recipe.objects.create(user=self.user,
+                                            title="Stew (Copy)",
+                                            original_recipe=original)
+        self.recipe.set_tag_names("dinner winter hearty")
+        for item in ["beef", "carrots", "onions"]:
+            self.recipe.ingredients.create(amount="1", item=item)
+        for text in ["Brown the beef.", "Add everything else.", "Simmer."]:
+            self.recipe.steps.create(text=text)
+        self.recipe.favorited_by.add(self.user)
+
+    def test_with_details_loads_everything_up_front(self):
+        with self.assertNumQueries(4):
+            recipe = Recipe.objects.with_details(self.user).get(
+                pk=self.recipe.pk)
+            self.assertTrue(recipe.is_user_favorite)
+            self.assertEqual(recipe.original_recipe.title, "Stew")
+            self.assertEqual(len(recipe.tags.all()), 3)
+            self.assertEqual(len(recipe.ingredients.all()), 3)
+            self.assertEqual([step.text for step in recipe.steps.all()][0],
+                             "Brown the beef.")
+
+    def test_detail_page_query_count(self):
+        self.client.force_login(self.user)
+        url = reverse("recipe_detail", kwargs={"recipe_pk": self.recipe.pk})
+        # Session, user, recipe, similar and recommended recipes, tags,
+        # ingredients and steps.
+        with self.assertNumQueries(8):
+            response = self.client.get(url)
+        self.assertContains(response, "&#9733;")
+        self.assertContains(response, "Ingredients (3)")
+
+        # Tags, ingredients and steps now come from the fragment cache.
+        with self.assertNumQueries(5):
+            response = self.client.get(url)
+        self.assertContains(response, "Ingredients (3)")
+        self.assertEqual(get_stats()["queries_saved"], 3)
+
+    def test_stats_are_written_once_per_request(self):
+        url = reverse("recipe_detail", kwargs={"recipe_pk": self.recipe.pk})
+        self.client.get(url)
+        reset_stats()
+        cache = get_fragment_cache()
+        with mock.patch.object(cache, "incr", wraps=cache.incr) as incr:
+            self.client.get(url)
+        # One increment each for hits and queries saved, not one per
+        # fragment.
+        self.assertEqual(incr.call_count, 2)
+        self.assertEqual(get_stats()["hits"], 4)
+
+    def test_schema_version_changes_invalidate_cached_fragments(self):
+        url = reverse("recipe_detail", kwargs={"recipe_pk": self.recipe.pk})
+        self.client.get(url)
+        with mock.patch("recipes.fragments.FRAGMENT_SCHEMA_VERSION", 0):
+            self.client.get(url)
+        self.assertEqual(get_stats()["misses"], 8)
+
+    def test_changes_invalidate_cached_fragments(self):
+        url = reverse("recipe_detail", kwargs={"recipe_pk": self.recipe.pk})
+        self.client.get(url)
+        self.recipe.ingredients.create(amount="1", item="potato")
+        self.recipe.set_tag_names("dinner")
+        response = self.client.get(url)
+        self.assertContains(response, "Ingredients (4)")
+        self.assertNotContains(response, "hearty")
@@ -1,18 +1,71 @@
+import calendar
 import datetime
+import json
+import math
+import re
 
+from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.db.models import Count, Min, F
-from django.http import JsonResponse, HttpResponse
+from django.http import (
+    Http404,
+    HttpResponse,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 
+from .catalog import normalize_ingredient
+from .export import FORMATS as EXPORT_FORMATS, iter_gzip, iter_recipe_dicts
 from .forms import (
     IngredientForm,
     RecipeForm,
     RecipeStepForm,
 )
-from .models import Recipe, Tag
+from .models import (
+    CatalogItem,
+    MealPlan,
+    Recipe,
+    RecipeChanged,
+    Tag,
+    parse_pk,
+    tag_name_index,
+)
+from .pagination import InvalidCursor, KeysetPaginator
+from .pantry import pantry_index
+from .search import search_recipes as search_recipe_index
+from .shopping import format_quantity, get_shopping_list
+
+RECIPES_PER_PAGE = 50
+SEARCH_RESULTS_LIMIT = 50
+MAX_RECIPES_PER_COPY = 500
+MEAL_PLAN_PICKER_PAGE_SIZE = 25
+MAX_MEAL_PLAN_CHANGES = 1000
+TAG_AUTOCOMPLETE_LIMIT = 10
+PANTRY_MATCHES_LIMIT = 50
+TAG_CLOUD_SIZE = 100
+FORK_TREE_SIZE = 200
+# Tachyons font size classes for tag cloud weights, smallest first.
+TAG_CLOUD_CLASSES = ["f6", "f5", "f4", "f3", "f2"]
+
+# The ways the recipe list can be sorted, as (label, order field). Each
+# order field has indexes to match on Recipe, so don't add one without
+# them.
+RECIPE_SORT_MODES = {
+    "title": ("Title", "title"),
+    "newest": ("Newest", "-id"),
+    "favorited": ("Most favorited", "-times_favorited"),
+    "cooked": ("Most cooked", "-times_cooked"),
+    "quickest": ("Quickest to make", "total_time"),
+}
+
+
+def get_favorite_recipe_ids(user):
+    if user.is_authenticated:
+        return user.get_favorite_recipe_ids()
+    return set()
 
 
 def homepage(request):
@@ -22,43 +75,144 @@ def homepage(request):
     return render(request, "recipes/home.html")
 
 
-def recipe_list(request):
-    order_field = request.GET.get("order", "title")
-    recipes = (Recipe.objects.for_user(request.user).annotate(
-        times_favorited=Count("favorited_by", distinct=True),
-        times_cooked=Count("meal_plans", distinct=True),
-        total_time_in_minutes=F("prep_time_in_minutes") +
-        F("cook_time_in_minutes"),
-    ).order_by(order_field))
+def get_recipe_list_context(request):
+    """
+    Look up the page of recipes requested by `request` and return the
+    context for the recipe list templates.
+    """
+    order = request.GET.get("order", "title")
+    if order not in RECIPE_SORT_MODES:
+        raise Http404("Unknown sort order.")
+    _, order_field = RECIPE_SORT_MODES[order]
+    recipes = Recipe.objects.for_user(request.user).select_related("user")
+
+    paginator = KeysetPaginator(recipes,
+                                order_field,
+                                per_page=RECIPES_PER_PAGE)
+    try:
+        page = paginator.page(request.GET.get("after"))
+    except InvalidCursor:
+        raise Http404("Invalid page.")
+
+    return {
+        "recipes": page,
+        "order": order,
+        "sort_modes": [(mode, label)
+                       for mode, (label, _) in RECIPE_SORT_MODES.items()],
+        "favorite_recipe_ids": get_favorite_recipe_ids(request.user),
+    }
 
+
+def recipe_list(request):
     if request.is_ajax():
         template_name = "recipes/_recipe_list.html"
     else:
         template_name = "recipes/recipe_list.html"
 
-    return render(request, template_name, {"recipes": recipes})
+    return render(request, template_name, get_recipe_list_context(request))
+
+
+def export_recipes(request):
+    """
+    Stream every recipe visible to the user, with its tags, ingredients
+    and steps, as JSON Lines ("?format=json" for a JSON array). Pass
+    "?gzip=1" to compress the download and "?after=<pk>" to resume an
+    interrupted export.
+    """
+    export_format = request.GET.get("format", "jsonl")
+    if export_format not in EXPORT_FORMATS:
+        raise Http404("Unknown export format.")
+    try:
+        after = (parse_pk(request.GET["after"])
+                 if "after" in request.GET else None)
+    except ValueError:
+        raise Http404("Invalid starting point.")
+
+    recipes = iter_recipe_dicts(Recipe.objects.for_user(request.user),
+                                after=after)
+    chunks = EXPORT_FORMATS[export_format](recipes)
+    filename = f"recipes.{export_format}"
+    content_type = ("application/x-ndjson"
+                    if export_format == "jsonl" else "application/json")
+
+    if request.GET.get("gzip"):
+        chunks = iter_gzip(chunks)
+        filename += ".gz"
+        content_type = "application/gzip"
+
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+def search_recipes(request):
+    search_term = request.GET.get("q", "").strip()
+    recipes = None
+    if search_term:
+        recipes = search_recipe_index(Recipe.objects.for_user(request.user),
+                                      search_term)[:SEARCH_RESULTS_LIMIT]
+
+    return render(request, "recipes/search.html", {
+        "recipes": recipes,
+        "search_term": search_term,
+    })
 
 
 def recipe_detail(request, recipe_pk):
-    recipes = Recipe.objects.for_user(request.user).annotate(
-        num_ingredients=Count("ingredients", distinct=True),
-        times_cooked=Count("meal_plans", distinct=True),
-        first_cooked=Min("meal_plans__date"),
-    )
+    recipes = Recipe.objects.for_user(request.user).with_details(
+        request.user, prefetch=False)
 
     recipe = get_object_or_404(recipes, pk=recipe_pk)
+    # Precomputed by the update_similar_recipes and update_recommendations
+    # commands.
+    similar_recipes = [
+        link.similar for link in recipe.similar_recipe_links.filter(
+            similar__public=True).select_related("similar").only(
+                "similar__title").order_by("-score", "similar_id")
+    ]
+    recommended_recipes = [
+        link.recommended for link in recipe.recommended_recipe_links.filter(
+            recommended__public=True).select_related("recommended").only(
+                "recommended__title").order_by("-score", "recommended_id")
+    ]
     return render(
         request,
         "recipes/recipe_detail.html",
         {
             "recipe": recipe,
-            "is_user_favorite": request.user.is_favorite_recipe(recipe),
+            "is_user_favorite": recipe.is_user_favorite,
+            "similar_recipes": similar_recipes,
+            "recommended_recipes": recommended_recipes,
             "ingredient_form": IngredientForm(),
             "step_form": RecipeStepForm()
         },
     )
 
 
+def recipe_forks(request, recipe_pk):
+    """
+    The "forks" tab of a recipe: the chain of recipes it was copied from
+    and the tree of copies made of it, one recursive query each. Only the
+    nearest FORK_TREE_SIZE copies are shown, so the page stays quick for
+    recipes that have been copied thousands of times.
+    """
+    recipe = get_object_or_404(Recipe.objects.for_user(request.user),
+                               pk=recipe_pk)
+    forks, fork_total = recipe.get_fork_tree(request.user,
+                                             limit=FORK_TREE_SIZE)
+    return render(
+        request,
+        "recipes/recipe_forks.html",
+        {
+            "recipe": recipe,
+            "ancestors": recipe.get_ancestors(request.user),
+            "forks": forks,
+            "fork_total": fork_total,
+            "hidden_forks": fork_total - len(forks),
+        },
+    )
+
+
 @login_required
 def add_recipe(request):
     if request.method == "POST":
@@ -117,19 +271,17 @@ def delete_recipe(request, recipe_pk):
     return render(request, "recipes/delete_recipe.html", {"recipe": recipe})
 
 
+def toggle_favorite(user, recipe_pk):
+    recipe = get_object_or_404(Recipe.objects.for_user(user), pk=recipe_pk)
+    return user.toggle_favorite_recipe(recipe)
+
+
 @login_required
 @csrf_exempt
 @require_POST
 def toggle_favorite_recipe(request, recipe_pk):
-    recipe = get_object_or_404(Recipe.objects.for_user(request.user),
-                               pk=recipe_pk)
-
-    if recipe in request.user.favorite_recipes.all():
-        request.user.favorite_recipes.remove(recipe)
-        return JsonResponse({"favorite": False})
-
-    request.user.favorite_recipes.add(recipe)
-    return JsonResponse({"favorite": True})
+    return JsonResponse(
+        {"favorite": toggle_favorite(request.user, recipe_pk)})
 
 
 @login_required
@@ -172,19 +324,111 @@ def add_recipe_step(request, recipe_pk):
     })
 
 
+@login_required
+@csrf_exempt
+@require_POST
+def reorder_recipe_steps(request, recipe_pk):
+    """
+    Reorder a recipe's steps from a JSON body of
+    {"steps": [<every step pk in the new order>], "version": <the recipe's
+    cache_version when its steps were shown>}. Responds with the new
+    version, or with a 409 if someone else changed the recipe first.
+    """
+    recipe = get_object_or_404(request.user.recipes, pk=recipe_pk)
+    try:
+        data = json.loads(request.body)
+        step_pks = [parse_pk(pk) for pk in data["steps"]]
+        # Versions start at 1, so they fit the same range as pks.
+        version = parse_pk(data["version"])
+    except (ValueError, TypeError, KeyError):
+        return JsonResponse({"error": "Invalid step order."}, status=400)
+
+    try:
+        version = recipe.reorder_steps(step_pks, version)
+    except ValueError as error:
+        return JsonResponse({"error": str(error)}, status=400)
+    except RecipeChanged:
+        return JsonResponse(
+            {"error": "The recipe has changed. Reload it and try again."},
+            status=409)
+    return JsonResponse({"version": version})
+
+
 def view_tag(request, tag_name):
     """
     Given a tag name, look up the tag and then get all recipes for the
     current user with that tag.
     """
-    tag = get_object_or_404(Tag, tag=tag_name)
+    tag_id = Tag.objects.resolve_names([tag_name], create=False).get(tag_name)
+    if tag_id is None:
+        raise Http404("No tag with that name.")
+    tag = Tag(pk=tag_id, tag=tag_name)
 
-    recipes = tag.recipes.for_user(request.user).order_by("title")
+    recipes = list(tag.recipes.for_user(request.user).order_by("title"))
 
-    return render(request, "recipes/tag_detail.html", {
-        "tag": tag,
-        "recipes": recipes
-    })
+    return render(
+        request, "recipes/tag_detail.html", {
+            "tag": tag,
+            "recipes": recipes,
+            # copy_recipes takes at most this many at a time.
+            "recipes_to_copy": recipes[:MAX_RECIPES_PER_COPY],
+            "favorite_recipe_ids": get_favorite_recipe_ids(request.user),
+        })
+
+
+def tag_autocomplete(request):
+    """
+    Return the names of tags starting with "?q=" as JSON. Answered from an
+    in-memory index, so no database queries are made once it has loaded.
+    """
+    prefix = request.GET.get("q", "").strip()
+    tag_names = []
+    if prefix:
+        tag_names = tag_name_index.complete(prefix, TAG_AUTOCOMPLETE_LIMIT)
+    return JsonResponse({"tags": tag_names})
+
+
+def get_tag_cloud_class(count, min_count, max_count):
+    if max_count == min_count:
+        return TAG_CLOUD_CLASSES[len(TAG_CLOUD_CLASSES) // 2]
+    weight = math.log(count / min_count) / math.log(max_count / min_count)
+    return TAG_CLOUD_CLASSES[round(weight * (len(TAG_CLOUD_CLASSES) - 1))]
+
+
+def tag_cloud(request):
+    """
+    Show the tags with the most public recipes in alphabetical order,
+    sized by how many recipes they have.
+    """
+    tags = list(
+        Tag.objects.filter(public_recipe_count__gt=0).order_by(
+            "-public_recipe_count", "tag")[:TAG_CLOUD_SIZE])
+    cloud = []
+    if tags:
+        max_count = tags[0].public_recipe_count
+        min_count = tags[-1].public_recipe_count
+        cloud = [(tag,
+                  get_tag_cloud_class(tag.public_recipe_count, min_count,
+                                      max_count))
+                 for tag in sorted(tags, key=lambda tag: tag.tag.casefold())]
+
+    return render(request, "recipes/tag_cloud.html", {"cloud": cloud})
+
+
+def get_date_or_404(year, month, day):
+    try:
+        return datetime.date(year, month, day)
+    except (ValueError, OverflowError):
+        raise Http404("No such date.")
+
+
+def add_days_or_404(date, days):
+    # The pages link to the periods either side, which don't exist at the
+    # ends of the calendar.
+    try:
+        return date + datetime.timedelta(days=days)
+    except OverflowError:
+        raise Http404("No such date.")
 
 
 @login_required
@@ -193,27 +437,25 @@ def show_meal_plan(request, year=None, month=None, day=None):
     Given a year, month, and day, look up the meal plan for the current user for that
     day and display it.
 
-    If a form is submitted to add a recipe, then go ahead and add recipe to the
-    meal plan for that day.
+    Viewing a plan never creates one; plans are created when the first
+    recipe is added to them in meal_plan_add_remove_recipe. The recipes
+    available to add are loaded separately from meal_plan_recipe_picker.
     """
     if year is None:
         date_for_plan = datetime.date.today()
     else:
-        date_for_plan = datetime.date(year, month, day)
-    next_day = date_for_plan + datetime.timedelta(days=1)
-    prev_day = date_for_plan + datetime.timedelta(days=-1)
+        date_for_plan = get_date_or_404(year, month, day)
+    next_day = add_days_or_404(date_for_plan, 1)
+    prev_day = add_days_or_404(date_for_plan, -1)
 
-    # https://docs.djangoproject.com/en/3.0/ref/models/querysets/#get-or-create
-    meal_plan, _ = request.user.meal_plans.get_or_create(date=date_for_plan)
-    recipes = Recipe.objects.for_user(
-        request.user).exclude(pk__in=[r.pk for r in meal_plan.recipes.all()])
+    planned_recipes = request.user.meal_plans.recipes_by_date(
+        date_for_plan, date_for_plan)[date_for_plan]
 
     return render(
         request,
         "recipes/show_meal_plan.html",
         {
-            "plan": meal_plan,
-            "recipes": recipes,
+            "planned_recipes": planned_recipes,
             "date": date_for_plan,
             "next_day": next_day,
             "prev_day": prev_day,
@@ -222,63 +464,318 @@ def show_meal_plan(request, year=None, month=None, day=None):
 
 
 @login_required
-@csrf_exempt
-def meal_plan_add_remove_recipe(request):
-    date = request.POST.get("date")
-    recipe_pk = request.POST.get("pk")
-    action = request.POST.get("action")
-
-    meal_plan, _ = request.user.meal_plans.get_or_create(date=date)
-    recipe = Recipe.objects.for_user(request.user).get(pk=recipe_pk)
-
-    if action == "add":
-        meal_plan.recipes.add(recipe)
-    elif action == "remove":
-        meal_plan.recipes.remove(recipe)
+def show_meal_plan_week(request, year, month, day):
+    """
+    Show the user's meal plans for the week (Monday to Sunday) that
+    contains the given date.
+    """
+    date = get_date_or_404(year, month, day)
+    start = date - datetime.timedelta(days=date.weekday())
+    end = add_days_or_404(start, 6)
+    prev_week = add_days_or_404(start, -7)
+    next_week = add_days_or_404(start, 7)
 
-    return HttpResponse(status=204)
+    return render_meal_plan_range(
+        request,
+        title=f"Meal plan for the week of {start:%B} {start.day}, {start.year}",
+        start=start,
+        end=end,
+        prev_url=reverse("show_meal_plan_week",
+                         args=[prev_week.year, prev_week.month,
+                               prev_week.day]),
+        next_url=reverse("show_meal_plan_week",
+                         args=[next_week.year, next_week.month,
+                               next_week.day]),
+    )
 
 
 @login_required
-def show_random_recipe(request):
+def show_meal_plan_month(request, year, month):
     """
-    Find a random recipe and show it on the page.
+    Show the user's meal plans for every day of the given month.
     """
-    recipe = request.user.recipes.order_by("?").first()
-    ingredient_form = IngredientForm()
+    start = get_date_or_404(year, month, 1)
+    end = start.replace(day=calendar.monthrange(year, month)[1])
+    prev_month = add_days_or_404(start, -1)
+    next_month = add_days_or_404(end, 1)
+
+    return render_meal_plan_range(
+        request,
+        title=f"Meal plan for {start:%B %Y}",
+        start=start,
+        end=end,
+        prev_url=reverse("show_meal_plan_month",
+                         args=[prev_month.year, prev_month.month]),
+        next_url=reverse("show_meal_plan_month",
+                         args=[next_month.year, next_month.month]),
+    )
+
+
+def render_meal_plan_range(request, title, start, end, prev_url, next_url):
+    days = request.user.meal_plans.recipes_by_date(start, end)
     return render(
         request,
-        "recipes/recipe_detail.html",
+        "recipes/show_meal_plan_range.html",
         {
-            "recipe": recipe,
-            "ingredient_form": ingredient_form,
+            "title": title,
+            "days": days.items(),
+            "start": start,
+            "end": end,
+            "prev_url": prev_url,
+            "next_url": next_url,
         },
     )
 
 
+@login_required
+def show_shopping_list(request):
+    """
+    Show everything needed for the user's meal plans from "start" to "end"
+    (YYYY-MM-DD, inclusive), defaulting to the current week, with like
+    ingredients merged.
+    """
+    today = datetime.date.today()
+    try:
+        start = datetime.date.fromisoformat(
+            request.GET.get("start")
+            or str(today - datetime.timedelta(days=today.weekday())))
+        end = datetime.date.fromisoformat(
+            request.GET.get("end") or str(start + datetime.timedelta(days=6)))
+    except (ValueError, OverflowError):
+        raise Http404("Invalid date.")
+
+    items = get_shopping_list(request.user, start, end)
+    for item in items:
+        item["quantity"] = format_quantity(item["quantity"])
+
+    return render(request, "recipes/shopping_list.html", {
+        "items": items,
+        "start": start,
+        "end": end,
+    })
+
+
+@login_required
+def meal_plan_recipe_picker(request):
+    """
+    Return a page of recipes that could be added to a meal plan as JSON.
+
+    Pass "date" to leave out recipes already planned for that day, "q" to
+    search and "after" to get the page after a previous response's
+    "next" cursor.
+    """
+    recipes = Recipe.objects.for_user(request.user)
+
+    if request.GET.get("date"):
+        try:
+            date = datetime.date.fromisoformat(request.GET["date"])
+        except ValueError:
+            raise Http404("Invalid date.")
+        recipes = recipes.exclude(
+            pk__in=MealPlan.recipes.through.objects.filter(
+                mealplan__user=request.user,
+                mealplan__date=date).values("recipe_id"))
+
+    search_term = request.GET.get("q", "").strip()
+    if search_term:
+        # Best matches first. Every match has a rank.
+        results = search_recipe_index(recipes.only("pk", "title"),
+                                      search_term)
+        paginator = KeysetPaginator(results,
+                                    "-search_rank",
+                                    per_page=MEAL_PLAN_PICKER_PAGE_SIZE,
+                                    nullable=False)
+    else:
+        paginator = KeysetPaginator(recipes.only("pk", "title"),
+                                    "title",
+                                    per_page=MEAL_PLAN_PICKER_PAGE_SIZE)
+    try:
+        page = paginator.page(request.GET.get("after"))
+    except InvalidCursor:
+        raise Http404("Invalid page.")
+
+    return JsonResponse({
+        "recipes": [{
+            "pk": recipe.pk,
+            "title": recipe.title
+        } for recipe in page],
+        "next": page.next_cursor,
+    })
+
+
+def parse_meal_plan_change(date, recipe_pk, action):
+    """
+    Return a (date, recipe pk, action) change for MealPlan's
+    apply_changes(), raising ValueError if any part of it is invalid.
+    """
+    if action not in ("add", "remove"):
+        raise ValueError("Invalid action.")
+    return datetime.date.fromisoformat(date), parse_pk(recipe_pk), action
+
+
+def parse_meal_plan_changes(body):
+    """
+    Parse the JSON body of a meal_plan_update request into a list of
+    changes, raising ValueError if it is invalid.
+    """
+    try:
+        changes = json.loads(body)
+    except ValueError:
+        raise ValueError("Invalid changes.")
+    if not isinstance(changes, list):
+        raise ValueError("Invalid changes.")
+    if len(changes) > MAX_MEAL_PLAN_CHANGES:
+        raise ValueError("Too many changes.")
+
+    try:
+        return [
+            parse_meal_plan_change(change["date"], change["pk"],
+                                   change["action"]) for change in changes
+        ]
+    except (ValueError, TypeError, KeyError):
+        raise ValueError("Invalid changes.")
+
+
+@login_required
+@csrf_exempt
+@require_POST
+def meal_plan_add_remove_recipe(request):
+    try:
+        change = parse_meal_plan_change(request.POST.get("date", ""),
+                                        request.POST.get("pk", ""),
+                                        request.POST.get("action"))
+    except ValueError:
+        return HttpResponse(status=400)
+
+    MealPlan.objects.apply_changes(request.user, [change])
+    return HttpResponse(status=204)
+
+
+@login_required
+@csrf_exempt
+@require_POST
+def meal_plan_update(request):
+    """
+    Apply a batch of meal plan changes POSTed as a JSON list of
+    {"date": "YYYY-MM-DD", "pk": <recipe pk>, "action": "add" or "remove"}
+    objects, in one transaction. Replaying a batch is safe.
+    """
+    try:
+        changes = parse_meal_plan_changes(request.body)
+    except ValueError as error:
+        return JsonResponse({"error": str(error)}, status=400)
+
+    applied = MealPlan.objects.apply_changes(request.user, changes)
+    return JsonResponse({"applied": applied})
+
+
+@login_required
+def show_random_recipe(request):
+    """
+    Find a random recipe and show it. By default this picks one of the
+    user's own recipes; "?scope=public" picks from all public recipes
+    and "?tag=<name>" limits the pick to recipes with that tag.
+    """
+    if request.GET.get("scope") == "public":
+        recipes = Recipe.objects.public()
+    else:
+        recipes = request.user.recipes.all()
+
+    tag_name = request.GET.get("tag")
+    if tag_name:
+        tag_ids = Tag.objects.resolve_names([tag_name], create=False)
+        recipes = recipes.filter(tags__in=tag_ids.values())
+
+    recipe = recipes.random()
+    if recipe is None:
+        messages.info(request, "There are no recipes to pick from yet.")
+        return redirect(to="recipe_list")
+
+    return redirect(to="recipe_detail", recipe_pk=recipe.pk)
+
+
 @login_required
 def copy_recipe(request, recipe_pk):
     """
     Copy a recipe and assign it to the user. This requires us to copy
     all ingredients and steps from the original recipe as well.
     """
-    original_recipe = get_object_or_404(Recipe, pk=recipe_pk)
-    cloned_recipe = Recipe(
-        title=original_recipe.title + " (Copy)",
-        prep_time_in_minutes=original_recipe.prep_time_in_minutes,
-        cook_time_in_minutes=original_recipe.cook_time_in_minutes,
-        user=request.user,
-        original_recipe=original_recipe,
-    )
-    cloned_recipe.save()
+    original_recipe = get_object_or_404(Recipe.objects.for_user(request.user),
+                                        pk=recipe_pk)
+    cloned_recipe, = Recipe.objects.filter(
+        pk=original_recipe.pk).fork_for(request.user)
 
-    for ingredient in original_recipe.ingredients.all():
-        cloned_recipe.ingredients.create(amount=ingredient.amount,
-                                         item=ingredient.item)
+    return redirect(to="recipe_detail", recipe_pk=cloned_recipe.pk)
 
-    for recipe_step in original_recipe.steps.all():
-        cloned_recipe.steps.create(text=recipe_step.text)
 
-    cloned_recipe.tags.set(original_recipe.tags.all())
+@login_required
+@require_POST
+def copy_recipes(request):
+    """
+    Copy every recipe whose pk is given in the POSTed "pk" values to the
+    user in one go, e.g. to take a copy of a whole tag's worth of recipes.
+    At most MAX_RECIPES_PER_COPY can be copied at a time.
+    """
+    try:
+        recipe_pks = [parse_pk(pk) for pk in request.POST.getlist("pk")]
+    except ValueError:
+        return HttpResponse(status=400)
+    if len(recipe_pks) > MAX_RECIPES_PER_COPY:
+        return HttpResponse(status=400)
 
-    return redirect(to="recipe_detail", recipe_pk=cloned_recipe.pk)
+    recipes = Recipe.objects.for_user(request.user).filter(pk__in=recipe_pks)
+    recipes.fork_for(request.user)
+
+    return redirect(to="recipe_list")
+
+
+@login_required
+def pantry(request):
+    """
+    Show the user's pantry and the recipes it covers best. POST "items",
+    separated by commas or new lines, to add to the pantry, or "remove"
+    with a catalog item's pk to take it out.
+    """
+    if request.method == "POST":
+        if "remove" in request.POST:
+            try:
+                request.user.pantry_items.remove(
+                    parse_pk(request.POST["remove"]))
+            except ValueError:
+                pass
+        else:
+            entered = re.split(r"[,\n]", request.POST.get("items", ""))
+            names = {
+                name: normalize_ingredient(name)
+                for name in map(str.strip, entered) if name
+            }
+            item_ids = CatalogItem.objects.resolve_names(
+                list(dict.fromkeys(filter(None, names.values()))),
+                create=False)
+            request.user.pantry_items.add(*item_ids.values())
+            unknown = [
+                name for name, catalog_name in names.items()
+                if catalog_name not in item_ids
+            ]
+            if unknown:
+                messages.info(
+                    request,
+                    f"No recipes use {', '.join(unknown)}, so "
+                    f"{'it was' if len(unknown) == 1 else 'they were'} "
+                    "left out.")
+        return redirect(to="pantry")
+
+    items = list(request.user.pantry_items.order_by("name"))
+    matches = pantry_index.match(request.user, [item.pk for item in items],
+                                 limit=PANTRY_MATCHES_LIMIT)
+    # The index can be a few minutes behind, so check that each recipe
+    # still exists and is visible.
+    recipes = Recipe.objects.for_user(request.user).select_related(
+        "user").in_bulk([match.recipe_pk for match in matches])
+
+    return render(
+        request, "recipes/pantry.html", {
+            "items": items,
+            "matches": [(recipes[match.recipe_pk], match)
+                        for match in matches if match.recipe_pk in recipes],
+        })
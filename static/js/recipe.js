@@ -1,13 +1,57 @@
 document.addEventListener('DOMContentLoaded', () => {
-  document.querySelector('#show-ingredient-form').addEventListener('click', event => {
+  // The ingredient and step lists may come from the fragment cache, so
+  // decide here whether to show the "add" forms or the links that reveal
+  // them.
+  setUpAddForm('#ingredient-list', '#show-ingredient-form', '#ingredient-form', '#id_amount')
+  setUpAddForm('#step-list', '#show-step-form', '#step-form', '#id_text')
+  setUpStepReordering()
+})
+
+function setUpAddForm (listSelector, linkSelector, formSelector, focusSelector) {
+  const list = document.querySelector(listSelector)
+  const link = document.querySelector(linkSelector)
+  const form = document.querySelector(formSelector)
+  if (!list || !link || !form) {
+    return
+  }
+
+  if (list.querySelector('li')) {
+    link.parentElement.classList.remove('dn')
+    form.classList.add('dn')
+  }
+
+  link.addEventListener('click', event => {
     event.preventDefault()
-    document.querySelector('#ingredient-form').classList.remove('dn')
-    document.querySelector('#id_amount').focus()
+    form.classList.remove('dn')
+    document.querySelector(focusSelector).focus()
   })
+}
 
-  document.querySelector('#show-step-form').addEventListener('click', event => {
-    event.preventDefault()
-    document.querySelector('#step-form').classList.remove('dn')
-    document.querySelector('#id_text').focus()
+// Let the recipe's owner drag its steps into a new order, which is saved
+// in one request. If someone else changed the recipe in the meantime the
+// server refuses it, and the page is reloaded to show their changes.
+function setUpStepReordering () {
+  const list = document.querySelector('#step-list')
+  const reorder = document.querySelector('#reorder-steps')
+  if (!list || !reorder) {
+    return
+  }
+
+  dragula([list]).on('drop', () => {
+    const steps = Array.from(list.querySelectorAll('li'), item => item.dataset.pk)
+    fetch(reorder.dataset.url, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ steps: steps, version: reorder.dataset.version })
+    })
+      .then(res => res.json().then(data => ({ ok: res.ok, data: data })))
+      .then(({ ok, data }) => {
+        if (ok) {
+          reorder.dataset.version = data.version
+        } else {
+          window.alert(data.error)
+          window.location.reload()
+        }
+      })
   })
-})
+}
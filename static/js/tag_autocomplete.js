@@ -0,0 +1,51 @@
+document.addEventListener('DOMContentLoaded', () => {
+  for (const input of document.querySelectorAll('[data-autocomplete-url]')) {
+    setUpTagAutocomplete(input)
+  }
+})
+
+// Suggest completions for the last tag typed into a space-separated tag
+// field, and replace it with a suggestion when one is clicked.
+function setUpTagAutocomplete (input) {
+  const suggestions = document.createElement('ul')
+  suggestions.className = 'list pl0 mt1 flex flex-wrap'
+  input.insertAdjacentElement('afterend', suggestions)
+
+  let timeout = null
+  input.addEventListener('input', () => {
+    clearTimeout(timeout)
+    timeout = setTimeout(suggest, 100)
+  })
+
+  function suggest () {
+    const words = input.value.split(' ')
+    const prefix = words[words.length - 1]
+    if (!prefix) {
+      suggestions.replaceChildren()
+      return
+    }
+
+    const url = input.dataset.autocompleteUrl + '?q=' + encodeURIComponent(prefix)
+    fetch(url)
+      .then(res => res.json())
+      .then(data => {
+        suggestions.replaceChildren(...data.tags.map(tag => {
+          const item = document.createElement('li')
+          const link = document.createElement('a')
+          item.className = 'mr2'
+          link.href = '#'
+          link.textContent = tag
+          link.addEventListener('click', event => {
+            event.preventDefault()
+            const words = input.value.split(' ')
+            words[words.length - 1] = tag
+            input.value = words.join(' ') + ' '
+            suggestions.replaceChildren()
+            input.focus()
+          })
+          item.appendChild(link)
+          return item
+        }))
+      })
+  }
+}